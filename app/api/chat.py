@@ -0,0 +1,76 @@
+from fastapi import APIRouter, Header, Query, WebSocket, WebSocketDisconnect, status
+from typing import Optional
+import json
+import logging
+
+from app.db.session import AsyncSessionLocal
+from app.services.chat_session import ChatSession
+from app.services.conversation_service import get_conversation_async, get_user_by_email_async
+from app.services.llm_scheduler import SchedulerOverloaded
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["Chat"])
+
+
+def _message_frame(msg) -> dict:
+    # the reply is stored after this frame is sent, so it has no id yet
+    return {
+        "type": "done",
+        "message": {
+            "id": msg.id,
+            "role": msg.role,
+            "content": msg.content,
+            "created_at": msg.created_at.isoformat() if msg.created_at else None,
+        },
+    }
+
+
+@router.websocket("/conversations/{conversation_id}/ws")
+async def chat(
+    websocket: WebSocket,
+    conversation_id: int,
+    user_email: Optional[str] = Query(None),
+    x_user_email: Optional[str] = Header(None)
+):
+    """Chat over a WebSocket.
+
+    The user (`X-User-Email` header, or `user_email` query parameter for
+    browsers) and conversation ownership are checked once, at connect.
+    Each `{"content": "..."}` frame is answered with `token` frames and a
+    final `done` frame; messages are stored in the background, so the
+    message in the `done` frame has `"id": null` (ids can be read from the
+    conversation's history once stored).
+    """
+    email = x_user_email or user_email
+    async with AsyncSessionLocal() as db:
+        user = await get_user_by_email_async(db, email) if email else None
+        conversation = await get_conversation_async(db, conversation_id) if user else None
+        if not user or not conversation or conversation.user_id != user.id:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        session = await ChatSession.open(db, conversation)
+
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                content = (json.loads(await websocket.receive_text()).get("content") or "").strip()
+            except (ValueError, AttributeError):
+                content = ""
+            if not content:
+                await websocket.send_json({"type": "error", "status": 400, "detail": "Expected {\"content\": \"...\"}"})
+                continue
+
+            try:
+                async for event, payload in session.turn(content):
+                    if event == "token":
+                        await websocket.send_json({"type": "token", "content": payload})
+                    else:
+                        await websocket.send_json(_message_frame(payload))
+            except SchedulerOverloaded as exc:
+                await websocket.send_json({"type": "error", "status": 429, "detail": str(exc)})
+    except WebSocketDisconnect:
+        logger.info("Chat session for conversation %s closed", conversation_id)
+    finally:
+        await session.close()
@@ -1,53 +1,62 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
-from app.db.session import SessionLocal
+from app.api.deps import get_async_db, get_async_read_db
 from app.schemas.conversation import ConversationCreate, ConversationResponse
 from app.services.conversation_service import (
-    create_conversation,
-    list_conversations,
-    get_conversation,
-    delete_conversation
+    create_conversation_async,
+    list_conversations_async,
+    get_conversation_async,
+    delete_conversation_async
 )
 
 router = APIRouter(prefix="/conversations", tags=["Conversations"])
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.post("", response_model=ConversationResponse)
-def create(data: ConversationCreate, db: Session = Depends(get_db)):
-    return create_conversation(db, data.user_email, data.mode, data.title)
+async def create(data: ConversationCreate, db: AsyncSession = Depends(get_async_db)):
+    return await create_conversation_async(db, data.user_email, data.mode, data.title)
 
 
 @router.get("", response_model=List[ConversationResponse])
-def list_all(
+async def list_all(
+    response: Response,
     user_email: str,
-    limit: int = Query(20, le=100),
-    offset: int = 0,
-    db: Session = Depends(get_db)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    offset: int = Query(0, ge=0, deprecated=True),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    return list_conversations(db, user_email, limit, offset)
+    """List a user's conversations, newest first.
+
+    When more results exist the `X-Next-Cursor` header holds the cursor for
+    the next page. `offset` is deprecated in favour of `cursor` and cannot
+    be combined with it.
+    """
+    if offset and cursor:
+        raise HTTPException(status_code=400, detail="Pass either cursor or offset, not both")
+    try:
+        rows, next_cursor = await list_conversations_async(db, user_email, limit, cursor, offset)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
 
 
 @router.get("/{conversation_id}", response_model=ConversationResponse)
-def get_one(conversation_id: int, db: Session = Depends(get_db)):
-    convo = get_conversation(db, conversation_id)
+async def get_one(conversation_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    convo = await get_conversation_async(db, conversation_id)
     if not convo:
         raise HTTPException(status_code=404, detail="Conversation not found")
     return convo
 
 
 @router.delete("/{conversation_id}")
-def delete_one(conversation_id: int, db: Session = Depends(get_db)):
-    convo = delete_conversation(db, conversation_id)
+async def delete_one(conversation_id: int, db: AsyncSession = Depends(get_async_db)):
+    convo = await delete_conversation_async(db, conversation_id)
     if not convo:
         raise HTTPException(status_code=404, detail="Conversation not found")
     return {"status": "deleted"}
@@ -1,9 +1,9 @@
-from fastapi import Depends, Header, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import Depends, Header, HTTPException, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 
-from app.db.session import SessionLocal
-from app.models.user import User
+from app.db.session import SessionLocal, AsyncSessionLocal, AsyncReadSessionLocal
+from app.services.conversation_service import get_conversation_async, get_user_by_email_async
 
 
 def get_db():
@@ -14,16 +14,49 @@ def get_db():
         db.close()
 
 
-def get_current_user(x_user_email: Optional[str] = Header(None), db: Session = Depends(get_db)) -> User:
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db():
+    """Session on the read-only pool, for endpoints that never write."""
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+async def get_current_user(x_user_email: Optional[str] = Header(None), db: AsyncSession = Depends(get_async_db)):
     """Simple auth dependency that expects `X-User-Email` header.
 
-    Returns the User model if it exists; raises 401 otherwise.
+    Returns a cached user snapshot (`id`, `email`) if the user exists;
+    raises 401 otherwise.
     """
     if not x_user_email:
         raise HTTPException(status_code=401, detail="Missing X-User-Email header")
 
-    user = db.query(User).filter(User.email == x_user_email).first()
+    user = await get_user_by_email_async(db, x_user_email)
     if not user:
         raise HTTPException(status_code=401, detail="Unknown user")
 
     return user
+
+
+async def get_owned_conversation(db: AsyncSession, conversation_id: int, current_user):
+    """Return the conversation snapshot, or raise 404/403."""
+    conversation = await get_conversation_async(db, conversation_id)
+
+    if not conversation:
+        raise HTTPException(404, "Conversation not found")
+
+    if conversation.user_id != current_user.id:
+        raise HTTPException(403, "Forbidden")
+
+    return conversation
+
+
+def validate_pdf_upload(conversation, file: UploadFile) -> None:
+    if conversation.mode != "rag":
+        raise HTTPException(400, "PDF upload allowed only in RAG mode")
+
+    if not file.filename.endswith(".pdf"):
+        raise HTTPException(400, "Only PDF files supported")
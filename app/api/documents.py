@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_async_db, get_current_user, get_owned_conversation, validate_pdf_upload
+from app.schemas.document import IngestionJobResponse
+from app.services import ingestion_service
+from app.services.pdf_service import PDFLimitError
+
+router = APIRouter(
+    prefix="/conversations/{conversation_id}/documents",
+    tags=["Documents"]
+)
+
+
+@router.post("", response_model=IngestionJobResponse, status_code=202)
+async def upload_document(
+    conversation_id: int,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    """Queue a PDF for background ingestion and return its job.
+
+    The document is used for retrieval once the job reports `ready`. A file
+    that was already ingested (same content hash) is linked immediately.
+    """
+    conversation = await get_owned_conversation(db, conversation_id, current_user)
+    validate_pdf_upload(conversation, file)
+
+    try:
+        job, path = await ingestion_service.create_job(db, conversation.id, file)
+    except PDFLimitError as exc:
+        raise HTTPException(413, str(exc))
+    if path is not None:
+        ingestion_service.schedule_job(job.id, path)
+    return job
+
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobResponse)
+async def get_job_status(
+    conversation_id: int,
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    """Report the status and progress of an ingestion job."""
+    await get_owned_conversation(db, conversation_id, current_user)
+
+    job = await ingestion_service.get_job(db, job_id)
+    if not job or job.conversation_id != conversation_id:
+        raise HTTPException(404, "Job not found")
+
+    return job
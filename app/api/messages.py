@@ -1,14 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+import json
 import logging
 
-from app.api.deps import get_db, get_current_user
-from app.models.conversation import Conversation
-from app.models.document import Document
-from app.models.conversation_document import ConversationDocument
+from app.api.deps import get_async_db, get_current_user, get_owned_conversation, validate_pdf_upload
+from app.db.session import AsyncSessionLocal
 from app.schemas.message import MessageResponse
-from app.services.message_service import process_user_message
-from app.services.pdf_service import extract_text_from_pdf
+from app.services import ingestion_service
+from app.services.llm_scheduler import SchedulerOverloaded, llm_scheduler
+from app.services.pdf_service import PDFLimitError
+from app.services.message_service import process_user_message, process_user_message_stream
 
 logger = logging.getLogger(__name__)
 
@@ -18,59 +20,111 @@ router = APIRouter(
 )
 
 
+async def _store_pdf(db: AsyncSession, conversation, file: UploadFile) -> None:
+    """Ingest a PDF attached to a message before answering it (RAG only).
+
+    Parsing and indexing run in the ingestion process pool; the handler
+    only awaits the result, so other requests keep being served.
+    """
+    validate_pdf_upload(conversation, file)
+
+    try:
+        job, path = await ingestion_service.create_job(db, conversation.id, file)
+    except PDFLimitError as exc:
+        raise HTTPException(413, str(exc))
+    if path is None:
+        return  # already ingested; create_job linked it
+
+    document_id = await ingestion_service.run_job(job.id, path)
+
+    if document_id is None:
+        job = await ingestion_service.get_job(db, job.id)
+        raise HTTPException(400, job.error or "Could not ingest PDF")
+
+
+def _overloaded(exc: SchedulerOverloaded) -> HTTPException:
+    return HTTPException(429, str(exc), headers={"Retry-After": str(exc.retry_after)})
+
+
+def _admit(user_id: int) -> None:
+    """Shed the turn before doing any work if the LLM queue is already full."""
+    try:
+        llm_scheduler.check(user_id)
+    except SchedulerOverloaded as exc:
+        raise _overloaded(exc)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @router.post("", response_model=MessageResponse)
 async def add_message(
     conversation_id: int,
     content: str = Form(...),
     file: UploadFile | None = File(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """Accept a user message (and optional PDF). Ensures the authenticated
     user owns the conversation. This endpoint delegates core work to
     `process_user_message` which is async to allow non-blocking LLM calls.
     """
-    conversation = (
-        db.query(Conversation)
-        .filter(Conversation.id == conversation_id)
-        .first()
-    )
-
-    if not conversation:
-        raise HTTPException(404, "Conversation not found")
-
-    if conversation.user_id != current_user.id:
-        raise HTTPException(403, "Forbidden")
+    conversation = await get_owned_conversation(db, conversation_id, current_user)
+    _admit(current_user.id)
 
     # Handle PDF upload inline (RAG only)
     if file:
-        if conversation.mode != "rag":
-            raise HTTPException(400, "PDF upload allowed only in RAG mode")
+        await _store_pdf(db, conversation, file)
 
-        if not file.filename.endswith(".pdf"):
-            raise HTTPException(400, "Only PDF files supported")
+    try:
+        assistant_msg = await process_user_message(db, conversation_id, content)
+    except SchedulerOverloaded as exc:
+        raise _overloaded(exc)
 
-        text = extract_text_from_pdf(file.file)
+    return assistant_msg
 
-        if not text:
-            raise HTTPException(400, "Could not extract text from PDF")
 
-        document = Document(
-            filename=file.filename,
-            content=text
-        )
-        db.add(document)
-        db.commit()
-        db.refresh(document)
+@router.post("/stream")
+async def add_message_stream(
+    conversation_id: int,
+    content: str = Form(...),
+    file: UploadFile | None = File(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    """Same as `add_message` but streams the reply as Server-Sent Events.
+
+    Emits one `token` event per chunk and a final `done` event carrying the
+    persisted assistant message.
+    """
+    conversation = await get_owned_conversation(db, conversation_id, current_user)
+    _admit(current_user.id)
 
-        link = ConversationDocument(
-            conversation_id=conversation_id,
-            document_id=document.id
-        )
-        db.add(link)
-        db.commit()
-        logger.info("Stored PDF %s for conversation %s", document.filename, conversation_id)
+    if file:
+        await _store_pdf(db, conversation, file)
 
-    assistant_msg = await process_user_message(db, conversation_id, content)
+    async def event_stream():
+        # The request-scoped session may be closed before the body is sent,
+        # so the stream owns its own session.
+        async with AsyncSessionLocal() as stream_db:
+            try:
+                async for event, payload in process_user_message_stream(stream_db, conversation_id, content):
+                    if event == "token":
+                        yield _sse("token", {"content": payload})
+                    else:
+                        yield _sse("done", {
+                            "id": payload.id,
+                            "role": payload.role,
+                            "content": payload.content,
+                            "created_at": payload.created_at.isoformat() if payload.created_at else None,
+                        })
+            except SchedulerOverloaded as exc:
+                # admitted, but the queue filled up before a slot was free
+                yield _sse("error", {"status": 429, "detail": str(exc)})
 
-    return assistant_msg
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
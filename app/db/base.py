@@ -1,10 +1,22 @@
+from datetime import datetime, timezone
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
 
+
+def utcnow() -> datetime:
+    """Client-side timestamp default (microsecond precision, no refresh needed)."""
+    return datetime.now(timezone.utc)
+
+
 # Import models so SQLAlchemy knows them
 from app.models.user import User
 from app.models.conversation import Conversation
 from app.models.message import Message
 from app.models.document import Document
-from app.models.conversation_document import ConversationDocument
\ No newline at end of file
+from app.models.conversation_document import ConversationDocument
+from app.models.document_chunk import DocumentChunk
+from app.models.chunk_posting import ChunkPosting
+from app.models.document_embedding import DocumentEmbedding
+from app.models.document_blob import DocumentBlob
+from app.models.ingestion_job import IngestionJob
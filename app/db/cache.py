@@ -1,55 +1,346 @@
-"""Simple in-memory cache with TTL for conversations.
+"""Two-tier cache for plain, JSON-serializable DTOs.
 
-This cache stores arbitrary Python objects (e.g. ORM instances) in a
-process-local dictionary together with an expiry timestamp. TTL defaults to
-300 seconds but can be overridden by the `CACHE_TTL` environment variable
-(value in seconds).
+Tier 1 is a process-local LRU with TTL and a bounded number of entries.
+Tier 2 is an optional shared store so several uvicorn workers share hits:
+a SQLite file (`CACHE_BACKEND=sqlite`) or Redis (`CACHE_BACKEND=redis`,
+needs the `redis` package from `requirements-optional.txt`). Values are
+stored as JSON text, never as ORM instances, so a hit can't hand out
+objects bound to a closed session.
+
+Configuration (environment):
+- `CACHE_TTL` entry lifetime in seconds (default 300, 0 = no expiry)
+- `CACHE_MAX_ENTRIES` local tier capacity (default 10000)
+- `CACHE_LOCAL_TTL` local tier lifetime when a shared tier is used
+  (default 5s, bounds staleness after another worker invalidates a key)
+- `CACHE_BACKEND` memory | sqlite | redis (default memory)
+- `CACHE_SQLITE_PATH`, `CACHE_REDIS_URL`
 
 API:
-- `get_conversation(conversation_id)` -> object | None
-- `set_conversation(conversation_id, obj)` -> None
+- `get_conversation(conversation_id)` -> dict | None
+- `set_conversation(conversation_id, dto)` -> None
 - `invalidate_conversation(conversation_id)` -> None
+- `get_window` / `set_window` / `invalidate_window` for a conversation's
+  recent-message window (`{"messages": [...], "count": int}`)
+- `get_user` / `set_user` for email -> user resolution
+- `cache_get(key)`, `cache_set(key, value, ttl=None)`, `cache_delete(key)`
+  for other DTOs
+- `stats()` -> hit/miss/eviction counters
 """
-from typing import Any, Optional, Dict, Tuple
-import time
-import threading
+from collections import OrderedDict
+from typing import Any, Optional
+import json
+import logging
 import os
+import sqlite3
+import threading
+import time
 
-_LOCK = threading.Lock()
-# store mapping: id -> (value, expiry_timestamp)
-_CONVERSATION_CACHE: Dict[int, Tuple[Any, float]] = {}
+logger = logging.getLogger(__name__)
 
 
-def _default_ttl() -> int:
+def _env_int(name: str, default: int) -> int:
     try:
-        return int(os.getenv("CACHE_TTL", "300"))
+        return int(os.getenv(name, str(default)))
     except Exception:
-        return 300
+        return default
+
+
+def _default_ttl() -> int:
+    return _env_int("CACHE_TTL", 300)
+
+
+class LRUTTLCache:
+    """Bounded in-process LRU whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (value, expiry_timestamp | None)
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expiry = entry
+            if expiry is not None and now >= expiry:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: float = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expiry = time.time() + ttl if ttl > 0 else None
+        with self._lock:
+            self._data[key] = (value, expiry)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
 
+class SQLiteStore:
+    """Shared tier backed by a SQLite file that all workers on a host open."""
 
-def get_conversation(conversation_id: int) -> Optional[Any]:
-    """Return cached object or None if missing/expired."""
-    now = time.time()
-    with _LOCK:
-        entry = _CONVERSATION_CACHE.get(conversation_id)
-        if not entry:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
             return None
-        value, expiry = entry
-        if expiry is not None and now >= expiry:
-            # expired
-            _CONVERSATION_CACHE.pop(conversation_id, None)
+        value, expires_at = row
+        if expires_at is not None and time.time() >= expires_at:
+            self.delete(key)
             return None
         return value
 
+    def set(self, key: str, value: str, ttl: float) -> None:
+        expires_at = time.time() + ttl if ttl > 0 else None
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, expires_at)
+        )
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM cache_entries")
+
+
+class RedisStore:
+    """Shared tier backed by Redis (or any server speaking its protocol)."""
+
+    def __init__(self, url: str, prefix: str = "botgpt:"):
+        import redis  # optional dependency
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._client.get(self.prefix + key)
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        if ttl > 0:
+            self._client.set(self.prefix + key, value, ex=int(ttl))
+        else:
+            self._client.set(self.prefix + key, value)
+
+    def delete(self, key: str) -> None:
+        self._client.delete(self.prefix + key)
+
+    def clear(self) -> None:
+        for key in self._client.scan_iter(f"{self.prefix}*"):
+            self._client.delete(key)
+
+
+class Cache:
+    """Local LRU+TTL tier in front of an optional shared store."""
+
+    def __init__(self, local: LRUTTLCache, shared=None, ttl: float = 300):
+        self.local = local
+        self.shared = shared
+        self.ttl = ttl
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self.shared_errors = 0
+
+    def _local_ttl(self, ttl: float) -> float:
+        # the local copy never outlives the entry, nor the local tier's cap
+        if ttl <= 0:
+            return self.local.ttl
+        if self.local.ttl <= 0:
+            return ttl
+        return min(ttl, self.local.ttl)
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.local.get(key)
+        if raw is None and self.shared is not None:
+            try:
+                raw = self.shared.get(key)
+            except Exception:
+                self.shared_errors += 1
+                logger.exception("Shared cache read failed for %s", key)
+                raw = None
+            if raw is None:
+                self.shared_misses += 1
+            else:
+                self.shared_hits += 1
+                self.local.set(key, raw)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: float = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        raw = json.dumps(value, default=str)
+        self.local.set(key, raw, ttl=self._local_ttl(ttl))
+        if self.shared is not None:
+            try:
+                self.shared.set(key, raw, ttl)
+            except Exception:
+                self.shared_errors += 1
+                logger.exception("Shared cache write failed for %s", key)
+
+    def delete(self, key: str) -> None:
+        self.local.delete(key)
+        if self.shared is not None:
+            try:
+                self.shared.delete(key)
+            except Exception:
+                self.shared_errors += 1
+                logger.exception("Shared cache delete failed for %s", key)
 
-def set_conversation(conversation_id: int, obj: Any) -> None:
-    """Store object with TTL (default 300s)."""
+    def clear(self) -> None:
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self) -> dict:
+        stats = {"backend": type(self.shared).__name__ if self.shared else "memory"}
+        stats["local"] = self.local.stats()
+        if self.shared is not None:
+            stats["shared"] = {
+                "hits": self.shared_hits,
+                "misses": self.shared_misses,
+                "errors": self.shared_errors,
+            }
+        return stats
+
+
+def _build_cache() -> Cache:
     ttl = _default_ttl()
-    expiry = time.time() + ttl if ttl > 0 else None
-    with _LOCK:
-        _CONVERSATION_CACHE[conversation_id] = (obj, expiry)
+    backend = os.getenv("CACHE_BACKEND", "memory")
+    shared = None
+    try:
+        if backend == "sqlite":
+            shared = SQLiteStore(os.getenv("CACHE_SQLITE_PATH", "./bot_gpt_cache.db"))
+        elif backend == "redis":
+            shared = RedisStore(os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"))
+    except Exception:
+        logger.exception("Could not initialise %s cache backend; using memory only", backend)
+        shared = None
+
+    local_ttl = ttl
+    if shared is not None:
+        # other workers may invalidate a key; keep local copies short-lived
+        cap = _env_int("CACHE_LOCAL_TTL", 5)
+        local_ttl = min(ttl, cap) if ttl > 0 else cap
+
+    local = LRUTTLCache(max_entries=_env_int("CACHE_MAX_ENTRIES", 10000), ttl=local_ttl)
+    return Cache(local, shared, ttl=ttl)
+
+
+_CACHE = _build_cache()
+
+
+def cache_get(key: str) -> Optional[Any]:
+    return _CACHE.get(key)
+
+
+def cache_set(key: str, value: Any, ttl: float = None) -> None:
+    _CACHE.set(key, value, ttl)
+
+
+def cache_delete(key: str) -> None:
+    _CACHE.delete(key)
+
+
+def stats() -> dict:
+    return _CACHE.stats()
+
+
+def _conversation_key(conversation_id: int) -> str:
+    return f"conversation:{conversation_id}"
+
+
+def get_conversation(conversation_id: int) -> Optional[dict]:
+    """Return the cached conversation DTO or None if missing/expired."""
+    return _CACHE.get(_conversation_key(conversation_id))
+
+
+def set_conversation(conversation_id: int, dto: dict) -> None:
+    """Store a conversation DTO with the default TTL."""
+    _CACHE.set(_conversation_key(conversation_id), dto)
 
 
 def invalidate_conversation(conversation_id: int) -> None:
-    with _LOCK:
-        _CONVERSATION_CACHE.pop(conversation_id, None)
+    _CACHE.delete(_conversation_key(conversation_id))
+
+
+def _window_key(conversation_id: int) -> str:
+    return f"conversation:{conversation_id}:window"
+
+
+def get_window(conversation_id: int) -> Optional[dict]:
+    return _CACHE.get(_window_key(conversation_id))
+
+
+def set_window(conversation_id: int, window: dict) -> None:
+    _CACHE.set(_window_key(conversation_id), window)
+
+
+def invalidate_window(conversation_id: int) -> None:
+    _CACHE.delete(_window_key(conversation_id))
+
+
+def _user_key(email: str) -> str:
+    return f"user:{email}"
+
+
+def get_user(email: str) -> Optional[dict]:
+    return _CACHE.get(_user_key(email))
+
+
+def set_user(email: str, dto: dict) -> None:
+    _CACHE.set(_user_key(email), dto)
@@ -1,11 +1,97 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+"""Engines and session factories.
+
+`DATABASE_URL` selects the database (SQLite file by default, Postgres via
+`postgresql://...`). With the `production` profile (`DB_PROFILE`, the
+default) file-based SQLite connections are set up for concurrent use:
+
+- every connection gets WAL journaling, `synchronous=NORMAL`, a memory map
+  and a busy timeout, so readers no longer block behind the writer
+- async sessions read through a pool of read-only (`query_only`)
+  connections and write through a single writer connection; a session
+  switches to the writer at its first write and stays there until the
+  transaction ends, so it always reads its own writes
+
+Postgres keeps normal pooling; set `DATABASE_READ_URL` to send reads to a
+replica. `DB_PROFILE=default` turns all of this off.
+"""
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./bot_gpt.db")
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+DB_PROFILE = os.getenv("DB_PROFILE", "production").lower()
+
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Async drivers used for the request path when ASYNC_DATABASE_URL is not set
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+
+def _to_async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _to_async_url(DATABASE_URL)
+
+_IS_SQLITE = DATABASE_URL.startswith("sqlite")
+_IS_MEMORY = _IS_SQLITE and (DATABASE_URL in ("sqlite://", "sqlite:///:memory:"))
+_TUNED_SQLITE = _IS_SQLITE and not _IS_MEMORY and DB_PROFILE == "production"
+
+
+def _pool_options(**overrides) -> dict:
+    """Pool sizing for an async engine (ignored for in-memory SQLite)."""
+    if _IS_MEMORY:
+        return {}
+    options = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": not _IS_SQLITE,
+    }
+    options.update(overrides)
+    return options
+
+
+def sqlite_pragmas(read_only: bool = False) -> list:
+    """PRAGMA statements run on every new connection of the tuned profile."""
+    pragmas = [
+        "PRAGMA journal_mode=WAL",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    return pragmas
+
+
+def _install_pragmas(sync_engine, read_only: bool = False) -> None:
+    pragmas = sqlite_pragmas(read_only)
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
 
-DATABASE_URL = "sqlite:///./bot_gpt.db"
 
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False}  # needed for SQLite
+    connect_args={"check_same_thread": False} if _IS_SQLITE else {}  # needed for SQLite
 )
 
 SessionLocal = sessionmaker(
@@ -13,3 +99,56 @@ SessionLocal = sessionmaker(
     autoflush=False,
     bind=engine
 )
+
+if _TUNED_SQLITE:
+    _install_pragmas(engine)
+    # SQLite allows one writer at a time: queue for the connection in the
+    # pool instead of spinning on the database lock
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        **_pool_options(pool_size=int(os.getenv("DB_WRITER_POOL_SIZE", "1")), max_overflow=0)
+    )
+    async_read_engine = create_async_engine(ASYNC_DATABASE_URL, **_pool_options())
+    _install_pragmas(async_engine.sync_engine)
+    _install_pragmas(async_read_engine.sync_engine, read_only=True)
+else:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **_pool_options())
+    async_read_engine = (
+        create_async_engine(_to_async_url(DATABASE_READ_URL), **_pool_options())
+        if DATABASE_READ_URL else async_engine
+    )
+
+
+class RoutingSession(Session):
+    """Sends plain SELECTs to the read engine until the transaction writes."""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if async_read_engine is async_engine:
+            return async_engine.sync_engine
+        if not self.info.get("writing"):
+            is_read = getattr(clause, "is_select", False) and getattr(clause, "_for_update_arg", None) is None
+            if is_read and not self._flushing:
+                return async_read_engine.sync_engine
+            self.info["writing"] = True
+        return async_engine.sync_engine
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _end_write(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("writing", None)
+
+
+# expire_on_commit=False: async sessions cannot lazily reload attributes
+AsyncSessionLocal = async_sessionmaker(
+    sync_session_class=RoutingSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+# sessions that never write (listing, polling) can skip routing altogether
+AsyncReadSessionLocal = async_sessionmaker(
+    bind=async_read_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
@@ -0,0 +1,113 @@
+"""In-place upgrade of databases created by older versions.
+
+`Base.metadata.create_all` only creates missing tables. `upgrade_schema`
+runs after it at startup and brings existing tables up to date; every step
+checks the live schema first, so it is a no-op on a current database.
+
+- columns added to existing tables since they were created (summary and
+  BM25 statistics of documents, conversation counters, ...) are added with
+  `ALTER TABLE ... ADD COLUMN`, together with missing indexes;
+  `conversations.message_count` is backfilled from `messages`
+- `conversations.created_at` values written by the old `CURRENT_TIMESTAMP`
+  server default (`YYYY-MM-DD HH:MM:SS`, SQLite only) get the fractional
+  seconds new rows are stored with, so they compare exactly with keyset
+  cursors
+- document bodies still stored in `documents.content` are compressed into
+  `document_blobs` and the column is dropped (it was NOT NULL, so new
+  inserts would fail while it exists); the documents are then indexed on
+  their first retrieval like any other unindexed document
+"""
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.db.base import Base
+from app.models.document_blob import DocumentBlob
+from app.services.blob_service import save_text
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(bind, table: str) -> set:
+    inspector = inspect(bind)
+    if not inspector.has_table(table):
+        return set()
+    return {column["name"] for column in inspector.get_columns(table)}
+
+
+def _add_missing_columns(engine: Engine) -> list:
+    """Add model columns and indexes missing from existing tables."""
+    ddl = engine.dialect.ddl_compiler(engine.dialect, None)
+    added = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = _columns(conn, table.name)
+            if not existing:
+                continue  # created complete by create_all
+            name = ddl.preparer.format_table(table)
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                # SQLite cannot add a UNIQUE column; a unique index does the same
+                conn.execute(text(f"ALTER TABLE {name} ADD COLUMN {ddl.get_column_specification(column)}"))
+                if column.unique:
+                    conn.execute(text(
+                        f"CREATE UNIQUE INDEX uq_{table.name}_{column.name} ON {name} ({column.name})"
+                    ))
+                added.append(f"{table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+        if "conversations.message_count" in added:
+            conn.execute(text(
+                "UPDATE conversations SET message_count ="
+                " (SELECT COUNT(*) FROM messages WHERE messages.conversation_id = conversations.id)"
+            ))
+    if added:
+        logger.info("Added columns %s", ", ".join(added))
+    return added
+
+
+def _normalize_created_at(engine: Engine) -> None:
+    """Give legacy second-precision `created_at` values SQLAlchemy's format.
+
+    SQLite compares the stored strings, so `'2024-01-01 10:00:00'` sorts
+    before the `'2024-01-01 10:00:00.000000'` of a cursor pointing at the
+    same row and the `(created_at, id)` keyset never moves past it.
+    """
+    if engine.dialect.name != "sqlite" or "created_at" not in _columns(engine, "conversations"):
+        return
+    with engine.begin() as conn:
+        updated = conn.execute(text(
+            "UPDATE conversations SET created_at = created_at || '.000000'"
+            " WHERE length(created_at) = 19"
+        )).rowcount
+    if updated:
+        logger.info("Normalized created_at of %d conversations", updated)
+
+
+def _move_document_content(engine: Engine) -> None:
+    if "content" not in _columns(engine, "documents"):
+        return
+
+    with Session(engine) as db:
+        rows = db.execute(text(
+            "SELECT id, content FROM documents WHERE content IS NOT NULL"
+            " AND id NOT IN (SELECT document_id FROM document_blobs)"
+        )).all()
+        for document_id, content in rows:
+            save_text(db, document_id, content)
+        db.commit()
+
+    # SQLite supports DROP COLUMN from 3.35
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE documents DROP COLUMN content"))
+    logger.info("Moved %d document bodies into %s", len(rows), DocumentBlob.__tablename__)
+
+
+def upgrade_schema(engine: Engine) -> None:
+    _add_missing_columns(engine)
+    _normalize_created_at(engine)
+    _move_document_content(engine)
@@ -1,26 +1,56 @@
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 
+from app.db import cache
 from app.db.session import SessionLocal
 from app.db.base import Base
-from app.db.session import engine
+from app.db.session import async_engine, async_read_engine, engine
+from app.db.upgrade import upgrade_schema
 
-from app.api import conversations, messages
+from app.api import chat, conversations, documents, messages
+from app.services import ingestion_service, llm_service, metrics
+from app.services.group_commit import group_writer
+from app.services.llm_scheduler import PRIORITIES, llm_scheduler
+from app.services.model_router import model_router
+from app.services.task_queue import background_queue
 
 
 # Create tables (models will be added later)
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # let queued background work (summaries, ingestion) finish before shutting down
+    await ingestion_service.ingestion_queue.join()
+    await ingestion_service.ingestion_queue.stop()
+    ingestion_service.shutdown()
+    await background_queue.join()
+    await background_queue.stop()
+    await group_writer.stop()
+    await llm_service.aclose()
+    await async_engine.dispose()
+    await async_read_engine.dispose()
 
 
 app = FastAPI(
     title="BOT GPT Backend",
     description="Conversational AI backend for BOT Consulting",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
+app.add_middleware(metrics.TimingMiddleware)
+
 app.include_router(conversations.router)
 app.include_router(messages.router)
+app.include_router(documents.router)
+app.include_router(chat.router)
 
 # Configure simple logging for the application
 logging.basicConfig(
@@ -43,3 +73,62 @@ def health_check(db: Session = Depends(get_db)):
         "status": "ok",
         "database": "connected"
     }
+
+
+@app.get("/cache/stats", tags=["Health"])
+def cache_stats():
+    """Hit/miss/eviction counters of the conversation and LLM response caches."""
+    stats = cache.stats()
+    stats["llm"] = llm_service.cache_stats()
+    return stats
+
+
+def _cache_counters() -> dict:
+    local = cache.stats()["local"]
+    llm = llm_service.cache_stats()
+    return {
+        ("conversation", "hit"): local["hits"],
+        ("conversation", "miss"): local["misses"],
+        ("llm", "hit"): llm["hits"],
+        ("llm", "miss"): llm["misses"],
+        ("llm", "coalesced"): llm["coalesced"],
+    }
+
+
+metrics.register(metrics.Gauge(
+    "botgpt_cache_lookups", "Cache lookups since start by cache and outcome",
+    _cache_counters, ("cache", "result")
+))
+metrics.register(metrics.Gauge(
+    "botgpt_queue_depth", "Jobs waiting in background queues",
+    lambda: {
+        ("background",): background_queue.depth(),
+        ("ingestion",): ingestion_service.ingestion_queue.depth(),
+    },
+    ("queue",)
+))
+metrics.register(metrics.Gauge(
+    "botgpt_llm_queue_depth", "LLM calls waiting for a scheduler slot",
+    lambda: {(priority,): llm_scheduler.depth(priority) for priority in PRIORITIES},
+    ("priority",)
+))
+metrics.register(metrics.Gauge(
+    "botgpt_llm_active", "LLM calls holding a scheduler slot",
+    lambda: {(): llm_scheduler.active}
+))
+metrics.register(metrics.Gauge(
+    "botgpt_llm_tier_p95_seconds", "Rolling p95 latency per model tier",
+    lambda: {(name,): stats["p95"] for name, stats in model_router.stats().items()},
+    ("tier",)
+))
+metrics.register(metrics.Gauge(
+    "botgpt_llm_tier_error_rate", "Rolling error rate per model tier",
+    lambda: {(name,): stats["error_rate"] for name, stats in model_router.stats().items()},
+    ("tier",)
+))
+
+
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus text-format metrics: request and phase latency, tokens, caches, queues."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
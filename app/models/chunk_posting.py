@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
+from app.db.base import Base
+
+
+class ChunkPosting(Base):
+    """Inverted index entry: `term` occurs `tf` times in `chunk_id`."""
+    __tablename__ = "chunk_postings"
+
+    term = Column(String, primary_key=True)
+    chunk_id = Column(
+        Integer, ForeignKey("document_chunks.id", ondelete="CASCADE"), primary_key=True
+    )
+    # denormalised so postings can be filtered by conversation documents
+    document_id = Column(
+        Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False
+    )
+    tf = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_chunk_postings_term_document", "term", "document_id"),
+    )
@@ -1,13 +1,17 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from sqlalchemy import Text
 
-from app.db.base import Base
+from app.db.base import Base, utcnow
 
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        # keyset pagination of a user's conversations, newest first
+        Index("ix_conversations_user_created", "user_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -17,8 +21,13 @@ class Conversation(Base):
 
     title = Column(String, nullable=True)
     summary = Column(Text, nullable=True) # compressed summary of the conversation which is old than about window len size
+    # id of the newest message already folded into `summary`
+    summarized_until_id = Column(Integer, nullable=True)
+    # maintained on every message insert so history size never needs a COUNT
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # set client-side with microseconds so (created_at, id) cursors compare exactly
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
 
     messages = relationship(
         "Message",
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Text, DateTime, String
+from sqlalchemy import Column, Integer, DateTime, String, Text
 from sqlalchemy.sql import func
 from app.db.base import Base
 
@@ -8,5 +8,18 @@ class Document(Base):
 
     id = Column(Integer, primary_key=True)
     filename = Column(String, nullable=False)
-    content = Column(Text, nullable=False)
+    # the body is stored compressed in `document_blobs` (see blob_service)
+    # sha256 of the uploaded bytes; identical uploads share one document
+    content_hash = Column(String(64), nullable=True, unique=True)
+
+    # corpus statistics for BM25, filled when the document is indexed
+    chunk_count = Column(Integer, nullable=True)
+    total_length = Column(Integer, nullable=True)
+
+    # indexing | ready | failed; retrieval only reads ready documents
+    status = Column(String, nullable=False, default="ready", server_default="ready")
+
+    # map-reduce summary of the whole document, built on first request
+    summary = Column(Text, nullable=True)
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey
+from app.db.base import Base
+
+
+class DocumentBlob(Base):
+    """Compressed full text of one document, kept off the `documents` row.
+
+    Only read when the whole body is needed (e.g. re-indexing); retrieval
+    works from `document_chunks`.
+    """
+    __tablename__ = "document_blobs"
+
+    document_id = Column(
+        Integer, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True
+    )
+    codec = Column(String, nullable=False)  # zstd | zlib
+    size = Column(Integer, nullable=False)  # uncompressed bytes
+    data = Column(LargeBinary, nullable=False)
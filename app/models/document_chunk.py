@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, Text, ForeignKey
+from app.db.base import Base
+
+
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+
+    id = Column(Integer, primary_key=True)
+    document_id = Column(
+        Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+
+    # order of the chunk inside the document
+    position = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+
+    # number of indexed terms, used for BM25 length normalisation
+    length = Column(Integer, nullable=False, default=0)
+
+    # map step output of the document summary (document_summary_service)
+    summary = Column(Text, nullable=True)
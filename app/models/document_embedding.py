@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey
+from app.db.base import Base
+
+
+class DocumentEmbedding(Base):
+    """Chunk embeddings of one document as a contiguous float32 matrix.
+
+    Row `i` of the matrix is the embedding of the chunk at position `i`.
+    """
+    __tablename__ = "document_embeddings"
+
+    document_id = Column(
+        Integer, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True
+    )
+    embedder = Column(String, nullable=False)
+    dim = Column(Integer, nullable=False)
+    rows = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
@@ -1,8 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
-from app.db.base import Base
+from app.db.base import Base, utcnow
 
 
 class Message(Base):
@@ -18,6 +18,12 @@ class Message(Base):
 
     token_count = Column(Integer, nullable=True)
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # set client-side so inserts need no refresh to read it back
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
 
     conversation = relationship("Conversation", back_populates="messages")
+
+    __table_args__ = (
+        # serves the per-turn window query (newest N of one conversation)
+        Index("ix_messages_conversation_created", "conversation_id", "created_at"),
+    )
@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+
+class IngestionJobResponse(BaseModel):
+    id: int
+    conversation_id: int
+    document_id: Optional[int]
+    filename: str
+    status: str
+    progress: int
+    error: Optional[str]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,89 @@
+"""Compressed storage of document bodies.
+
+Bodies are compressed with zstd when the `zstandard` package is installed
+and zlib otherwise (`BLOB_CODEC=auto|zstd|zlib`); the codec is stored per
+blob so either can be read back. `BlobWriter` compresses incrementally, so
+ingestion never holds a whole document's text in memory.
+"""
+from typing import Optional
+import logging
+import os
+import zlib
+
+from sqlalchemy.orm import Session
+
+from app.models.document_blob import DocumentBlob
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+BLOB_CODEC = os.getenv("BLOB_CODEC", "auto")
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def default_codec() -> str:
+    if BLOB_CODEC == "zstd" or (BLOB_CODEC == "auto" and zstandard is not None):
+        if zstandard is None:
+            logger.warning("BLOB_CODEC=zstd but zstandard is not installed; using zlib")
+            return "zlib"
+        return "zstd"
+    return "zlib"
+
+
+class BlobWriter:
+    """Incremental text compressor; `finish()` returns the compressed bytes."""
+
+    def __init__(self, codec: str = None):
+        self.codec = codec or default_codec()
+        if self.codec == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        else:
+            self._compressor = zlib.compressobj(ZLIB_LEVEL)
+        self._parts = []
+        self.size = 0
+
+    def write(self, text: str) -> None:
+        raw = text.encode("utf-8")
+        self.size += len(raw)
+        self._parts.append(self._compressor.compress(raw))
+
+    def finish(self) -> bytes:
+        self._parts.append(self._compressor.flush())
+        return b"".join(self._parts)
+
+
+def decompress(codec: str, data: bytes) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd blobs")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data).decode("utf-8")
+    return zlib.decompress(data).decode("utf-8")
+
+
+def save_blob(db: Session, document_id: int, writer: BlobWriter) -> None:
+    """Store the finished `writer` as the document body. The caller commits."""
+    db.merge(DocumentBlob(
+        document_id=document_id,
+        codec=writer.codec,
+        size=writer.size,
+        data=writer.finish()
+    ))
+
+
+def save_text(db: Session, document_id: int, text: str) -> None:
+    writer = BlobWriter()
+    writer.write(text)
+    save_blob(db, document_id, writer)
+
+
+def load_text(db: Session, document_id: int) -> Optional[str]:
+    """Decompress a document body, or None if it has no blob."""
+    blob = db.get(DocumentBlob, document_id)
+    if blob is None:
+        return None
+    return decompress(blob.codec, blob.data)
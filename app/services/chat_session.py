@@ -0,0 +1,127 @@
+"""In-memory conversation state for WebSocket chat sessions.
+
+A `ChatSession` is opened once per connection: the conversation snapshot
+and its recent-message window are loaded a single time and then kept up to
+date in memory, so a turn only touches the database for RAG retrieval.
+Each turn's messages are written by a background task (chained, so writes
+land in order) while the next message is already being answered; `close`
+waits for the outstanding writes.
+
+The summary is refreshed from the cached conversation snapshot, which the
+background summary pass keeps current. Messages posted to the same
+conversation over HTTP while a session is open are not seen by it.
+"""
+import asyncio
+import logging
+
+from app.db import cache
+from app.db.session import AsyncSessionLocal
+from app.services import metrics
+from app.services.conversation_service import conversation_from_dto
+from app.services.llm_scheduler import INTERACTIVE, llm_scheduler
+from app.services.llm_service import stream_llm
+from app.services.message_service import (
+    MAX_RAW_MESSAGES,
+    WINDOW_SIZE,
+    load_window,
+    new_message,
+    persist_messages,
+    retrieve_context,
+    schedule_summary,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSession:
+    def __init__(self, conversation, messages: list, count: int):
+        self.conversation = conversation
+        self.messages = messages  # recent window, oldest first
+        self.count = count
+        self._writes = None  # task of the most recent write
+
+    @classmethod
+    async def open(cls, db, conversation) -> "ChatSession":
+        messages, count = await load_window(db, conversation.id)
+        return cls(conversation, messages, count)
+
+    def _refresh_summary(self) -> None:
+        cached = cache.get_conversation(self.conversation.id)
+        if cached:
+            self.conversation = conversation_from_dto(cached)
+
+    def _remember(self, messages: list) -> None:
+        self.messages = (self.messages + messages)[-WINDOW_SIZE:]
+        self.count += len(messages)
+
+    def _maybe_summarize(self) -> None:
+        """Schedule a summary pass once the newest evicted message is stored.
+
+        Called after each write, when the written messages have ids; an
+        evicted message whose write is still queued is checked again after
+        that write.
+        """
+        if self.count <= MAX_RAW_MESSAGES or len(self.messages) <= MAX_RAW_MESSAGES:
+            return
+        newest_evicted = self.messages[-MAX_RAW_MESSAGES - 1]
+        if newest_evicted.id is not None and newest_evicted.id > (self.conversation.summarized_until_id or 0):
+            schedule_summary(self.conversation.id)
+
+    def _write(self, messages: list) -> None:
+        conversation_id = self.conversation.id
+        previous = self._writes
+
+        async def write():
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            try:
+                with metrics.span("persist"):
+                    async with AsyncSessionLocal() as db:
+                        await persist_messages(db, conversation_id, messages)
+            except Exception:
+                logger.exception("Could not store messages of conversation %s", conversation_id)
+                raise
+            self._maybe_summarize()
+
+        self._writes = asyncio.ensure_future(write())
+
+    async def turn(self, content: str):
+        """Answer `content`: yields `("token", text)` pairs, then `("done", Message)`.
+
+        Raises `SchedulerOverloaded` (before anything is stored) when the
+        LLM call is shed.
+        """
+        self._refresh_summary()
+        conversation_id = self.conversation.id
+        user_msg = new_message(conversation_id, "user", content)
+        context_chunks = await retrieve_context(self.conversation, content)
+
+        parts = []
+        with metrics.span("llm"):
+            async for piece in llm_scheduler.stream(
+                stream_llm(
+                    conversation=self.conversation,
+                    # the new user message is sent separately by build_llm_messages
+                    recent_messages=self.messages[-(MAX_RAW_MESSAGES - 1):],
+                    user_message=content,
+                    context_chunks=context_chunks
+                ),
+                self.conversation.user_id,
+                INTERACTIVE
+            ):
+                parts.append(piece)
+                yield "token", piece
+
+        reply = new_message(conversation_id, "assistant", "".join(parts))
+        self._remember([user_msg, reply])
+        self._write([user_msg, reply])
+        yield "done", reply
+
+    async def close(self) -> None:
+        """Wait for writes still in flight.
+
+        The writes are shielded: if the connection handler is cancelled
+        while waiting, they still finish in the background.
+        """
+        if self._writes is not None:
+            await asyncio.gather(asyncio.shield(self._writes), return_exceptions=True)
@@ -1,4 +1,10 @@
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Optional
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+import base64
 import logging
 
 from app.models.user import User
@@ -8,6 +14,27 @@ from app.db import cache
 logger = logging.getLogger(__name__)
 
 
+def conversation_to_dto(convo: Conversation) -> dict:
+    """Plain, JSON-serializable view of a conversation for the cache."""
+    return {
+        "id": convo.id,
+        "user_id": convo.user_id,
+        "mode": convo.mode,
+        "title": convo.title,
+        "summary": convo.summary,
+        "summarized_until_id": convo.summarized_until_id,
+        "created_at": convo.created_at.isoformat() if convo.created_at else None,
+    }
+
+
+def conversation_from_dto(dto: dict) -> SimpleNamespace:
+    """Attribute-style, session-free conversation built from a cached DTO."""
+    data = dict(dto)
+    if data.get("created_at"):
+        data["created_at"] = datetime.fromisoformat(data["created_at"])
+    return SimpleNamespace(**data)
+
+
 def get_or_create_user(db: Session, email: str) -> User:
     """Return an existing User or create one.
 
@@ -35,45 +62,173 @@ def create_conversation(db: Session, user_email: str, mode: str, title: str = No
     db.add(conversation)
     db.commit()
     db.refresh(conversation)
-    cache.set_conversation(conversation.id, conversation)
+    cache.set_conversation(conversation.id, conversation_to_dto(conversation))
     logger.info("Created conversation %s for user %s", conversation.id, user_email)
     return conversation
 
 
-def list_conversations(db: Session, user_email: str, limit: int, offset: int):
-    """Return a paginated list of conversations for a user."""
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        return []
+def encode_cursor(created_at: datetime, conversation_id: int) -> str:
+    """Opaque keyset cursor pointing just after a listed conversation."""
+    raw = f"{created_at.isoformat()}|{conversation_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Return `(created_at, id)` from `encode_cursor`; raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, conversation_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(conversation_id)
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+
 
+def _conversation_page_query(user_email: str, limit: int, cursor: Optional[str], offset: int = 0):
+    # only the columns ConversationResponse needs, never `summary`
+    query = (
+        select(Conversation.id, Conversation.mode, Conversation.title, Conversation.created_at)
+        .join(User, User.id == Conversation.user_id)
+        .where(User.email == user_email)
+    )
+    if cursor:
+        created_at, conversation_id = decode_cursor(cursor)
+        query = query.where(or_(
+            Conversation.created_at < created_at,
+            and_(Conversation.created_at == created_at, Conversation.id < conversation_id)
+        ))
+    elif offset:
+        query = query.offset(offset)  # deprecated, see list_conversations
+    # one extra row tells whether there is a next page
     return (
-        db.query(Conversation)
-        .filter(Conversation.user_id == user.id)
-        .order_by(Conversation.created_at.desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
+        query
+        .order_by(Conversation.created_at.desc(), Conversation.id.desc())
+        .limit(limit + 1)
     )
 
 
+def _page(rows, limit: int):
+    rows = list(rows)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def list_conversations(db: Session, user_email: str, limit: int, cursor: str = None, offset: int = 0):
+    """Return `(rows, next_cursor)` for one page of a user's conversations.
+
+    Keyset pagination on `(created_at, id)`, newest first; pass the returned
+    cursor to get the next page (None on the last page). `offset` is still
+    honoured for older clients when no cursor is given, but scans every
+    skipped row.
+    """
+    return _page(db.execute(_conversation_page_query(user_email, limit, cursor, offset)), limit)
+
+
 def get_conversation(db: Session, conversation_id: int):
-    """Get a conversation; use cache if available."""
+    """Get a conversation snapshot; use cache if available."""
     cached = cache.get_conversation(conversation_id)
     if cached:
         logger.info("Cache hit for conversation %s", conversation_id)
-        return cached
+        return conversation_from_dto(cached)
 
     convo = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-    if convo:
-        cache.set_conversation(convo.id, convo)
-    return convo
+    if not convo:
+        return None
+    dto = conversation_to_dto(convo)
+    cache.set_conversation(convo.id, dto)
+    return conversation_from_dto(dto)
 
 
 def delete_conversation(db: Session, conversation_id: int):
-    convo = get_conversation(db, conversation_id)
+    convo = db.query(Conversation).filter(Conversation.id == conversation_id).first()
     if convo:
         db.delete(convo)
         db.commit()
         cache.invalidate_conversation(conversation_id)
+        cache.invalidate_window(conversation_id)
+        logger.info("Deleted conversation %s", conversation_id)
+    return convo
+
+
+# Async variants used by the request path (AsyncSession / aiosqlite)
+
+async def get_user_by_email_async(db: AsyncSession, email: str):
+    """Resolve an email to a user snapshot (`id`, `email`), cached.
+
+    Only existing users are cached, so a later sign-up is seen immediately.
+    """
+    cached = cache.get_user(email)
+    if cached:
+        return SimpleNamespace(**cached)
+
+    user = await db.scalar(select(User).where(User.email == email))
+    if not user:
+        return None
+    dto = {"id": user.id, "email": user.email}
+    cache.set_user(email, dto)
+    return SimpleNamespace(**dto)
+
+
+async def get_or_create_user_async(db: AsyncSession, email: str):
+    user = await get_user_by_email_async(db, email)
+    if not user:
+        user = User(email=email)
+        db.add(user)
+        await db.commit()
+        await db.refresh(user)
+        cache.set_user(email, {"id": user.id, "email": user.email})
+        logger.info("Created new user %s", email)
+    return user
+
+
+async def create_conversation_async(db: AsyncSession, user_email: str, mode: str, title: str = None):
+    """Create a conversation and cache it."""
+    user = await get_or_create_user_async(db, user_email)
+
+    conversation = Conversation(
+        user_id=user.id,
+        mode=mode,
+        title=title
+    )
+    db.add(conversation)
+    await db.commit()
+    await db.refresh(conversation)
+    cache.set_conversation(conversation.id, conversation_to_dto(conversation))
+    # a new conversation has no messages; seed the window so the first turn
+    # does not have to query for it
+    cache.set_window(conversation.id, {"messages": [], "count": 0})
+    logger.info("Created conversation %s for user %s", conversation.id, user_email)
+    return conversation
+
+
+async def list_conversations_async(db: AsyncSession, user_email: str, limit: int, cursor: str = None, offset: int = 0):
+    """Async variant of `list_conversations`."""
+    return _page(await db.execute(_conversation_page_query(user_email, limit, cursor, offset)), limit)
+
+
+async def get_conversation_async(db: AsyncSession, conversation_id: int):
+    """Get a conversation snapshot; use cache if available."""
+    cached = cache.get_conversation(conversation_id)
+    if cached:
+        logger.info("Cache hit for conversation %s", conversation_id)
+        return conversation_from_dto(cached)
+
+    convo = await db.get(Conversation, conversation_id)
+    if not convo:
+        return None
+    dto = conversation_to_dto(convo)
+    cache.set_conversation(convo.id, dto)
+    return conversation_from_dto(dto)
+
+
+async def delete_conversation_async(db: AsyncSession, conversation_id: int):
+    convo = await db.get(Conversation, conversation_id)
+    if convo:
+        await db.delete(convo)
+        await db.commit()
+        cache.invalidate_conversation(conversation_id)
+        cache.invalidate_window(conversation_id)
         logger.info("Deleted conversation %s", conversation_id)
     return convo
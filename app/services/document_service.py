@@ -0,0 +1,110 @@
+from typing import Optional
+from sqlalchemy.orm import Session
+import logging
+
+from app.models.document import Document
+from app.models.conversation_document import ConversationDocument
+from app.services.blob_service import save_text
+from app.services.rag_service import chunk_text, index_document
+from app.services.embedding_service import embed_document
+
+logger = logging.getLogger(__name__)
+
+
+def link_document(db: Session, conversation_id: int, document_id: int) -> None:
+    """Attach a document to a conversation once. The caller commits."""
+    exists = (
+        db.query(ConversationDocument.id)
+        .filter_by(conversation_id=conversation_id, document_id=document_id)
+        .first()
+    )
+    if not exists:
+        db.add(ConversationDocument(
+            conversation_id=conversation_id,
+            document_id=document_id
+        ))
+
+
+def link_existing_document(
+    db: Session,
+    conversation_id: int,
+    content_hash: str,
+    statuses=("ready",)
+) -> Optional[Document]:
+    """Link the document already stored for `content_hash`, if any.
+
+    Returns the linked document, or None when the content is new.
+    """
+    if not content_hash:
+        return None
+    document = (
+        db.query(Document)
+        .filter(Document.content_hash == content_hash, Document.status.in_(statuses))
+        .first()
+    )
+    if document is None:
+        return None
+    link_document(db, conversation_id, document.id)
+    db.commit()
+    logger.info("Linked existing document %s to conversation %s", document.id, conversation_id)
+    return document
+
+
+def create_document(
+    db: Session,
+    conversation_id: int,
+    filename: str,
+    content_hash: str = None
+) -> Document:
+    """Commit a linked document in the `indexing` state.
+
+    Retrieval skips it until `finish_document` flips it to `ready`, so a
+    half-indexed document is never read.
+    """
+    if content_hash:
+        # a failed attempt must not block re-ingesting the same bytes
+        db.query(Document).filter(
+            Document.content_hash == content_hash, Document.status == "failed"
+        ).update({Document.content_hash: None}, synchronize_session=False)
+
+    document = Document(
+        filename=filename,
+        content_hash=content_hash,
+        status="indexing"
+    )
+    db.add(document)
+    db.flush()
+    link_document(db, conversation_id, document.id)
+    db.commit()
+    return document
+
+
+def finish_document(db: Session, document: Document) -> Document:
+    """Embed the indexed chunks and mark the document ready."""
+    embed_document(db, document.id)
+    document.status = "ready"
+    db.commit()
+    db.refresh(document)
+    return document
+
+
+def fail_document(db: Session, document: Document) -> None:
+    db.rollback()
+    document.status = "failed"
+    db.commit()
+
+
+def store_document(db: Session, conversation_id: int, filename: str, text: str) -> Document:
+    """Persist extracted text, index and embed its chunks and link it to the conversation."""
+    document = create_document(db, conversation_id, filename)
+
+    try:
+        save_text(db, document.id, text)
+        index_document(db, document, chunk_text(text))
+        finish_document(db, document)
+    except Exception:
+        fail_document(db, document)
+        raise
+
+    logger.info("Stored PDF %s for conversation %s", document.filename, conversation_id)
+    return document
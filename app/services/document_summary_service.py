@@ -0,0 +1,175 @@
+"""Map-reduce summaries of whole documents.
+
+Sending entire documents to the LLM for "summarize this" requests either
+overflows the context window or is very slow. Instead:
+
+1. map: each indexed chunk is summarized on its own, at most
+   `DOC_SUMMARY_CONCURRENCY` calls at a time; results are stored on
+   `DocumentChunk.summary`
+2. reduce: chunk summaries are combined in groups of up to
+   `DOC_SUMMARY_REDUCE_TOKENS` tokens, repeatedly, until one final
+   summary remains; it is stored on `Document.summary`
+
+Documents are immutable (content-addressed), so both are kept for good: a
+later summary request on the same PDF reads one row, and a build that
+failed part-way resumes from the chunk summaries already stored.
+Concurrent requests for the same document share one build. LLM calls use
+the `summary` task (fast model tier) and take interactive scheduler slots
+for the requesting user.
+"""
+from types import SimpleNamespace
+import asyncio
+import logging
+import os
+
+from sqlalchemy import select, update
+
+from app.db.session import AsyncSessionLocal
+from app.models.document import Document
+from app.models.document_chunk import DocumentChunk
+from app.services import metrics
+from app.services.llm_scheduler import INTERACTIVE, llm_scheduler
+from app.services.llm_service import call_llm
+from app.services.token_service import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+DOC_SUMMARY_CONCURRENCY = int(os.getenv("DOC_SUMMARY_CONCURRENCY", "4"))
+DOC_SUMMARY_REDUCE_TOKENS = int(os.getenv("DOC_SUMMARY_REDUCE_TOKENS", "2000"))
+DOC_SUMMARY_MAX_ROUNDS = int(os.getenv("DOC_SUMMARY_MAX_ROUNDS", "4"))
+
+CHUNK_PROMPT = """
+Summarize the following excerpt of a document in a few sentences.
+Keep key facts, figures, names and decisions.
+"""
+
+REDUCE_PROMPT = """
+The following are summaries of consecutive parts of one document.
+Combine them into a single concise summary of the whole document.
+"""
+
+# document id -> task building its summary
+_INFLIGHT = {}
+
+
+async def _summarize(prompt: str, text: str, user_id, semaphore: asyncio.Semaphore) -> str:
+    convo = SimpleNamespace(summary=None, id=None)
+    async with semaphore:
+        async with llm_scheduler.slot(user_id, INTERACTIVE):
+            return await call_llm(
+                convo,
+                recent_messages=[],
+                user_message=f"{prompt}\n\n{text}",
+                temperature=0.0,
+                task="summary",
+                fallback=False
+            )
+
+
+def _group(summaries: list, budget: int) -> list:
+    """Split `summaries` into consecutive groups of at most `budget` tokens."""
+    groups, current, size = [], [], 0
+    for summary in summaries:
+        cost = count_tokens(summary)
+        if current and size + cost > budget:
+            groups.append(current)
+            current, size = [], 0
+        current.append(summary)
+        size += cost
+    if current:
+        groups.append(current)
+    return groups
+
+
+async def reduce_summaries(summaries: list, user_id=None, semaphore: asyncio.Semaphore = None) -> str:
+    """Combine partial summaries into one, in as many rounds as needed."""
+    semaphore = semaphore or asyncio.Semaphore(DOC_SUMMARY_CONCURRENCY)
+    for _ in range(DOC_SUMMARY_MAX_ROUNDS):
+        if len(summaries) == 1:
+            return summaries[0]
+        groups = _group(summaries, DOC_SUMMARY_REDUCE_TOKENS)
+        if len(groups) == 1:
+            break
+        summaries = await asyncio.gather(*(
+            _summarize(REDUCE_PROMPT, "\n\n".join(group), user_id, semaphore) for group in groups
+        ))
+
+    text = truncate_to_tokens("\n\n".join(summaries), DOC_SUMMARY_REDUCE_TOKENS)
+    return await _summarize(REDUCE_PROMPT, text, user_id, semaphore)
+
+
+async def _build_summary(document_id: int, user_id) -> str:
+    async with AsyncSessionLocal() as db:
+        chunks = (await db.execute(
+            select(DocumentChunk.id, DocumentChunk.content, DocumentChunk.summary)
+            .where(DocumentChunk.document_id == document_id)
+            .order_by(DocumentChunk.position)
+        )).all()
+    if not chunks:
+        return None
+
+    semaphore = asyncio.Semaphore(DOC_SUMMARY_CONCURRENCY)
+
+    async def map_chunk(chunk) -> str:
+        return chunk.summary or await _summarize(CHUNK_PROMPT, chunk.content, user_id, semaphore)
+
+    summaries = await asyncio.gather(*(map_chunk(chunk) for chunk in chunks), return_exceptions=True)
+
+    # keep the chunks that did get summarized even if others failed, so a
+    # retry only redoes the failures
+    new = [
+        {"id": chunk.id, "summary": summary}
+        for chunk, summary in zip(chunks, summaries)
+        if not chunk.summary and not isinstance(summary, BaseException)
+    ]
+    if new:
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(DocumentChunk), new)
+            await db.commit()
+    for summary in summaries:
+        if isinstance(summary, BaseException):
+            raise summary
+
+    summary = await reduce_summaries(summaries, user_id, semaphore)
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Document).where(Document.id == document_id).values(summary=summary)
+        )
+        await db.commit()
+    logger.info("Summarized document %s from %d chunks", document_id, len(chunks))
+    return summary
+
+
+async def summarize_document(document_id: int, user_id=None):
+    """Return `(filename, summary)` of a ready document, building it once.
+
+    Returns None for unknown, unfinished or empty documents.
+    """
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(Document.filename, Document.summary, Document.status)
+            .where(Document.id == document_id)
+        )).first()
+    if row is None or row.status != "ready":
+        return None
+    if row.summary:
+        return row.filename, row.summary
+
+    task = _INFLIGHT.get(document_id)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(_build_summary(document_id, user_id))
+        _INFLIGHT[document_id] = task
+        task.add_done_callback(
+            lambda t: _INFLIGHT.pop(document_id, None) if _INFLIGHT.get(document_id) is t else None
+        )
+    # shielded: a cancelled request must not abort the build for others
+    summary = await asyncio.shield(task)
+    return (row.filename, summary) if summary else None
+
+
+async def summarize_documents(document_ids, user_id=None) -> list:
+    """Context snippets with the summary of each of `document_ids`."""
+    with metrics.span("doc_summary"):
+        results = await asyncio.gather(*(summarize_document(d, user_id) for d in document_ids))
+    return [f"Summary of {filename}:\n{summary}" for filename, summary in filter(None, results)]
@@ -0,0 +1,217 @@
+"""Semantic retrieval with locally computed chunk embeddings.
+
+Each document's chunk embeddings are stored as one contiguous float32
+matrix (`DocumentEmbedding`). At query time the matrices of a
+conversation's documents are stacked into a per-conversation index kept in a
+small in-process LRU, and top-k cosine search is a single matrix-vector
+product over L2-normalised rows.
+
+The embedder is pluggable: register a class in `EMBEDDERS` and select it
+with the `EMBEDDER` environment variable, or call `set_embedder`.
+"""
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models.document import Document
+from app.models.document_chunk import DocumentChunk
+from app.models.document_embedding import DocumentEmbedding
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))
+INDEX_CACHE_SIZE = int(os.getenv("VECTOR_INDEX_CACHE_SIZE", "128"))  # conversations
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbedder:
+    """Signed feature-hashing embedder over words and word bigrams.
+
+    Needs no model download and is stable across processes (uses blake2b
+    rather than Python's randomised `hash`).
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str):
+        words = _WORD_RE.findall((text or "").lower())
+        return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts) -> np.ndarray:
+        """Return a `(len(texts), dim)` float32 matrix of unit-length rows."""
+        rows, cols, signs = [], [], []
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                rows.append(row)
+                cols.append(value % self.dim)
+                signs.append(1.0 if value >> 63 else -1.0)
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)), signs)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+EMBEDDERS = {"hashing": HashingEmbedder}
+
+_embedder = None
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        _embedder = EMBEDDERS[os.getenv("EMBEDDER", "hashing")]()
+    return _embedder
+
+
+def set_embedder(embedder) -> None:
+    """Swap the active embedder (clears cached indexes)."""
+    global _embedder
+    _embedder = embedder
+    clear_index_cache()
+
+
+def embed_document(db: Session, document_id: int) -> None:
+    """Embed all chunks of a document and store them as one matrix.
+
+    The caller owns the transaction.
+    """
+    embedder = get_embedder()
+    texts = [
+        r[0] for r in (
+            db.query(DocumentChunk.content)
+            .filter(DocumentChunk.document_id == document_id)
+            .order_by(DocumentChunk.position)
+            .all()
+        )
+    ]
+    matrix = np.ascontiguousarray(embedder.embed(texts), dtype=np.float32)
+
+    db.merge(DocumentEmbedding(
+        document_id=document_id,
+        embedder=embedder.name,
+        dim=matrix.shape[1],
+        rows=matrix.shape[0],
+        data=matrix.tobytes()
+    ))
+    _invalidate_document(document_id)
+
+
+class VectorIndex:
+    """Stacked chunk embeddings for a set of documents."""
+
+    def __init__(self, matrix: np.ndarray, document_ids: np.ndarray, positions: np.ndarray):
+        self.matrix = matrix
+        self.document_ids = document_ids
+        self.positions = positions
+
+    def search(self, query_vector: np.ndarray, top_k: int):
+        """Return `[(document_id, position, score)]` best-first."""
+        if not len(self.matrix):
+            return []
+        scores = self.matrix @ query_vector
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            (int(self.document_ids[i]), int(self.positions[i]), float(scores[i]))
+            for i in best
+        ]
+
+
+_LOCK = threading.Lock()
+_INDEX_CACHE: "OrderedDict[tuple, VectorIndex]" = OrderedDict()
+
+
+def clear_index_cache() -> None:
+    with _LOCK:
+        _INDEX_CACHE.clear()
+
+
+def _invalidate_document(document_id: int) -> None:
+    with _LOCK:
+        for key in [k for k in _INDEX_CACHE if document_id in k]:
+            _INDEX_CACHE.pop(key, None)
+
+
+def _load_index(db: Session, document_ids: tuple) -> VectorIndex:
+    with _LOCK:
+        index = _INDEX_CACHE.get(document_ids)
+        if index is not None:
+            _INDEX_CACHE.move_to_end(document_ids)
+            return index
+
+    embedder = get_embedder()
+    stored = {
+        e.document_id: e for e in (
+            db.query(DocumentEmbedding)
+            .filter(DocumentEmbedding.document_id.in_(document_ids))
+            .all()
+        )
+    }
+
+    # Embed indexed documents that have no (or stale) embeddings yet
+    missing = [
+        doc_id for (doc_id,) in (
+            db.query(Document.id)
+            .filter(Document.id.in_(document_ids), Document.chunk_count.isnot(None))
+            .all()
+        )
+        if doc_id not in stored or stored[doc_id].embedder != embedder.name
+    ]
+    if missing:
+        for doc_id in missing:
+            embed_document(db, doc_id)
+        db.commit()
+        return _load_index(db, document_ids)
+
+    matrices, doc_col, pos_col = [], [], []
+    for doc_id in document_ids:
+        entry = stored.get(doc_id)
+        if entry is None or not entry.rows:
+            continue
+        matrices.append(np.frombuffer(entry.data, dtype=np.float32).reshape(entry.rows, entry.dim))
+        doc_col.append(np.full(entry.rows, doc_id, dtype=np.int64))
+        pos_col.append(np.arange(entry.rows, dtype=np.int64))
+
+    if matrices:
+        index = VectorIndex(
+            np.ascontiguousarray(np.vstack(matrices)),
+            np.concatenate(doc_col),
+            np.concatenate(pos_col)
+        )
+    else:
+        index = VectorIndex(
+            np.zeros((0, embedder.dim), dtype=np.float32),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.int64)
+        )
+
+    with _LOCK:
+        _INDEX_CACHE[document_ids] = index
+        while len(_INDEX_CACHE) > INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+    return index
+
+
+def search_chunks(db: Session, document_ids, query: str, top_k: int = 2):
+    """Return `[(document_id, position, score)]` for the most similar chunks."""
+    document_ids = tuple(sorted(set(document_ids)))
+    if not document_ids:
+        return []
+
+    index = _load_index(db, document_ids)
+    query_vector = get_embedder().embed([query])[0]
+    return [hit for hit in index.search(query_vector, top_k) if hit[2] > 0]
@@ -0,0 +1,170 @@
+"""Group commit for message inserts.
+
+With `GROUP_COMMIT=1` message writes from concurrent requests are handed to
+one flusher task that waits up to `GROUP_COMMIT_WINDOW_MS` (or until
+`GROUP_COMMIT_MAX_BATCH` messages are pending) and then stores the whole
+batch, with one counter update per conversation, in a single transaction.
+Each caller gets its own stored messages back once that commit succeeds,
+so write throughput grows with concurrency instead of being capped by one
+fsync per request.
+
+If a batch violates a constraint, its requests are retried one transaction
+each, so only the offending request fails. `stop` flushes what is already
+queued; requests still pending when the flusher is cancelled fail instead
+of waiting forever.
+"""
+from collections import defaultdict
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from app.db.session import AsyncSessionLocal
+from app.models.conversation import Conversation
+
+logger = logging.getLogger(__name__)
+
+GROUP_COMMIT = os.getenv("GROUP_COMMIT", "0").lower() in ("1", "true", "yes")
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "5"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "256"))
+GROUP_COMMIT_STOP_TIMEOUT = 5.0
+
+# queued by `stop` behind the pending writes
+_STOP = object()
+
+
+class GroupCommitWriter:
+    def __init__(self, window_ms: float = GROUP_COMMIT_WINDOW_MS, max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.messages = 0
+        self._loop = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task = None
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task is not None and not self._task.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._run(), name="group-commit")
+
+    async def write(self, messages: list) -> list:
+        """Store `messages` (unsaved `Message` objects) in the next group commit."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((messages, future))
+        return await future
+
+    async def _collect(self, batch: list) -> bool:
+        """Fill `batch` with the next group; False once `stop` was queued."""
+        item = await self._queue.get()
+        if item is _STOP:
+            return False
+        batch.append(item)
+        size = len(item[0])
+        deadline = self._loop.time() + self.window
+        while size < self.max_batch:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                return False
+            batch.append(item)
+            size += len(item[0])
+        return True
+
+    @staticmethod
+    def _fail(batch: list, exc: BaseException) -> None:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(exc)
+
+    async def _store(self, batch: list) -> dict:
+        counts = defaultdict(int)
+        for messages, _ in batch:
+            for msg in messages:
+                counts[msg.conversation_id] += 1
+
+        async with AsyncSessionLocal() as db:
+            for messages, _ in batch:
+                db.add_all(messages)
+            for conversation_id, n in counts.items():
+                await db.execute(
+                    update(Conversation)
+                    .where(Conversation.id == conversation_id)
+                    .values(message_count=Conversation.message_count + n)
+                )
+            await db.commit()
+        return counts
+
+    async def _flush(self, batch: list) -> None:
+        try:
+            counts = await self._store(batch)
+        except IntegrityError as exc:
+            if len(batch) == 1:
+                logger.warning("Group commit request rejected: %s", exc.orig)
+                self._fail(batch, exc)
+                return
+            # one bad request must not fail the others
+            logger.warning("Group commit of %d requests failed; retrying them one by one", len(batch))
+            for messages, future in batch:
+                for msg in messages:
+                    msg.id = None  # assigned by the rolled-back flush
+                await self._flush([(messages, future)])
+            return
+        except Exception as exc:
+            logger.exception("Group commit of %d requests failed", len(batch))
+            self._fail(batch, exc)
+            return
+
+        self.batches += 1
+        self.messages += sum(counts.values())
+        for messages, future in batch:
+            if not future.done():
+                future.set_result(messages)
+
+    async def _run(self) -> None:
+        batch = []
+        try:
+            running = True
+            while running:
+                running = await self._collect(batch)
+                if batch:
+                    await self._flush(batch)
+                batch = []
+        except asyncio.CancelledError:
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is not _STOP:
+                    batch.append(item)
+            self._fail(batch, RuntimeError("Group commit writer stopped before the write was stored"))
+            raise
+
+    async def stop(self) -> None:
+        """Flush queued writes and stop; gives up after `GROUP_COMMIT_STOP_TIMEOUT`."""
+        if self._task is not None:
+            if not self._task.done():
+                self._queue.put_nowait(_STOP)
+            try:
+                await asyncio.wait_for(self._task, GROUP_COMMIT_STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("Group commit writer did not stop in time; pending writes failed")
+            except Exception:
+                logger.exception("Group commit writer failed")
+        self._task = None
+        self._loop = None
+        self._queue = None
+
+
+group_writer = GroupCommitWriter()
+
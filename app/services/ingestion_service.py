@@ -0,0 +1,245 @@
+"""Background PDF ingestion.
+
+Uploads are spooled to disk and recorded as an `IngestionJob`. A job runs
+`run_ingestion_job` in a process pool (spawn context), so parsing, chunking
+and indexing large PDFs never blocks the event loop or holds the GIL of the
+API process. The worker opens its own database session and writes progress
+to the job row, which the status endpoint reads.
+
+Configuration (environment):
+- `INGEST_WORKERS` worker processes (default 2, 0 = run in a thread)
+- `INGEST_SPOOL_DIR` where uploads wait for a worker (default: system temp)
+- `INGEST_SHARED_POLL` / `INGEST_SHARED_TIMEOUT` how often and how long a
+  job waits for another job that is ingesting the same bytes
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+
+from fastapi import UploadFile
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import base  # noqa: F401  registers all models in spawned workers
+from app.db.session import SessionLocal
+from app.models.document import Document
+from app.models.ingestion_job import IngestionJob
+from app.services import metrics, pdf_service
+from app.services.blob_service import BlobWriter, save_blob
+from app.services.document_service import (
+    create_document,
+    fail_document,
+    finish_document,
+    link_existing_document
+)
+from app.services.pdf_service import PDFLimitError, check_pdf_size, count_pdf_pages, iter_pdf_pages
+from app.services.rag_service import index_document, iter_chunks
+from app.services.task_queue import TaskQueue
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR") or tempfile.gettempdir()
+INGEST_SHARED_POLL = float(os.getenv("INGEST_SHARED_POLL", "0.5"))
+INGEST_SHARED_TIMEOUT = float(os.getenv("INGEST_SHARED_TIMEOUT", "600"))
+
+# dedicated queue so long ingestions never delay summaries
+ingestion_queue = TaskQueue(workers=max(INGEST_WORKERS, 1), name="ingestion")
+
+_POOL: Optional[ProcessPoolExecutor] = None
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(
+            max_workers=INGEST_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _POOL
+
+
+def _update_job(db, job: IngestionJob, **fields) -> None:
+    for name, value in fields.items():
+        setattr(job, name, value)
+    db.commit()
+
+
+def _wait_for_document(db, document_id: int) -> str:
+    """Poll a document another job is indexing until it is ready or failed.
+
+    Gives up as `failed` after `INGEST_SHARED_TIMEOUT` seconds, e.g. when
+    the other worker died mid-way.
+    """
+    deadline = time.monotonic() + INGEST_SHARED_TIMEOUT
+    while True:
+        status = db.scalar(select(Document.status).where(Document.id == document_id))
+        db.commit()  # end the read transaction so the next poll sees new commits
+        if status != "indexing":
+            return status
+        if time.monotonic() >= deadline:
+            return "failed"
+        time.sleep(INGEST_SHARED_POLL)
+
+
+def run_ingestion_job(job_id: int, path: str) -> Optional[int]:
+    """Extract, chunk and index one spooled PDF; returns the document id.
+
+    Runs inside a worker process, so it only takes picklable arguments and
+    reports progress (and failures) through the job row. Pages are chunked
+    and indexed as they are extracted.
+    """
+    db = SessionLocal()
+    document = None
+    try:
+        job = db.get(IngestionJob, job_id)
+        existing = link_existing_document(db, job.conversation_id, job.content_hash)
+        if existing is not None:
+            _update_job(db, job, status="ready", progress=100, document_id=existing.id)
+            return existing.id
+
+        _update_job(db, job, status="extracting", progress=5)
+        page_count = count_pdf_pages(path)
+
+        try:
+            document = create_document(
+                db, job.conversation_id, job.filename, content_hash=job.content_hash
+            )
+        except IntegrityError:
+            # another job is ingesting the same bytes right now; share its document
+            db.rollback()
+            existing = link_existing_document(
+                db, job.conversation_id, job.content_hash, statuses=("ready", "indexing")
+            )
+            if existing is None:
+                raise
+            # report the shared document's outcome, not just the link
+            _update_job(db, job, status="indexing", document_id=existing.id)
+            if _wait_for_document(db, existing.id) != "ready":
+                raise ValueError("Ingestion of the same file by another job failed")
+            _update_job(db, job, status="ready", progress=100)
+            return existing.id
+        _update_job(db, job, status="indexing", document_id=document.id)
+
+        # inside a pool worker the pool already provides the parallelism;
+        # page-parallel extraction would nest a second pool in every worker
+        page_workers = 1 if multiprocessing.parent_process() is not None else None
+
+        # the body is compressed as pages arrive instead of kept as one string
+        body = BlobWriter()
+        report_every = max(page_count // 20, 1)
+
+        def tracked_pages():
+            for number, text in enumerate(iter_pdf_pages(path, workers=page_workers), start=1):
+                body.write(text if number == 1 else "\n" + text)
+                if number % report_every == 0:
+                    _update_job(db, job, progress=5 + 85 * number // page_count)
+                yield text
+
+        if not index_document(db, document, iter_chunks(tracked_pages())):
+            raise ValueError("Could not extract text from PDF")
+
+        save_blob(db, document.id, body)
+        finish_document(db, document)
+        _update_job(db, job, status="ready", progress=100)
+        logger.info("Ingested %s (%d pages) as document %s", job.filename, page_count, document.id)
+        return document.id
+    except Exception as exc:
+        logger.exception("Ingestion job %s failed", job_id)
+        db.rollback()
+        if document is not None:
+            fail_document(db, document)
+        job = db.get(IngestionJob, job_id)
+        if job is not None:
+            _update_job(db, job, status="failed", error=str(exc) or type(exc).__name__)
+        return None
+    finally:
+        db.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _spool(source, target) -> str:
+    """Copy an upload to disk, returning the sha256 of its bytes."""
+    digest = hashlib.sha256()
+    while True:
+        block = source.read(1 << 20)
+        if not block:
+            break
+        digest.update(block)
+        target.write(block)
+    return digest.hexdigest()
+
+
+async def create_job(db: AsyncSession, conversation_id: int, file: UploadFile):
+    """Spool `file` to disk and record a queued job; returns `(job, path)`.
+
+    When a ready document with the same content hash exists it is linked to
+    the conversation right away and the job is returned already `ready`,
+    with `path` None: there is nothing to parse.
+
+    Raises `PDFLimitError` when the upload is larger than `PDF_MAX_BYTES`.
+    """
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=INGEST_SPOOL_DIR)
+    with os.fdopen(fd, "wb") as out:
+        content_hash = await asyncio.to_thread(_spool, file.file, out)
+    try:
+        check_pdf_size(path)
+    except PDFLimitError:
+        os.remove(path)
+        raise
+
+    job = IngestionJob(
+        conversation_id=conversation_id,
+        filename=file.filename,
+        content_hash=content_hash
+    )
+    existing = await db.run_sync(
+        lambda sync_db: link_existing_document(sync_db, conversation_id, content_hash)
+    )
+    if existing is not None:
+        os.remove(path)
+        path = None
+        job.status = "ready"
+        job.progress = 100
+        job.document_id = existing.id
+
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    return job, path
+
+
+async def run_job(job_id: int, path: str) -> Optional[int]:
+    """Run one job off the event loop and wait for it."""
+    # extraction and indexing happen in the worker; the span covers both
+    with metrics.span("ingest"):
+        if INGEST_WORKERS <= 0:
+            return await asyncio.to_thread(run_ingestion_job, job_id, path)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_pool(), run_ingestion_job, job_id, path)
+
+
+def schedule_job(job_id: int, path: str) -> None:
+    ingestion_queue.submit(lambda: run_job(job_id, path), key=("ingest", job_id))
+
+
+async def get_job(db: AsyncSession, job_id: int) -> Optional[IngestionJob]:
+    return await db.get(IngestionJob, job_id, populate_existing=True)
+
+
+def shutdown() -> None:
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(wait=True)
+        _POOL = None
+    pdf_service.shutdown()
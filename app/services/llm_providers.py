@@ -0,0 +1,306 @@
+"""LLM provider implementations used by `llm_service`.
+
+`OpenAICompatibleProvider` talks to any OpenAI-style `/chat/completions`
+endpoint (Groq by default) over a shared, kept-alive `httpx.AsyncClient`
+pool. Outstanding requests are bounded by a semaphore, every call has an
+overall deadline, and transient failures (timeouts, connection errors, 429
+and 5xx) are retried with full-jitter exponential backoff.
+
+`FakeProvider` answers locally with configurable latency and token pacing,
+for offline development, tests and load testing.
+`benchmarks/mock_llm_server.py` exposes the same behaviour over HTTP so the
+real client path can be exercised.
+"""
+from abc import ABC, abstractmethod
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import weakref
+from typing import AsyncIterator, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Delay between chunks emitted by the local fake streaming provider (seconds)
+MOCK_STREAM_DELAY = float(os.getenv("MOCK_STREAM_DELAY", "0.02"))
+
+_RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMProviderError(Exception):
+    """Raised when a provider call fails after retries or misses its deadline."""
+
+
+async def fake_stream(text: str, delay: float = None, first_token_delay: float = None) -> AsyncIterator[str]:
+    """Yield `text` word by word with controllable time-to-first-token."""
+    delay = MOCK_STREAM_DELAY if delay is None else delay
+    first_token_delay = delay if first_token_delay is None else first_token_delay
+
+    for i, piece in enumerate(re.findall(r"\S+\s*", text)):
+        await asyncio.sleep(first_token_delay if i == 0 else delay)
+        yield piece
+
+
+def _last_user_content(messages) -> str:
+    for message in reversed(messages):
+        if message["role"] == "user":
+            return message["content"]
+    return ""
+
+
+class LLMProvider(ABC):
+    name = "base"
+
+    @abstractmethod
+    async def complete(self, messages, model: str, temperature: float, max_tokens: int) -> str:
+        """Return the full completion for `messages`."""
+
+    async def stream(self, messages, model: str, temperature: float, max_tokens: int) -> AsyncIterator[str]:
+        # default: one chunk with the full completion
+        yield await self.complete(messages, model, temperature, max_tokens)
+
+    async def aclose(self) -> None:
+        return None
+
+
+class FakeProvider(LLMProvider):
+    """Local provider that echoes the last user message after `latency` seconds."""
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.05, token_delay: float = None, reply: Optional[str] = None):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.reply = reply
+        self.calls = 0
+
+    def _reply_for(self, messages) -> str:
+        if self.reply is not None:
+            return self.reply
+        return f"(mock) Echo: {_last_user_content(messages)[:200]}"
+
+    async def complete(self, messages, model: str, temperature: float, max_tokens: int) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self._reply_for(messages)
+
+    async def stream(self, messages, model: str, temperature: float, max_tokens: int) -> AsyncIterator[str]:
+        self.calls += 1
+        async for piece in fake_stream(self._reply_for(messages), self.token_delay, self.latency):
+            yield piece
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Async HTTP client for OpenAI-compatible chat completion APIs.
+
+    httpx clients and asyncio semaphores belong to one event loop, so one of
+    each is kept per running loop.
+    """
+
+    name = "openai"
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str = None,
+        max_concurrency: int = 32,
+        timeout: float = 30.0,
+        deadline: float = 60.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.25,
+        backoff_max: float = 4.0,
+        max_connections: int = 64,
+        max_keepalive: int = 32,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive
+        )
+        self.transport = transport
+        self._clients = weakref.WeakKeyDictionary()
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+            client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=headers,
+                timeout=httpx.Timeout(self.timeout),
+                limits=self.limits,
+                transport=self.transport,
+            )
+            self._clients[loop] = client
+        return client
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        # full jitter: uniform in [0, min(cap, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _payload(self, messages, model, temperature, max_tokens, stream=False) -> dict:
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    async def _with_retries(self, attempt_call):
+        """Run `attempt_call()`, retrying transient failures with backoff."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await attempt_call()
+            except httpx.HTTPStatusError as exc:
+                status = exc.response.status_code
+                if status not in _RETRY_STATUS or attempt == self.max_retries:
+                    raise LLMProviderError(f"provider returned {status}") from exc
+                delay = self._backoff(attempt, exc.response.headers.get("retry-after"))
+            except (httpx.TimeoutException, httpx.TransportError) as exc:
+                if attempt == self.max_retries:
+                    raise LLMProviderError(f"provider unreachable: {exc!r}") from exc
+                delay = self._backoff(attempt)
+            logger.warning("LLM call failed (attempt %d); retrying in %.2fs", attempt + 1, delay)
+            await asyncio.sleep(delay)
+
+    async def complete(self, messages, model: str, temperature: float, max_tokens: int) -> str:
+        payload = self._payload(messages, model, temperature, max_tokens)
+
+        async def attempt():
+            response = await self._client().post("/chat/completions", json=payload)
+            response.raise_for_status()
+            return response.json()["choices"][0]["message"]["content"]
+
+        async def limited():
+            # waiting for a slot counts against the deadline too
+            async with self._semaphore():
+                return await self._with_retries(attempt)
+
+        try:
+            return await asyncio.wait_for(limited(), self.deadline)
+        except asyncio.TimeoutError as exc:
+            raise LLMProviderError(f"deadline of {self.deadline}s exceeded") from exc
+
+    async def stream(self, messages, model: str, temperature: float, max_tokens: int) -> AsyncIterator[str]:
+        """Stream content deltas from an SSE response.
+
+        Connection setup is retried; once the first chunk has been yielded a
+        failure is raised to the caller instead of replaying the answer.
+        """
+        payload = self._payload(messages, model, temperature, max_tokens, stream=True)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        async def open_stream():
+            request = self._client().build_request("POST", "/chat/completions", json=payload)
+            response = await self._client().send(request, stream=True)
+            if response.status_code >= 400:
+                await response.aread()
+                await response.aclose()
+                response.raise_for_status()
+            return response
+
+        def remaining() -> float:
+            return self.deadline - (loop.time() - started)
+
+        semaphore = self._semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.deadline)
+        except asyncio.TimeoutError as exc:
+            raise LLMProviderError(f"deadline of {self.deadline}s exceeded") from exc
+
+        response = None
+        try:
+            try:
+                response = await asyncio.wait_for(self._with_retries(open_stream), max(remaining(), 0))
+            except asyncio.TimeoutError as exc:
+                raise LLMProviderError(f"deadline of {self.deadline}s exceeded") from exc
+
+            lines = response.aiter_lines()
+            while True:
+                if remaining() <= 0:
+                    raise LLMProviderError(f"deadline of {self.deadline}s exceeded")
+                try:
+                    line = await asyncio.wait_for(lines.__anext__(), remaining())
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError as exc:
+                    raise LLMProviderError(f"deadline of {self.deadline}s exceeded") from exc
+
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if delta:
+                    yield delta
+        finally:
+            if response is not None:
+                await response.aclose()
+            semaphore.release()
+
+    async def aclose(self) -> None:
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+def provider_from_env() -> LLMProvider:
+    """Build the provider selected by `LLM_PROVIDER` (auto | openai | fake).
+
+    `auto` uses the OpenAI-compatible client when an API key is configured
+    and the fake provider otherwise.
+    """
+    kind = os.getenv("LLM_PROVIDER", "auto")
+    api_key = os.getenv("LLM_API_KEY") or os.getenv("GROQ_API_KEY")
+
+    if kind == "fake" or (kind == "auto" and not api_key):
+        if kind == "auto":
+            logger.warning("GROQ_API_KEY not set; using the local fake LLM provider")
+        return FakeProvider(
+            latency=float(os.getenv("FAKE_LLM_LATENCY", "0.05")),
+            token_delay=float(os.getenv("MOCK_STREAM_DELAY", str(MOCK_STREAM_DELAY)))
+        )
+
+    return OpenAICompatibleProvider(
+        base_url=os.getenv("LLM_BASE_URL", "https://api.groq.com/openai/v1"),
+        api_key=api_key,
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "32")),
+        timeout=float(os.getenv("LLM_TIMEOUT", "30")),
+        deadline=float(os.getenv("LLM_DEADLINE", "60")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "64")),
+        max_keepalive=int(os.getenv("LLM_MAX_KEEPALIVE", "32")),
+    )
@@ -0,0 +1,181 @@
+"""Fair, priority-aware admission for outbound LLM calls.
+
+Every LLM call from `message_service` takes a slot from `llm_scheduler`
+first. At most `LLM_SCHED_CONCURRENCY` calls run at once; the rest wait in
+per-user FIFO queues inside a priority class:
+
+- `INTERACTIVE` (chat replies) is always served before `BACKGROUND`
+  (summarization), so housekeeping cannot delay someone waiting on a reply
+- within a class, users are served round-robin, so one user firing dozens
+  of turns gets one slot per round rather than the whole provider
+
+When `LLM_SCHED_MAX_QUEUE` calls are waiting in total, or
+`LLM_SCHED_MAX_QUEUE_PER_USER` for one user, new calls are rejected at
+once with `SchedulerOverloaded` (HTTP 429) instead of queueing behind work
+that cannot finish in time. Queue waits are exported as
+`botgpt_llm_queue_wait_seconds`.
+"""
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Hashable
+import asyncio
+import logging
+import os
+import time
+
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+LLM_SCHED_CONCURRENCY = int(os.getenv("LLM_SCHED_CONCURRENCY", os.getenv("LLM_MAX_CONCURRENCY", "32")))
+LLM_SCHED_MAX_QUEUE = int(os.getenv("LLM_SCHED_MAX_QUEUE", "256"))
+LLM_SCHED_MAX_QUEUE_PER_USER = int(os.getenv("LLM_SCHED_MAX_QUEUE_PER_USER", "8"))
+
+# priority classes, highest first
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when an LLM call is shed because the queue is full."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        max_concurrency: int = LLM_SCHED_CONCURRENCY,
+        max_queue: int = LLM_SCHED_MAX_QUEUE,
+        max_queue_per_user: int = LLM_SCHED_MAX_QUEUE_PER_USER,
+    ):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.active = 0
+        # priority -> user -> waiting futures; dict order is the round-robin order
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._queued = 0
+        self._per_user = defaultdict(int)
+
+    def depth(self, priority: str = None) -> int:
+        if priority is None:
+            return self._queued
+        return sum(len(q) for q in self._queues[priority].values())
+
+    def _dequeued(self, user: Hashable) -> None:
+        self._queued -= 1
+        self._per_user[user] -= 1
+        if not self._per_user[user]:
+            del self._per_user[user]
+
+    def check(self, user: Hashable, priority: str = INTERACTIVE) -> None:
+        """Raise `SchedulerOverloaded` if a call for `user` would be shed now."""
+        if self.active < self.max_concurrency and not self._queued:
+            return
+        if self._queued >= self.max_queue:
+            reason = f"{self._queued} LLM calls already queued"
+        elif self._per_user[user] >= self.max_queue_per_user:
+            reason = f"{self._per_user[user]} LLM calls already queued for this user"
+        else:
+            return
+        metrics.LLM_SHED.inc(priority=priority)
+        logger.warning("Shedding %s LLM call: %s", priority, reason)
+        raise SchedulerOverloaded(reason)
+
+    async def acquire(self, user: Hashable, priority: str = INTERACTIVE) -> None:
+        """Wait for a slot; every successful `acquire` needs one `release`."""
+        started = time.perf_counter()
+        if self.active < self.max_concurrency and not self._queued:
+            self.active += 1
+            metrics.LLM_QUEUE_WAIT.observe(0.0, priority=priority)
+            return
+
+        self.check(user, priority)
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(user, deque()).append(future)
+        self._queued += 1
+        self._per_user[user] += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was handed over just as the waiter went away
+                self.release()
+            else:
+                waiting = self._queues[priority].get(user)
+                if waiting and future in waiting:
+                    waiting.remove(future)
+                    if not waiting:
+                        del self._queues[priority][user]
+                    self._dequeued(user)
+            raise
+        metrics.LLM_QUEUE_WAIT.observe(time.perf_counter() - started, priority=priority)
+
+    def _next(self):
+        for priority in PRIORITIES:
+            users = self._queues[priority]
+            while users:
+                user, waiting = next(iter(users.items()))
+                future = waiting.popleft()
+                if waiting:
+                    users.move_to_end(user)
+                else:
+                    del users[user]
+                self._dequeued(user)
+                if not future.done():
+                    return future
+        return None
+
+    def release(self) -> None:
+        """Hand the slot to the next waiter, or free it."""
+        future = self._next()
+        if future is not None:
+            future.set_result(None)
+        else:
+            self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, user: Hashable, priority: str = INTERACTIVE):
+        await self.acquire(user, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def stream(self, stream, user: Hashable, priority: str = INTERACTIVE):
+        """Iterate the async iterator `stream` in a slot, yielding its items.
+
+        A separate task reads `stream` into a buffer, so the slot is freed
+        as soon as the provider is done rather than when a slow client has
+        received the last item.
+        """
+        buffer = asyncio.Queue()
+        end = object()
+
+        async def produce():
+            try:
+                async with self.slot(user, priority):
+                    async for item in stream:
+                        buffer.put_nowait(item)
+            finally:
+                buffer.put_nowait(end)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                item = await buffer.get()
+                if item is end:
+                    break
+                yield item
+            await producer  # re-raises provider and scheduler errors
+        finally:
+            if not producer.done():
+                producer.cancel()
+                await asyncio.gather(producer, return_exceptions=True)
+
+
+llm_scheduler = LLMScheduler()
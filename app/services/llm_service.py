@@ -1,9 +1,23 @@
 import asyncio
+import hashlib
+import json
 import logging
 import os
-from groq import Groq
+import time
+from typing import AsyncIterator
 import dotenv
 
+from app.db.cache import LRUTTLCache
+from app.services import metrics
+from app.services.model_router import Tier, model_router
+from app.services.llm_providers import LLMProvider, fake_stream, provider_from_env  # noqa: F401 (fake_stream re-exported)
+from app.services.token_service import (
+    MESSAGE_OVERHEAD_TOKENS,
+    count_tokens,
+    message_tokens,
+    truncate_to_tokens,
+)
+
 dotenv.load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -14,72 +28,274 @@ SYSTEM_PROMPT = (
 
 MAX_HISTORY_MESSAGES = 10  # sliding window
 
-# Initialize Groq client (blocking SDK) if API key is present
-_GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-_groq_client = None
-if _GROQ_API_KEY:
-    try:
-        _groq_client = Groq(api_key=_GROQ_API_KEY)
-    except Exception:
-        logger.exception("Failed to initialize Groq client")
+# Prompt budget: everything sent to the model plus the reserved reply tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+REPLY_TOKENS = 512  # reserved for the reply; tiers cap max_tokens (model_router)
+MAX_CHUNK_TOKENS = int(os.getenv("MAX_CHUNK_TOKENS", "800"))  # per RAG chunk
+
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+
+# Prompt-fingerprint response cache. Only calls at or below
+# LLM_CACHE_MAX_TEMPERATURE are cached/coalesced unless the caller opts in
+# or out explicitly; LLM_CACHE_SIZE=0 disables it.
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.3"))
+
+_RESPONSE_CACHE = LRUTTLCache(max_entries=max(LLM_CACHE_SIZE, 1), ttl=LLM_CACHE_TTL)
+# fingerprint -> task of the provider call currently in flight
+_INFLIGHT = {}
+_coalesced = 0
+
+# Provider is created lazily from the environment (see llm_providers)
+_provider = None
+
+
+def get_provider() -> LLMProvider:
+    global _provider
+    if _provider is None:
+        _provider = provider_from_env()
+    return _provider
+
+
+def set_provider(provider: LLMProvider) -> None:
+    """Swap the LLM provider (tests, benchmarks)."""
+    global _provider
+    _provider = provider
+
+
+async def aclose() -> None:
+    if _provider is not None:
+        await _provider.aclose()
 
 
 def build_llm_messages(conversation, recent_messages, user_message, context_chunks=None):
-    """Compose messages to send to the LLM.
+    """Compose messages to send to the LLM within `CONTEXT_TOKEN_BUDGET`.
 
-    This is a small helper that builds the chat-style message list from the
-    conversation summary, recent messages and optional retrieval context.
+    The system prompt and the new user message are always sent. The
+    remaining budget is filled in priority order: conversation summary, RAG
+    context (each chunk capped at `MAX_CHUNK_TOKENS`), then history from the
+    newest message backwards. Stored `Message.token_count` values are reused
+    so history is not re-tokenized on every turn.
     """
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    budget = CONTEXT_TOKEN_BUDGET - REPLY_TOKENS
+    budget -= message_tokens(SYSTEM_PROMPT) + message_tokens(user_message)
 
+    summary_message = None
     if conversation.summary:
-        messages.append({
-            "role": "system",
-            "content": f"Conversation summary: {conversation.summary}"
-        })
+        content = f"Conversation summary: {conversation.summary}"
+        content = truncate_to_tokens(content, budget - MESSAGE_OVERHEAD_TOKENS)
+        if content:
+            summary_message = {"role": "system", "content": content}
+            budget -= message_tokens(content)
 
+    context_message = None
     if context_chunks:
-        context_text = "\n".join(context_chunks)
-        messages.append({
-            "role": "system",
-            "content": f"Use the following context to answer:\n{context_text}"
-        })
+        header = "Use the following context to answer:"
+        budget -= message_tokens(header)
+        kept = []
+        for chunk in context_chunks:
+            chunk = truncate_to_tokens(chunk, min(MAX_CHUNK_TOKENS, budget))
+            if not chunk:
+                break
+            kept.append(chunk)
+            budget -= count_tokens(chunk) + 1  # newline separator
+        if kept:
+            context_message = {"role": "system", "content": "\n".join([header] + kept)}
 
-    for msg in recent_messages[-MAX_HISTORY_MESSAGES:]:
-        messages.append({"role": msg.role, "content": msg.content})
+    history = []
+    for msg in reversed(recent_messages[-MAX_HISTORY_MESSAGES:]):
+        cost = message_tokens(msg.content, getattr(msg, "token_count", None))
+        if cost > budget:
+            break
+        history.append({"role": msg.role, "content": msg.content})
+        budget -= cost
+    history.reverse()
 
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if summary_message:
+        messages.append(summary_message)
+    if context_message:
+        messages.append(context_message)
+    messages.extend(history)
     messages.append({"role": "user", "content": user_message})
     return messages
 
 
-async def call_llm(conversation, recent_messages, user_message: str, context_chunks=None) -> str:
-    """Asynchronously call the Groq LLM and return assistant text.
+def prompt_fingerprint(model: str, messages, temperature: float, max_tokens: int) -> str:
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cache_stats() -> dict:
+    stats = _RESPONSE_CACHE.stats()
+    stats["coalesced"] = _coalesced
+    stats["inflight"] = len(_INFLIGHT)
+    return stats
+
+
+def _prompt_tokens(messages) -> int:
+    return sum(message_tokens(m["content"]) for m in messages)
+
+
+def _provider_for(tier: Tier) -> LLMProvider:
+    return tier.provider or get_provider()
+
+
+async def _complete_on(tier: Tier, messages, temperature: float) -> str:
+    started = time.perf_counter()
+    try:
+        reply = await _provider_for(tier).complete(
+            messages,
+            model=tier.model,
+            temperature=temperature,
+            max_tokens=tier.max_tokens
+        )
+    except Exception:
+        tier.record(time.perf_counter() - started, ok=False)
+        raise
+    tier.record(time.perf_counter() - started, ok=True)
+    metrics.LLM_TOKENS.inc(_prompt_tokens(messages), kind="prompt")
+    metrics.LLM_TOKENS.inc(count_tokens(reply), kind="completion")
+    return reply
+
+
+async def _complete(messages, user_message: str, temperature: float, tier: Tier) -> str:
+    """One provider call on `tier` (retries and deadline handled by the
+    provider), failing over once to the router's fallback tier; raises on failure."""
+    try:
+        return await _complete_on(tier, messages, temperature)
+    except Exception:
+        fallback = model_router.fallback(tier)
+        if fallback is None:
+            raise
+        logger.warning("LLM call on %s failed; failing over to %s", tier.model, fallback.model)
+        return await _complete_on(fallback, messages, temperature)
+
+
+async def _cached_complete(messages, user_message: str, temperature: float, tier: Tier) -> str:
+    """`_complete` behind the response cache with single-flight coalescing.
 
-    Uses the blocking Groq SDK inside `asyncio.to_thread` so callers can
-    await this function without blocking the event loop. If the Groq API
-    key is not configured, the function falls back to a mocked reply.
+    Concurrent identical prompts share one provider call; the shared call
+    is shielded so a cancelled waiter does not cancel it for the others.
+    """
+    global _coalesced
+    key = prompt_fingerprint(tier.model, messages, temperature, tier.max_tokens)
+
+    cached = _RESPONSE_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    task = _INFLIGHT.get(key)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        async def run():
+            reply = await _complete(messages, user_message, temperature, tier)
+            _RESPONSE_CACHE.set(key, reply)
+            return reply
+
+        task = asyncio.ensure_future(run())
+        _INFLIGHT[key] = task
+        task.add_done_callback(lambda t: _INFLIGHT.pop(key, None) if _INFLIGHT.get(key) is t else None)
+    else:
+        _coalesced += 1
+
+    return await asyncio.shield(task)
+
+
+async def call_llm(
+    conversation,
+    recent_messages,
+    user_message: str,
+    context_chunks=None,
+    temperature: float = None,
+    cache: bool = None,
+    task: str = "chat",
+    fallback: bool = True
+) -> str:
+    """Asynchronously call the LLM provider and return assistant text.
+
+    The default provider is a native async HTTP client with a pooled,
+    kept-alive connection pool (see `llm_providers`). If no API key is
+    configured, a local fake provider returns a mocked reply.
+
+    Identical prompts at a deterministic temperature are answered from a
+    fingerprint cache and concurrent duplicates share one provider call;
+    pass `cache=False` (or `True`) to override the temperature rule.
+
+    The model tier is picked by `model_router` from `task` ("chat" or
+    "summary"), the prompt size and the conversation mode. With
+    `fallback=False` provider errors are raised instead of being replaced
+    by the fallback text (for results that get stored).
     """
     messages = build_llm_messages(conversation, recent_messages, user_message, context_chunks)
     logger.info("Calling LLM for conversation %s (messages=%d)", getattr(conversation, 'id', None), len(messages))
 
-    if not _groq_client:
-        logger.warning("GROQ_API_KEY not set; returning mocked reply")
-        await asyncio.sleep(0.05)
-        return f"(mock) Echo: {user_message[:200]}"
+    temperature = LLM_TEMPERATURE if temperature is None else temperature
+    if cache is None:
+        cache = temperature <= LLM_CACHE_MAX_TEMPERATURE
 
-    # Run the blocking SDK call in a thread to keep this function async
-    try:
-        response = await asyncio.to_thread(
-            _groq_client.chat.completions.create,
-            model="llama-3.3-70b-versatile",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=512,
-        )
+    tier = model_router.choose(task, _prompt_tokens(messages), getattr(conversation, "mode", None))
 
-        # Extract assistant content (SDK returns choices with message)
-        return response.choices[0].message.content
+    try:
+        if cache and LLM_CACHE_SIZE > 0:
+            return await _cached_complete(messages, user_message, temperature, tier)
+        return await _complete(messages, user_message, temperature, tier)
     except Exception:
-        logger.exception("Groq LLM call failed")
+        logger.exception("LLM call failed")
+        if not fallback:
+            raise
         # Fallback to a safe mocked reply instead of raising
         return f"(error) LLM call failed; using fallback response for: {user_message[:120]}"
+
+
+async def _stream_on(tier: Tier, messages) -> AsyncIterator[str]:
+    started = time.perf_counter()
+    completion_tokens = 0
+    try:
+        async for piece in _provider_for(tier).stream(
+            messages,
+            model=tier.model,
+            temperature=LLM_TEMPERATURE,
+            max_tokens=tier.max_tokens
+        ):
+            completion_tokens += count_tokens(piece)
+            yield piece
+    except Exception:
+        tier.record(time.perf_counter() - started, ok=False)
+        raise
+    tier.record(time.perf_counter() - started, ok=True)
+    metrics.LLM_TOKENS.inc(_prompt_tokens(messages), kind="prompt")
+    metrics.LLM_TOKENS.inc(completion_tokens, kind="completion")
+
+
+async def stream_llm(conversation, recent_messages, user_message: str, context_chunks=None) -> AsyncIterator[str]:
+    """Stream assistant text chunks as the provider produces them.
+
+    A tier that fails before its first chunk fails over to the router's
+    fallback tier. On any other provider error the fallback text is
+    emitted instead, so callers always get a reply to persist.
+    """
+    messages = build_llm_messages(conversation, recent_messages, user_message, context_chunks)
+    logger.info("Streaming LLM for conversation %s (messages=%d)", getattr(conversation, 'id', None), len(messages))
+
+    tier = model_router.choose("chat", _prompt_tokens(messages), getattr(conversation, "mode", None))
+    started = False
+    try:
+        try:
+            async for piece in _stream_on(tier, messages):
+                started = True
+                yield piece
+        except Exception:
+            fallback = None if started else model_router.fallback(tier)
+            if fallback is None:
+                raise
+            logger.warning("LLM stream on %s failed; failing over to %s", tier.model, fallback.model)
+            async for piece in _stream_on(fallback, messages):
+                yield piece
+    except Exception:
+        logger.exception("LLM stream failed")
+        yield f"(error) LLM call failed; using fallback response for: {user_message[:120]}"
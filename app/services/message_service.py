@@ -1,18 +1,133 @@
+from types import SimpleNamespace
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+import asyncio
 import logging
+import os
+import time
+import weakref
 
 from app.models.message import Message
 from app.models.conversation import Conversation
-from app.models.document import Document
 from app.models.conversation_document import ConversationDocument
-from app.services.llm_service import call_llm
+from app.models.document import Document
+from app.services.conversation_service import conversation_to_dto, get_conversation_async
+from app.services import metrics
+from app.services.group_commit import GROUP_COMMIT, group_writer
+from app.services.llm_scheduler import BACKGROUND, INTERACTIVE, SchedulerOverloaded, llm_scheduler
+from app.services.llm_service import call_llm, stream_llm
 from app.services.summarization_service import summarize_messages
-from app.services.rag_service import retrieve_relevant_chunks
+from app.services.document_summary_service import summarize_documents
+from app.services.rag_service import retrieve_relevant_chunks, wants_summary
+from app.services.task_queue import background_queue
+from app.services.token_service import count_tokens
 from app.db import cache
+from app.db.base import utcnow
+from app.db.session import AsyncSessionLocal
 
 logger = logging.getLogger(__name__)
 
 MAX_RAW_MESSAGES = 10
+# the cached window keeps one extra message: the newest evicted one, used to
+# decide whether a summary pass is due
+WINDOW_SIZE = MAX_RAW_MESSAGES + 1
+SUMMARY_MAX_BATCH = int(os.getenv("SUMMARY_MAX_BATCH", "50"))  # evicted messages folded per pass
+# store the user message together with the reply: one write transaction per turn
+TURN_UNIT_OF_WORK = os.getenv("TURN_UNIT_OF_WORK", "0").lower() in ("1", "true", "yes")
+
+
+def message_to_dto(msg: Message) -> dict:
+    return {
+        "id": msg.id,
+        "role": msg.role,
+        "content": msg.content,
+        "token_count": msg.token_count,
+        "created_at": msg.created_at.isoformat() if msg.created_at else None,
+    }
+
+
+def message_from_dto(dto: dict) -> SimpleNamespace:
+    return SimpleNamespace(**dto)
+
+
+def _increment_message_count(conversation_id: int):
+    return (
+        update(Conversation)
+        .where(Conversation.id == conversation_id)
+        .values(message_count=Conversation.message_count + 1)
+    )
+
+
+async def load_window(db: AsyncSession, conversation_id: int):
+    """Return `(last WINDOW_SIZE messages oldest-first, total message count)`.
+
+    Served from the cache, which message writes keep up to date (see
+    `_write_through`). On a miss only the window itself (a LIMIT-ed scan
+    of `ix_messages_conversation_created`) and the stored
+    `Conversation.message_count` are read, so the cost does not grow with
+    the length of the conversation. The miss holds the conversation's
+    window lock, which writes take to update or drop the window, so a fill
+    cannot overwrite a newer window with rows read before a commit.
+    """
+    window = cache.get_window(conversation_id)
+    if window is not None:
+        return [message_from_dto(m) for m in window["messages"]], window["count"]
+
+    async with _window_lock(conversation_id):
+        window = cache.get_window(conversation_id)
+        if window is not None:  # filled while waiting for the lock
+            return [message_from_dto(m) for m in window["messages"]], window["count"]
+        rows = (await db.scalars(
+            select(Message)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(WINDOW_SIZE)
+        )).all()
+        count = await db.scalar(
+            select(Conversation.message_count)
+            .where(Conversation.id == conversation_id)
+        ) or 0
+        window = {
+            "messages": [message_to_dto(m) for m in reversed(rows)],
+            "count": count,
+        }
+        cache.set_window(conversation_id, window)
+
+    return [message_from_dto(m) for m in window["messages"]], window["count"]
+
+
+_window_locks = weakref.WeakValueDictionary()
+
+
+def _window_lock(conversation_id: int) -> asyncio.Lock:
+    """Per-conversation lock around window fills and message writes."""
+    lock = _window_locks.get(conversation_id)
+    if lock is None:
+        lock = _window_locks[conversation_id] = asyncio.Lock()
+    return lock
+
+
+def _write_through(conversation_id: int, messages: list, count: int) -> None:
+    """Append just-stored `messages` to the cached window.
+
+    Runs inside the writing transaction, after the counter update: the
+    conversation row (on SQLite the database) is locked until the commit,
+    so writers of one conversation update the window one at a time, also
+    across workers. `count` is the counter after this write; a cached
+    window that does not end where this write started missed a write
+    (e.g. a fill in another worker that raced a commit) and is dropped.
+    """
+    window = cache.get_window(conversation_id)
+    if window is None:
+        return
+    if count is None or window["count"] != count - len(messages):
+        cache.invalidate_window(conversation_id)
+        return
+    cache.set_window(conversation_id, {
+        "messages": (window["messages"] + [message_to_dto(m) for m in messages])[-WINDOW_SIZE:],
+        "count": count,
+    })
 
 
 def add_user_message(
@@ -23,12 +138,14 @@ def add_user_message(
     msg = Message(
         conversation_id=conversation_id,
         role="user",
-        content=content
+        content=content,
+        token_count=count_tokens(content)
     )
     db.add(msg)
+    db.execute(_increment_message_count(conversation_id))
     db.commit()
     db.refresh(msg)
-    cache.invalidate_conversation(conversation_id)
+    cache.invalidate_window(conversation_id)
     return msg
 
 
@@ -40,86 +157,402 @@ def add_assistant_message(
     msg = Message(
         conversation_id=conversation_id,
         role="assistant",
-        content=content
+        content=content,
+        token_count=count_tokens(content)
     )
     db.add(msg)
+    db.execute(_increment_message_count(conversation_id))
     db.commit()
     db.refresh(msg)
-    cache.invalidate_conversation(conversation_id)
+    cache.invalidate_window(conversation_id)
     return msg
 
 
-async def process_user_message(
-    db: Session,
-    conversation_id: int,
-    user_content: str
-):
-    # 1. Fetch conversation
-    conversation = (
-        db.query(Conversation)
-        .filter(Conversation.id == conversation_id)
-        .first()
+def new_message(conversation_id: int, role: str, content: str) -> Message:
+    """Unsaved message with its token count and a client-side `created_at`."""
+    return Message(
+        conversation_id=conversation_id,
+        role=role,
+        content=content,
+        token_count=count_tokens(content),
+        created_at=utcnow()
     )
 
-    if not conversation:
-        return None
 
-    # 2. Store user message
-    add_user_message(db, conversation_id, user_content)
+async def persist_messages(db: AsyncSession, conversation_id: int, messages: list) -> list:
+    """Store `messages` and bump the counter in one short transaction.
 
-    db.refresh(conversation)
-    messages = conversation.messages
+    The cached window is updated before the commit (`_write_through`).
+    With `GROUP_COMMIT` the write joins the next batch of the group-commit
+    writer instead, without the window lock so writes to one conversation
+    can share a batch; the window is dropped afterwards, once any fill that
+    read it before the commit is done. `created_at` is set client-side and
+    the id comes back from the insert, so nothing is re-read.
+    """
+    if GROUP_COMMIT:
+        try:
+            await group_writer.write(messages)
+        finally:
+            async with _window_lock(conversation_id):
+                cache.invalidate_window(conversation_id)
+        return messages
+
+    async with _window_lock(conversation_id):
+        db.add_all(messages)
+        await db.flush()  # the window needs the ids
+        count = await db.scalar(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(message_count=Conversation.message_count + len(messages))
+            .returning(Conversation.message_count)
+        )
+        _write_through(conversation_id, messages, count)
+        try:
+            await db.commit()
+        except BaseException:
+            cache.invalidate_window(conversation_id)
+            raise
+    return messages
 
-    # 3. Summary-based context trimming
-    if len(messages) > MAX_RAW_MESSAGES:
-        old_messages = messages[:-MAX_RAW_MESSAGES]
 
-        summary = await summarize_messages(old_messages)
-        conversation.summary = summary
-        db.commit()
-        cache.invalidate_conversation(conversation_id)
+async def add_user_message_async(
+    db: AsyncSession,
+    conversation_id: int,
+    content: str
+) -> Message:
+    return (await persist_messages(db, conversation_id, [new_message(conversation_id, "user", content)]))[0]
 
-        recent_messages = messages[-MAX_RAW_MESSAGES:]
-    else:
-        recent_messages = messages
 
-    # 4. Retrieve RAG context (conversation-scoped)
-    context_chunks = None
-    if conversation.mode == "rag":
-        document_ids = (
-            db.query(ConversationDocument.document_id)
-            .filter(
-                ConversationDocument.conversation_id == conversation_id
-            )
-            .all()
-        )
+async def add_assistant_message_async(
+    db: AsyncSession,
+    conversation_id: int,
+    content: str
+) -> Message:
+    return (await persist_messages(db, conversation_id, [new_message(conversation_id, "assistant", content)]))[0]
+
+
+async def summarize_evicted_messages(conversation_id: int) -> None:
+    """Fold messages that left the raw window into `Conversation.summary`.
 
-        document_ids = [d[0] for d in document_ids]
+    Only messages newer than the stored watermark (`summarized_until_id`)
+    are sent to the LLM, together with the existing summary. Runs on the
+    background queue. No connection is held during the LLM call: the
+    inputs are read in one short session and the result is written in
+    another, only if the watermark has not moved in between. A failed or
+    shed call leaves summary and watermark as they were, so a later turn
+    retries it.
+    """
+    async with AsyncSessionLocal() as db:
+        conversation = await db.get(Conversation, conversation_id)
+        if not conversation:
+            return
 
-        if document_ids:
-            documents = (
-                db.query(Document)
-                .filter(Document.id.in_(document_ids))
-                .all()
+        # oldest message still inside the raw window
+        window_start = await db.scalar(
+            select(Message.id)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .offset(MAX_RAW_MESSAGES - 1)
+            .limit(1)
+        )
+        if window_start is None:
+            return
+
+        watermark = conversation.summarized_until_id
+        evicted = (await db.scalars(
+            select(Message)
+            .where(
+                Message.conversation_id == conversation_id,
+                Message.id > (watermark or 0),
+                Message.id < window_start
             )
+            .order_by(Message.id)
+            .limit(SUMMARY_MAX_BATCH)
+        )).all()
+        if not evicted:
+            return
+        snapshot = conversation_to_dto(conversation)
+
+    try:
+        async with llm_scheduler.slot(snapshot["user_id"], BACKGROUND):
+            with metrics.span("summarize"):
+                summary = await summarize_messages(evicted, snapshot["summary"])
+    except SchedulerOverloaded:
+        # the watermark did not move, so the next turn schedules it again
+        logger.info("Summary of conversation %s shed by the LLM scheduler", conversation_id)
+        return
+    except Exception:
+        logger.exception("Summary of conversation %s failed; keeping the previous one", conversation_id)
+        return
 
-            context_chunks = retrieve_relevant_chunks(
-                documents,
-                user_content,
-                top_k=2
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(Conversation)
+            .where(
+                Conversation.id == conversation_id,
+                Conversation.summarized_until_id.is_(None) if watermark is None
+                else Conversation.summarized_until_id == watermark
             )
+            .values(summary=summary, summarized_until_id=evicted[-1].id)
+        )
+        await db.commit()
+    if not result.rowcount:
+        logger.info("Summary of conversation %s was updated concurrently; dropping this pass", conversation_id)
+        return
 
-    # 5. Async LLM call (open or rag)
-    assistant_reply = await call_llm(
-        conversation=conversation,
-        recent_messages=recent_messages,
-        user_message=user_content,
-        context_chunks=context_chunks
+    snapshot.update(summary=summary, summarized_until_id=evicted[-1].id)
+    cache.set_conversation(conversation_id, snapshot)
+    logger.info(
+        "Folded %d messages into summary of conversation %s", len(evicted), conversation_id
     )
 
-    # 6. Store assistant response
-    return add_assistant_message(
-        db,
-        conversation_id,
-        assistant_reply
+    if len(evicted) == SUMMARY_MAX_BATCH:
+        schedule_summary(conversation_id)
+
+
+def schedule_summary(conversation_id: int) -> None:
+    """Queue an incremental summary pass (coalesced per conversation)."""
+    background_queue.submit(
+        lambda: summarize_evicted_messages(conversation_id),
+        key=("summary", conversation_id)
     )
+
+
+async def _load_history(conversation_id: int):
+    with metrics.span("history"):
+        async with AsyncSessionLocal() as db:
+            return await load_window(db, conversation_id)
+
+
+async def retrieve_context(conversation, user_content: str):
+    """RAG context for the turn (None outside rag mode), on its own session."""
+    if conversation.mode != "rag":
+        return None
+
+    with metrics.span("retrieve"):
+        async with AsyncSessionLocal() as db:
+            document_ids = (await db.scalars(
+                select(ConversationDocument.document_id)
+                .join(Document, Document.id == ConversationDocument.document_id)
+                .where(
+                    ConversationDocument.conversation_id == conversation.id,
+                    Document.status == "ready"
+                )
+            )).all()
+            if not document_ids:
+                return None
+
+            if not wants_summary(user_content):
+                # retrieval is written against the sync ORM API; run_sync
+                # executes it on this session's async connection
+                chunks = await db.run_sync(
+                    retrieve_relevant_chunks,
+                    document_ids,
+                    user_content,
+                    top_k=2
+                )
+                await db.commit()
+                return chunks
+
+        # whole-document requests get stored map-reduce summaries instead
+        # of raw chunks; no connection is held while they are built
+        try:
+            return await summarize_documents(document_ids, conversation.user_id)
+        except Exception:
+            logger.exception("Could not summarize documents of conversation %s", conversation.id)
+
+        # answer from the leading chunks instead
+        async with AsyncSessionLocal() as db:
+            chunks = await db.run_sync(retrieve_relevant_chunks, document_ids, user_content, top_k=2)
+            await db.commit()
+            return chunks
+
+
+def _without(messages, count: int, msg: Message):
+    """Drop `msg` from a loaded window if the load already saw it."""
+    if msg.id is not None and any(m.id == msg.id for m in messages):
+        return [m for m in messages if m.id != msg.id], count - 1
+    return messages, count
+
+
+async def _persist_user_message(msg: Message) -> Message:
+    """Store the user message on its own session."""
+    with metrics.span("persist"):
+        async with AsyncSessionLocal() as db:
+            await persist_messages(db, msg.conversation_id, [msg])
+    return msg
+
+
+async def _prepare_turn(
+    db: AsyncSession,
+    conversation_id: int,
+    user_content: str
+):
+    """Gather everything the LLM call needs, overlapping independent work.
+
+    Once the conversation is known, loading the history window, RAG
+    retrieval and storing the user message run concurrently, each on its
+    own session; only the first two are inputs to the LLM call, so the
+    write is left running and awaited when the reply is stored.
+
+    Returns `(conversation, recent_messages, context_chunks, pending,
+    persisting)` or None when the conversation does not exist. `persisting`
+    is the task storing the user message; in unit-of-work mode it is None
+    and `pending` is stored together with the reply, so the turn commits
+    once.
+    """
+    with metrics.span("prepare"):
+        # 1. Fetch conversation (cached snapshot)
+        with metrics.span("conversation"):
+            conversation = await get_conversation_async(db, conversation_id)
+            # release the request session's connection for the rest of the turn
+            await db.commit()
+
+        if not conversation:
+            return None
+
+        # 2. History, retrieval and the user message write, concurrently
+        pending = new_message(conversation_id, "user", user_content)
+        history = asyncio.ensure_future(_load_history(conversation_id))
+        persisting = None
+        if not TURN_UNIT_OF_WORK:
+            persisting = asyncio.ensure_future(_persist_user_message(pending))
+        try:
+            (messages, count), context_chunks = await asyncio.gather(
+                history, retrieve_context(conversation, user_content)
+            )
+        except BaseException:
+            if persisting is not None:
+                await asyncio.gather(persisting, return_exceptions=True)
+            raise
+        messages, count = _without(messages, count, pending)
+        messages, count = messages + [pending], count + 1
+
+    # 3. Summary-based context trimming: the newest evicted message not yet
+    # folded into the summary triggers a background pass
+    recent_messages = messages[-MAX_RAW_MESSAGES:]
+    if count > MAX_RAW_MESSAGES and len(messages) > MAX_RAW_MESSAGES:
+        newest_evicted = messages[-MAX_RAW_MESSAGES - 1]
+        if newest_evicted.id > (conversation.summarized_until_id or 0):
+            schedule_summary(conversation_id)
+
+    # the new user message is sent separately by build_llm_messages
+    return conversation, recent_messages[:-1], context_chunks, pending, persisting
+
+
+async def _store_reply(db: AsyncSession, conversation_id: int, reply: str, pending=None, persisting=None) -> Message:
+    messages = []
+    if persisting is not None:
+        await persisting
+    elif pending is not None:
+        messages.append(pending)
+    messages.append(new_message(conversation_id, "assistant", reply))
+    return (await persist_messages(db, conversation_id, messages))[-1]
+
+
+async def _settle(persisting) -> None:
+    """Wait for the user message write of a turn whose reply failed."""
+    if persisting is not None:
+        await asyncio.gather(persisting, return_exceptions=True)
+
+
+async def _discard(persisting) -> None:
+    """Delete the user message of a turn that was shed before the LLM call.
+
+    The message is written while the turn is prepared, before the turn has
+    a scheduler slot; a 429 must not leave it in the history unanswered.
+    """
+    if persisting is None:
+        return
+    msg = (await asyncio.gather(persisting, return_exceptions=True))[0]
+    if isinstance(msg, BaseException) or msg.id is None:
+        return
+    async with _window_lock(msg.conversation_id), AsyncSessionLocal() as db:
+        await db.execute(delete(Message).where(Message.id == msg.id))
+        await db.execute(
+            update(Conversation)
+            .where(Conversation.id == msg.conversation_id)
+            .values(message_count=Conversation.message_count - 1)
+        )
+        await db.commit()
+        cache.invalidate_window(msg.conversation_id)
+
+
+async def process_user_message(
+    db: AsyncSession,
+    conversation_id: int,
+    user_content: str
+):
+    turn = await _prepare_turn(db, conversation_id, user_content)
+    if turn is None:
+        return None
+    conversation, recent_messages, context_chunks, pending, persisting = turn
+
+    # 3. Async LLM call (open or rag) in a fair-share scheduler slot,
+    # overlapping the user message write
+    try:
+        async with llm_scheduler.slot(conversation.user_id, INTERACTIVE):
+            with metrics.span("llm"):
+                assistant_reply = await call_llm(
+                    conversation=conversation,
+                    recent_messages=recent_messages,
+                    user_message=user_content,
+                    context_chunks=context_chunks
+                )
+    except SchedulerOverloaded:
+        await _discard(persisting)
+        raise
+    except BaseException:
+        await _settle(persisting)
+        raise
+
+    # 4. Store assistant response
+    with metrics.span("db"):
+        return await _store_reply(db, conversation_id, assistant_reply, pending, persisting)
+
+
+async def process_user_message_stream(
+    db: AsyncSession,
+    conversation_id: int,
+    user_content: str
+):
+    """Streaming variant of `process_user_message`.
+
+    Yields `("token", text)` pairs as the provider produces them, then a
+    final `("done", Message)` once the full reply has been persisted.
+    """
+    turn = await _prepare_turn(db, conversation_id, user_content)
+    if turn is None:
+        return
+    conversation, recent_messages, context_chunks, pending, persisting = turn
+
+    parts = []
+    started = time.perf_counter()
+    try:
+        # the slot is released when the provider finishes, not when the
+        # client has read the last token
+        async for piece in llm_scheduler.stream(
+            stream_llm(
+                conversation=conversation,
+                recent_messages=recent_messages,
+                user_message=user_content,
+                context_chunks=context_chunks
+            ),
+            conversation.user_id,
+            INTERACTIVE
+        ):
+            if not parts:
+                metrics.SPAN_LATENCY.observe(time.perf_counter() - started, span="llm_first_token")
+            parts.append(piece)
+            yield "token", piece
+    except SchedulerOverloaded:
+        await _discard(persisting)
+        raise
+    except BaseException:
+        await _settle(persisting)
+        raise
+    metrics.SPAN_LATENCY.observe(time.perf_counter() - started, span="llm")
+
+    with metrics.span("db"):
+        assistant_msg = await _store_reply(db, conversation_id, "".join(parts), pending, persisting)
+    yield "done", assistant_msg
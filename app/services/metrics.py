@@ -0,0 +1,252 @@
+"""Request timing, spans and Prometheus-format metrics.
+
+A small in-process registry (no client library needed) of counters,
+histograms and scrape-time gauges, rendered in the Prometheus text format
+by `GET /metrics`.
+
+`span(name)` times a block of work into `botgpt_span_duration_seconds` and,
+while a request is being handled, also records it for that request so
+`TimingMiddleware` can emit a `Server-Timing` header
+(`METRICS_SERVER_TIMING=1`). Spans use a context variable, so they follow
+the request into awaited coroutines and tasks it creates.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+import os
+import threading
+import time
+
+SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _SpanList(list):
+    """(name, seconds) spans of one request; closed once the request ends."""
+
+    closed = False
+
+
+# spans of the request being handled, if any. Tasks started by a request
+# inherit it, so `span` checks `closed` to stop recording after the request
+_request_spans: ContextVar[Optional[_SpanList]] = ContextVar("request_spans", default=None)
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(n, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for n, v in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labels)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, description, labels)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[:-1]) if series else 0
+
+    def render(self) -> list:
+        lines = self.header()
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labels + ('le',), key + (le,))} {cumulative}"
+                )
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value read at scrape time from `collect()` -> {label values tuple: value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name, description, collect: Callable[[], dict], labels=()):
+        super().__init__(name, description, labels)
+        self.collect = collect
+
+    def render(self) -> list:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labels, key)} {value}"
+            for key, value in sorted(self.collect().items())
+        ]
+
+
+_REGISTRY = []
+
+
+def register(metric):
+    _REGISTRY.append(metric)
+    return metric
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _REGISTRY:
+        try:
+            lines.extend(metric.render())
+        except Exception:
+            # a broken gauge callback must not take the endpoint down
+            continue
+    return "\n".join(lines) + "\n"
+
+
+HTTP_REQUESTS = register(Counter(
+    "botgpt_http_requests_total", "HTTP requests handled", ("method", "route", "status")
+))
+HTTP_LATENCY = register(Histogram(
+    "botgpt_http_request_duration_seconds", "HTTP request latency", ("method", "route")
+))
+SPAN_LATENCY = register(Histogram(
+    "botgpt_span_duration_seconds", "Latency of instrumented phases", ("span",)
+))
+LLM_TOKENS = register(Counter(
+    "botgpt_llm_tokens_total", "Tokens sent to and received from the LLM provider", ("kind",)
+))
+LLM_QUEUE_WAIT = register(Histogram(
+    "botgpt_llm_queue_wait_seconds", "Time LLM calls waited for a scheduler slot", ("priority",)
+))
+LLM_SHED = register(Counter(
+    "botgpt_llm_shed_total", "LLM calls rejected because the scheduler queue was full", ("priority",)
+))
+LLM_ROUTES = register(Counter(
+    "botgpt_llm_routes_total", "LLM requests per model tier and routing reason", ("tier", "reason")
+))
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block as phase `name`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        SPAN_LATENCY.observe(elapsed, span=name)
+        spans = _request_spans.get()
+        if spans is not None and not spans.closed:
+            spans.append((name, elapsed))
+
+
+def server_timing(spans, total: float) -> str:
+    """`Server-Timing` header value; repeated spans are summed."""
+    durations = {}
+    for name, seconds in spans:
+        durations[name] = durations.get(name, 0.0) + seconds
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class TimingMiddleware:
+    """ASGI middleware recording latency per route and collecting spans.
+
+    Latency is measured until the last body chunk is sent, so streamed
+    responses are counted in full; `Server-Timing` (when enabled) can only
+    include the spans finished before the headers went out.
+    """
+
+    def __init__(self, app, server_timing_header: bool = None):
+        self.app = app
+        self.server_timing_header = server_timing_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        add_header = SERVER_TIMING if self.server_timing_header is None else self.server_timing_header
+        spans = _SpanList()
+        token = _request_spans.set(spans)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if add_header:
+                    header = server_timing(spans, time.perf_counter() - started)
+                    message = dict(message)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", header.encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            spans.closed = True
+            _request_spans.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_LATENCY.observe(time.perf_counter() - started, method=method, route=path)
+            HTTP_REQUESTS.inc(method=method, route=path, status=str(status["code"]))
@@ -0,0 +1,149 @@
+"""Latency-aware model routing.
+
+Each LLM request is sent to one of two tiers:
+
+- `primary`: the large chat model (`LLM_PRIMARY_MODEL`)
+- `fast`: a small model (`LLM_FAST_MODEL`) for cheap work: summaries of
+  evicted history and short open-mode chat turns whose whole prompt fits in
+  `ROUTER_FAST_PROMPT_TOKENS`
+
+Latency and errors of the last `ROUTER_WINDOW` calls are kept per tier;
+samples older than `ROUTER_SAMPLE_TTL` seconds are dropped. Once the
+primary has `ROUTER_MIN_SAMPLES` recent samples and its p95 exceeds
+`ROUTER_PRIMARY_P95` seconds (or its error rate exceeds
+`ROUTER_MAX_ERROR_RATE`), requests that would go to it are sent to the fast
+tier. Every `ROUTER_PROBE_EVERY`-th of those still goes to the primary as a
+probe, and old samples age out, so the primary gets its traffic back once
+it recovers. A call that fails on one tier is retried once on the other.
+
+Tiers use the default provider from `llm_service` unless one is set with
+`set_provider` (tests and benchmarks use fake providers with different
+latencies).
+"""
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+import itertools
+import math
+import os
+import threading
+import time
+
+from app.services import metrics
+from app.services.llm_providers import LLMProvider
+
+LLM_PRIMARY_MODEL = os.getenv("LLM_PRIMARY_MODEL", "llama-3.3-70b-versatile")
+LLM_PRIMARY_MAX_TOKENS = int(os.getenv("LLM_PRIMARY_MAX_TOKENS", "512"))
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "llama-3.1-8b-instant")
+LLM_FAST_MAX_TOKENS = int(os.getenv("LLM_FAST_MAX_TOKENS", "256"))
+
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "1").lower() in ("1", "true", "yes")
+ROUTER_FAST_PROMPT_TOKENS = int(os.getenv("ROUTER_FAST_PROMPT_TOKENS", "120"))
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "100"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "20"))
+ROUTER_PRIMARY_P95 = float(os.getenv("ROUTER_PRIMARY_P95", "10"))
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.25"))
+ROUTER_SAMPLE_TTL = float(os.getenv("ROUTER_SAMPLE_TTL", "60"))
+ROUTER_PROBE_EVERY = int(os.getenv("ROUTER_PROBE_EVERY", "10"))
+
+PRIMARY = "primary"
+FAST = "fast"
+
+
+@dataclass
+class Tier:
+    name: str
+    model: str
+    max_tokens: int
+    provider: Optional[LLMProvider] = None
+    # (recorded at, seconds, ok) of the most recent calls
+    samples: deque = field(default_factory=lambda: deque(maxlen=ROUTER_WINDOW))
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.samples.append((time.monotonic(), seconds, ok))
+
+    def recent(self) -> list:
+        """`(seconds, ok)` of the samples younger than `ROUTER_SAMPLE_TTL`."""
+        cutoff = time.monotonic() - ROUTER_SAMPLE_TTL
+        with self._lock:
+            while self.samples and self.samples[0][0] < cutoff:
+                self.samples.popleft()
+            return [(seconds, ok) for _, seconds, ok in self.samples]
+
+    def p95(self) -> float:
+        latencies = sorted(s for s, _ in self.recent())
+        if not latencies:
+            return 0.0
+        return latencies[max(math.ceil(0.95 * len(latencies)), 1) - 1]
+
+    def error_rate(self) -> float:
+        samples = self.recent()
+        if not samples:
+            return 0.0
+        return sum(1 for _, ok in samples if not ok) / len(samples)
+
+
+class ModelRouter:
+    def __init__(self, tiers, enabled: bool = ROUTER_ENABLED):
+        self.tiers = {tier.name: tier for tier in tiers}
+        self.enabled = enabled
+        self._diverted = itertools.count(1)
+
+    def set_provider(self, tier: str, provider: Optional[LLMProvider]) -> None:
+        self.tiers[tier].provider = provider
+
+    def degraded(self, tier: str) -> bool:
+        """Whether `tier` has enough recent samples and misses its SLO."""
+        stats = self.tiers[tier]
+        if len(stats.recent()) < ROUTER_MIN_SAMPLES:
+            return False
+        return stats.p95() > ROUTER_PRIMARY_P95 or stats.error_rate() > ROUTER_MAX_ERROR_RATE
+
+    def choose(self, task: str = "chat", prompt_tokens: int = 0, mode: str = None) -> Tier:
+        """Pick the tier for a request from its task, prompt size and mode."""
+        if not self.enabled:
+            tier, reason = PRIMARY, "disabled"
+        elif task == "summary":
+            tier, reason = FAST, "summary"
+        elif mode != "rag" and prompt_tokens <= ROUTER_FAST_PROMPT_TOKENS:
+            tier, reason = FAST, "short_prompt"
+        elif self.degraded(PRIMARY):
+            if ROUTER_PROBE_EVERY > 0 and next(self._diverted) % ROUTER_PROBE_EVERY == 0:
+                tier, reason = PRIMARY, "probe"
+            else:
+                tier, reason = FAST, "primary_degraded"
+        else:
+            tier, reason = PRIMARY, "default"
+        metrics.LLM_ROUTES.inc(tier=tier, reason=reason)
+        return self.tiers[tier]
+
+    def fallback(self, tier: Tier) -> Optional[Tier]:
+        """The tier to retry on when a call to `tier` fails."""
+        if not self.enabled:
+            return None
+        other = FAST if tier.name == PRIMARY else PRIMARY
+        metrics.LLM_ROUTES.inc(tier=other, reason="failover")
+        return self.tiers[other]
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "model": tier.model,
+                "samples": len(tier.recent()),
+                "p95": tier.p95(),
+                "error_rate": tier.error_rate(),
+            }
+            for name, tier in self.tiers.items()
+        }
+
+    def reset(self) -> None:
+        for tier in self.tiers.values():
+            tier.samples.clear()
+
+
+model_router = ModelRouter([
+    Tier(PRIMARY, LLM_PRIMARY_MODEL, LLM_PRIMARY_MAX_TOKENS),
+    Tier(FAST, LLM_FAST_MODEL, LLM_FAST_MAX_TOKENS),
+])
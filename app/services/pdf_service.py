@@ -1,11 +1,128 @@
+"""PDF text extraction.
+
+`iter_pdf_pages` yields text one page at a time so callers can chunk and
+index while the rest of the file is still being parsed. Large files given
+by path are split into page ranges that worker processes extract in
+parallel; results are still yielded in page order with a bounded number of
+ranges in flight. The workers form one pool per process, created on first
+use and reused for every file (`shutdown` stops it).
+
+Configuration (environment):
+- `PDF_MAX_BYTES` largest accepted upload (default 50 MiB)
+- `PDF_MAX_PAGES` largest accepted page count (default 500)
+- `PDF_EXTRACT_WORKERS` processes for page-parallel extraction (default 2, 1 = off)
+- `PDF_PARALLEL_MIN_PAGES` page count from which extraction goes parallel (default 64)
+- `PDF_PAGE_BATCH` pages per worker task (default 16)
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+import multiprocessing
+import os
+
 from pypdf import PdfReader
 
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(50 * 1024 * 1024)))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "500"))
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "2"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_PAGE_BATCH = int(os.getenv("PDF_PAGE_BATCH", "16"))
 
-def extract_text_from_pdf(file) -> str:
-    reader = PdfReader(file)
-    text = ""
+
+class PDFLimitError(ValueError):
+    """Raised when a PDF exceeds the configured size or page limits."""
+
+
+def check_pdf_size(path: str) -> int:
+    """Return the file size of `path`, raising if it exceeds `PDF_MAX_BYTES`."""
+    size = os.path.getsize(path)
+    if size > PDF_MAX_BYTES:
+        raise PDFLimitError(f"PDF is {size} bytes; the limit is {PDF_MAX_BYTES}")
+    return size
+
+
+def _extract_pages(path: str, start: int, stop: int) -> list:
+    """Worker entry point: text of pages `start..stop-1` of the PDF at `path`."""
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+_POOL: Optional[ProcessPoolExecutor] = None
+
+
+def _pool(workers: int) -> ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _POOL
+
+
+def shutdown() -> None:
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(wait=True, cancel_futures=True)
+        _POOL = None
+
+
+def _iter_parallel(path: str, page_count: int, workers: int, batch: int) -> Iterator[str]:
+    pool = _pool(workers)
+    starts = iter(range(0, page_count, batch))
+    pending = deque()
+
+    def submit_next() -> None:
+        start = next(starts, None)
+        if start is not None:
+            pending.append(pool.submit(_extract_pages, path, start, min(start + batch, page_count)))
+
+    try:
+        # keep each worker busy with one range queued behind it
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            texts = pending.popleft().result()
+            submit_next()
+            yield from texts
+    finally:
+        # the pool is shared: only drop this file's outstanding ranges
+        for future in pending:
+            future.cancel()
+
+
+def _open(source):
+    if isinstance(source, (str, os.PathLike)):
+        check_pdf_size(source)
+
+    reader = PdfReader(source)
+    page_count = len(reader.pages)
+    if page_count > PDF_MAX_PAGES:
+        raise PDFLimitError(f"PDF has {page_count} pages; the limit is {PDF_MAX_PAGES}")
+    return reader, page_count
+
+
+def count_pdf_pages(source) -> int:
+    """Page count of `source`, enforcing the byte and page limits."""
+    return _open(source)[1]
+
+
+def iter_pdf_pages(source, workers: int = None) -> Iterator[str]:
+    """Yield the text of each page of `source` (a path or binary file).
+
+    Raises `PDFLimitError` for files over the byte or page limits.
+    """
+    reader, page_count = _open(source)
+
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    if workers > 1 and page_count >= PDF_PARALLEL_MIN_PAGES and isinstance(source, (str, os.PathLike)):
+        del reader
+        yield from _iter_parallel(os.fspath(source), page_count, workers, max(PDF_PAGE_BATCH, 1))
+        return
 
     for page in reader.pages:
-        text += page.extract_text() or ""
+        yield page.extract_text() or ""
+
 
-    return text.strip()
+def extract_text_from_pdf(file) -> str:
+    return "\n".join(iter_pdf_pages(file)).strip()
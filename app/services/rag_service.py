@@ -1,24 +1,264 @@
-def retrieve_relevant_chunks(documents, query, top_k=2):
-    """Return up to `top_k` document chunks relevant to `query`.
+"""Chunked BM25 retrieval over conversation documents.
+
+Documents are split into overlapping word windows once, at upload time
+(`index_document`). Each chunk's term frequencies are written to the
+`chunk_postings` inverted index, and per-document chunk statistics are kept
+on `Document`, so a query only reads the postings of its own terms instead
+of scanning document bodies.
+
+`retrieve_relevant_chunks` fuses the BM25 ranking with the semantic ranking from
+`embedding_service` using reciprocal rank fusion; `RAG_RETRIEVAL` selects
+`hybrid` (default), `lexical` or `semantic`.
+"""
+from collections import Counter, defaultdict
+import logging
+import math
+import os
+import re
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import Session
+
+from app.models.document import Document
+from app.models.document_chunk import DocumentChunk
+from app.models.chunk_posting import ChunkPosting
+from app.services.blob_service import load_text
+from app.services.embedding_service import search_chunks
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", "200"))  # words per chunk
+CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "40"))  # words shared by neighbours
+SUMMARY_CHUNKS = int(os.getenv("RAG_SUMMARY_CHUNKS", "8"))  # leading chunks for summary requests
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL", "hybrid")  # hybrid | lexical | semantic
+INDEX_BATCH = int(os.getenv("RAG_INDEX_BATCH", "64"))  # chunks written per flush
+RRF_K = 60  # reciprocal rank fusion damping constant
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its me my of on "
+    "or our so that the their this to was we what when where which who why will "
+    "with you your".split()
+)
+
+
+def tokenize(text: str) -> list:
+    """Lowercase `text` and return its indexable terms."""
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in _STOPWORDS]
+
+
+def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list:
+    """Split `text` into windows of `size` words overlapping by `overlap`."""
+    words = (text or "").split()
+    if not words:
+        return []
+
+    step = max(size - overlap, 1)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + size]))
+        if start + size >= len(words):
+            break
+    return chunks
+
+
+def iter_chunks(texts, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+    """Streaming `chunk_text` over an iterable of texts (e.g. PDF pages).
+
+    Yields the same windows `chunk_text` would for the joined text while
+    holding at most one window of words.
+    """
+    step = max(size - overlap, 1)
+    buffer = []
+    for text in texts:
+        buffer.extend((text or "").split())
+        # a window is final once words beyond it have arrived
+        while len(buffer) > size:
+            yield " ".join(buffer[:size])
+            del buffer[:step]
+    if buffer:
+        yield " ".join(buffer[:size])
+
+
+def _write_chunks(db: Session, document: Document, texts, start: int) -> int:
+    chunks = []
+    for position, text in enumerate(texts, start=start):
+        terms = Counter(tokenize(text))
+        chunk = DocumentChunk(
+            document_id=document.id,
+            position=position,
+            content=text,
+            length=sum(terms.values())
+        )
+        chunks.append((chunk, terms))
+
+    db.add_all([chunk for chunk, _ in chunks])
+    db.flush()
+
+    db.bulk_insert_mappings(ChunkPosting, [
+        {"term": term, "chunk_id": chunk.id, "document_id": document.id, "tf": tf}
+        for chunk, terms in chunks
+        for term, tf in terms.items()
+    ])
+    return sum(chunk.length for chunk, _ in chunks)
+
+
+def index_document(db: Session, document: Document, chunks=None) -> int:
+    """Write the chunks and postings of `document`.
+
+    `chunks` defaults to chunking the stored body; any iterable works,
+    e.g. `iter_chunks` over streamed pages, and is written in batches of
+    `RAG_INDEX_BATCH` so memory stays bounded. Returns the number of chunks
+    created. The caller owns the transaction.
+    """
+    if chunks is None:
+        chunks = chunk_text(load_text(db, document.id) or "")
+
+    count = 0
+    total_length = 0
+    batch = []
+    for text in chunks:
+        batch.append(text)
+        if len(batch) >= INDEX_BATCH:
+            total_length += _write_chunks(db, document, batch, count)
+            count += len(batch)
+            batch = []
+    if batch:
+        total_length += _write_chunks(db, document, batch, count)
+        count += len(batch)
+
+    document.chunk_count = count
+    document.total_length = total_length
+    logger.info("Indexed document %s into %d chunks", document.id, count)
+    return count
+
+
+def _ensure_indexed(db: Session, document_ids) -> None:
+    """Index documents stored before chunking existed."""
+    pending = (
+        db.query(Document)
+        .filter(Document.id.in_(document_ids), Document.chunk_count.is_(None))
+        .all()
+    )
+    for document in pending:
+        index_document(db, document)
+    if pending:
+        db.commit()
+
+
+def _leading_chunks(db: Session, document_ids, limit: int) -> list:
+    rows = (
+        db.query(DocumentChunk.content)
+        .filter(DocumentChunk.document_id.in_(document_ids))
+        .order_by(DocumentChunk.document_id, DocumentChunk.position)
+        .limit(limit)
+        .all()
+    )
+    return [r[0] for r in rows]
+
+
+def _bm25_rank(db: Session, document_ids, terms, limit: int) -> list:
+    """Return `[(document_id, position)]` of the best BM25 chunks."""
+    n_chunks, total_length = (
+        db.query(func.sum(Document.chunk_count), func.sum(Document.total_length))
+        .filter(Document.id.in_(document_ids))
+        .one()
+    )
+    if not n_chunks:
+        return []
+    avg_length = (total_length or 0) / n_chunks or 1.0
+
+    postings = (
+        db.query(
+            ChunkPosting.term,
+            ChunkPosting.tf,
+            DocumentChunk.document_id,
+            DocumentChunk.position,
+            DocumentChunk.length
+        )
+        .join(DocumentChunk, DocumentChunk.id == ChunkPosting.chunk_id)
+        .filter(ChunkPosting.term.in_(terms), ChunkPosting.document_id.in_(document_ids))
+        .all()
+    )
+
+    by_term = defaultdict(list)
+    for term, tf, document_id, position, length in postings:
+        by_term[term].append(((document_id, position), tf, length))
+
+    scores = defaultdict(float)
+    for term, hits in by_term.items():
+        df = len(hits)
+        idf = math.log(1 + (n_chunks - df + 0.5) / (df + 0.5))
+        for key, tf, length in hits:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            scores[key] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+    return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+
+def _fuse(rankings, limit: int) -> list:
+    """Reciprocal rank fusion of several best-first key lists."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] += 1.0 / (RRF_K + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+
+def _chunk_contents(db: Session, keys) -> list:
+    if not keys:
+        return []
+    rows = (
+        db.query(DocumentChunk.document_id, DocumentChunk.position, DocumentChunk.content)
+        .filter(tuple_(DocumentChunk.document_id, DocumentChunk.position).in_(keys))
+        .all()
+    )
+    contents = {(d, p): c for d, p, c in rows}
+    return [contents[key] for key in keys if key in contents]
+
+
+def wants_summary(query) -> bool:
+    """Whether `query` is a generic summarization request."""
+    return "summar" in (query or "").lower()
+
+
+def retrieve_relevant_chunks(db: Session, document_ids, query, top_k=2, mode=None):
+    """Return up to `top_k` chunk texts from `document_ids` relevant to `query`.
 
     Heuristic behaviours:
     - If the query is a generic summarization request (contains "summar"),
-      return the full document content so the LLM can summarise it.
-    - Otherwise perform a simple substring match to find relevant docs.
+      return the leading chunks of the documents so the LLM can summarise them.
+    - Otherwise rank chunks with BM25, embeddings or both (see `RAG_RETRIEVAL`).
+    - If nothing matches, fall back to the leading chunks.
     """
-    chunks = []
-    query_lower = (query or "").lower()
+    document_ids = list(document_ids)
+    if not document_ids:
+        return []
+
+    _ensure_indexed(db, document_ids)
+
+    if wants_summary(query):
+        return _leading_chunks(db, document_ids, max(top_k, SUMMARY_CHUNKS))
+
+    mode = mode or RETRIEVAL_MODE
+    # over-fetch candidates so fusion has something to agree on
+    candidates = top_k * 4
+    rankings = []
+
+    if mode in ("hybrid", "lexical"):
+        terms = set(tokenize(query))
+        if terms:
+            rankings.append(_bm25_rank(db, document_ids, terms, candidates))
 
-    # If user asked to summarize or provided a very short/generic query,
-    # include full documents so the LLM has material to work with.
-    if "summar" in query_lower or len(query_lower.split()) < 4:
-        for doc in documents:
-            chunks.append(doc.content)
-        return chunks[:top_k]
+    if mode in ("hybrid", "semantic"):
+        hits = search_chunks(db, document_ids, query, top_k=candidates)
+        rankings.append([(d, p) for d, p, _ in hits])
 
-    # Fallback simple relevance by substring match
-    for doc in documents:
-        if query_lower in (doc.content or "").lower():
-            chunks.append(doc.content)
+    best = _fuse(rankings, top_k)
+    if not best:
+        return _leading_chunks(db, document_ids, top_k)
 
-    return chunks[:top_k]
+    return _chunk_contents(db, best)
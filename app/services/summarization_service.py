@@ -6,18 +6,43 @@ Summarize the following conversation briefly.
 Focus on key facts, decisions and context.
 """
 
+INCREMENTAL_SUMMARY_PROMPT = """
+Update the existing conversation summary with the new messages below.
+Keep it brief and focus on key facts, decisions and context.
+"""
+
 
-async def summarize_messages(messages):
+async def summarize_messages(messages, previous_summary=None):
     """Generate a short summary for a list of messages using the async LLM.
 
-    Returns the assistant text as a string.
+    When `previous_summary` is given, only `messages` are sent alongside it
+    and the model folds them into the existing summary.
+
+    Returns the assistant text as a string. Provider errors are raised
+    rather than answered with fallback text, which would be stored as the
+    summary.
     """
     text = "\n".join(f"{m.role}: {m.content}" for m in messages)
 
     # Build a minimal conversation object expected by call_llm
     convo = SimpleNamespace(summary=None, id=None)
     # Combine prompt and text into a single user message
-    user_message = f"{SUMMARY_PROMPT}\n\n{text}"
+    if previous_summary:
+        user_message = (
+            f"{INCREMENTAL_SUMMARY_PROMPT}\n\n"
+            f"Existing summary:\n{previous_summary}\n\nNew messages:\n{text}"
+        )
+    else:
+        user_message = f"{SUMMARY_PROMPT}\n\n{text}"
 
-    reply = await call_llm(convo, recent_messages=[], user_message=user_message)
+    # deterministic temperature so repeated passes over the same window are
+    # served from the LLM response cache; routed to the fast model tier
+    reply = await call_llm(
+        convo,
+        recent_messages=[],
+        user_message=user_message,
+        temperature=0.0,
+        task="summary",
+        fallback=False
+    )
     return reply
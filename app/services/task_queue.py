@@ -0,0 +1,99 @@
+"""In-process background task queue.
+
+Jobs are coroutine factories executed by a few worker tasks on the running
+event loop, so slow work (summaries, ingestion) happens off the request
+path. Jobs submitted with a `key` are coalesced while one with the same key
+is still waiting, and jobs sharing a key never run concurrently.
+
+Workers are started lazily on the first `submit` from a running loop and
+stopped by the application lifespan (`stop`).
+"""
+import asyncio
+import contextvars
+import logging
+import os
+from typing import Awaitable, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", "2"))
+
+
+class TaskQueue:
+    def __init__(self, workers: int = BACKGROUND_WORKERS, name: str = "background"):
+        self.workers = workers
+        self.name = name
+        self._loop = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._waiting = set()
+        self._locks = {}  # key -> (lock, jobs using it)
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # first use, or the previous loop has gone away (e.g. in tests)
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._waiting.clear()
+        self._locks.clear()
+        # a clean context: workers must not inherit the context variables
+        # (e.g. the span list) of the request that happened to start them
+        self._tasks = [
+            loop.create_task(self._worker(), name=f"{self.name}-worker-{i}", context=contextvars.Context())
+            for i in range(self.workers)
+        ]
+
+    def submit(self, job: Callable[[], Awaitable], key: Hashable = None) -> bool:
+        """Queue `job`; returns False if an identical keyed job is already waiting."""
+        self._ensure_started()
+        if key is not None:
+            if key in self._waiting:
+                return False
+            self._waiting.add(key)
+        self._queue.put_nowait((key, job))
+        return True
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def _worker(self) -> None:
+        while True:
+            key, job = await self._queue.get()
+            try:
+                if key is None:
+                    await job()
+                    continue
+                lock, users = self._locks.get(key, (asyncio.Lock(), 0))
+                self._locks[key] = (lock, users + 1)
+                try:
+                    async with lock:
+                        self._waiting.discard(key)
+                        await job()
+                finally:
+                    lock, users = self._locks[key]
+                    if users == 1:
+                        del self._locks[key]
+                    else:
+                        self._locks[key] = (lock, users - 1)
+            except Exception:
+                logger.exception("Background job %r failed", key)
+            finally:
+                self._queue.task_done()
+
+    async def join(self) -> None:
+        """Wait until every queued job has finished."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+        self._queue = None
+
+
+background_queue = TaskQueue()
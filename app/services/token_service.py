@@ -0,0 +1,58 @@
+"""Token counting for prompt budgeting.
+
+Uses `tiktoken` (cl100k_base) when it is installed; otherwise falls back to
+a word-piece heuristic (roughly one token per four characters of each word
+or punctuation mark), which is close enough for budgeting.
+"""
+import logging
+import math
+import re
+
+logger = logging.getLogger(__name__)
+
+# Fixed cost of wrapping one chat message (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # optional dependency (or encoding download failed)
+    _ENCODING = None
+
+
+def _piece_tokens(piece: str) -> int:
+    return max(1, math.ceil(len(piece) / 4))
+
+
+def count_tokens(text: str) -> int:
+    """Return the approximate number of tokens in `text`."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return sum(_piece_tokens(p) for p in _PIECE_RE.findall(text))
+
+
+def message_tokens(content: str, token_count: int = None) -> int:
+    """Tokens used by one chat message, reusing a stored count when present."""
+    if token_count is None:
+        token_count = count_tokens(content)
+    return token_count + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` so that it fits in `max_tokens`."""
+    if max_tokens <= 0 or not text:
+        return ""
+    if _ENCODING is not None:
+        tokens = _ENCODING.encode(text)
+        return text if len(tokens) <= max_tokens else _ENCODING.decode(tokens[:max_tokens])
+
+    used = 0
+    for match in _PIECE_RE.finditer(text):
+        used += _piece_tokens(match.group())
+        if used > max_tokens:
+            return text[:match.start()].rstrip()
+    return text
@@ -0,0 +1,265 @@
+"""Load and latency benchmarks against the real ASGI app.
+
+Requests go through `httpx.ASGITransport` straight into `app.main:app`, so
+routing, validation, the database and background work are all exercised,
+while the LLM is replaced by `FakeProvider` with a configurable latency and
+token pacing. `run.py` is the command line entry point.
+
+Workloads:
+- `long`: each user holds one long conversation (history windowing and
+  background summaries)
+- `rag`: each user uploads a multi-page PDF, waits for ingestion and asks
+  questions about it
+- `concurrent`: many users at once, mixing plain and streamed turns with
+  conversation listing
+"""
+from dataclasses import dataclass, field
+import asyncio
+import json
+import math
+import time
+
+import httpx
+
+from app.services import llm_service
+from app.services.llm_providers import FakeProvider
+from app.services.model_router import FAST, model_router
+from benchmarks.fixtures import make_pdf
+
+WORKLOADS = ("long", "rag", "concurrent")
+
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile of `values` (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+@dataclass
+class Recorder:
+    """Latencies and errors per endpoint label."""
+
+    latencies: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, wall_seconds: float) -> dict:
+        report = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            report[endpoint] = {
+                "requests": len(values),
+                "errors": self.errors.get(endpoint, 0),
+                "rps": round(len(values) / wall_seconds, 2) if wall_seconds else 0.0,
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+            }
+        return report
+
+
+class Session:
+    """One simulated user talking to the app."""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, email: str):
+        self.client = client
+        self.recorder = recorder
+        self.email = email
+        self.headers = {"X-User-Email": email}
+
+    async def request(self, endpoint: str, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        self.recorder.record(endpoint, time.perf_counter() - started, response.status_code < 400)
+        return response
+
+    async def create_conversation(self, mode: str = "open") -> int:
+        response = await self.request(
+            "POST /conversations", "POST", "/conversations",
+            json={"user_email": self.email, "mode": mode}
+        )
+        return response.json()["id"]
+
+    async def send(self, conversation_id: int, content: str) -> None:
+        await self.request(
+            "POST /conversations/{id}/messages", "POST",
+            f"/conversations/{conversation_id}/messages",
+            data={"content": content}, headers=self.headers
+        )
+
+    async def send_stream(self, conversation_id: int, content: str) -> None:
+        # ASGITransport delivers the body in one piece, so this is the full
+        # stream time; time to first token is in /metrics (llm_first_token)
+        await self.request(
+            "POST /conversations/{id}/messages/stream", "POST",
+            f"/conversations/{conversation_id}/messages/stream",
+            data={"content": content}, headers=self.headers
+        )
+
+    async def list_conversations(self) -> None:
+        await self.request(
+            "GET /conversations", "GET", "/conversations",
+            params={"user_email": self.email, "limit": 20}
+        )
+
+    async def upload(self, conversation_id: int, pdf: bytes, poll_interval: float = 0.05) -> None:
+        response = await self.request(
+            "POST /conversations/{id}/documents", "POST",
+            f"/conversations/{conversation_id}/documents",
+            files={"file": ("handbook.pdf", pdf, "application/pdf")}, headers=self.headers
+        )
+        job = response.json()
+        started = time.perf_counter()
+        while job.get("status") not in ("ready", "failed", None):
+            await asyncio.sleep(poll_interval)
+            job = (await self.request(
+                "GET /conversations/{id}/documents/jobs/{job_id}", "GET",
+                f"/conversations/{conversation_id}/documents/jobs/{job['id']}",
+                headers=self.headers
+            )).json()
+        self.recorder.record("ingestion (upload to ready)", time.perf_counter() - started, job.get("status") == "ready")
+
+
+async def _long(session: Session, turns: int, user: int) -> None:
+    conversation_id = await session.create_conversation()
+    for turn in range(turns):
+        await session.send(conversation_id, f"user {user} turn {turn}: tell me more about item {turn}")
+
+
+async def _rag(session: Session, turns: int, user: int) -> None:
+    conversation_id = await session.create_conversation("rag")
+    # distinct bytes per user so content-hash deduplication does not skip ingestion
+    pages = [
+        f"{session.email} handbook page {page}: the policy for topic {page} is option {page * 7 % 5}"
+        for page in range(20)
+    ]
+    await session.upload(conversation_id, make_pdf(*pages))
+    for turn in range(turns):
+        await session.send(conversation_id, f"what is the policy for topic {turn % 20}?")
+
+
+async def _concurrent(session: Session, turns: int, user: int) -> None:
+    conversation_id = await session.create_conversation()
+    for turn in range(turns):
+        if turn % 2:
+            await session.send_stream(conversation_id, f"stream turn {turn}")
+        else:
+            await session.send(conversation_id, f"plain turn {turn}")
+        if turn % 3 == 0:
+            await session.list_conversations()
+
+
+_RUNNERS = {"long": _long, "rag": _rag, "concurrent": _concurrent}
+
+
+async def run_workload(
+    app,
+    workload: str,
+    users: int = 10,
+    turns: int = 10,
+    llm_latency: float = 0.05,
+    token_delay: float = 0.005,
+    run_id: str = None,
+    fast_latency: float = None,
+) -> dict:
+    """Run one workload against `app` and return its per-endpoint report.
+
+    Every user runs concurrently; `turns` is the number of messages each
+    sends. Background work (summaries, ingestion) is drained before the
+    clock stops. `fast_latency` gives the fast model tier its own fake
+    provider; by default both tiers share one.
+    """
+    from app.services.ingestion_service import ingestion_queue
+    from app.services.task_queue import background_queue
+
+    previous = llm_service.get_provider()
+    llm_service.set_provider(FakeProvider(latency=llm_latency, token_delay=token_delay))
+    if fast_latency is not None:
+        model_router.set_provider(FAST, FakeProvider(latency=fast_latency, token_delay=token_delay))
+    recorder = Recorder()
+    run_id = run_id or str(int(time.time() * 1000))
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                _RUNNERS[workload](Session(client, recorder, f"{workload}-{run_id}-{user}@bench.local"), turns, user)
+                for user in range(users)
+            ))
+            await background_queue.join()
+            await ingestion_queue.join()
+            wall = time.perf_counter() - started
+    finally:
+        llm_service.set_provider(previous)
+        model_router.set_provider(FAST, None)
+
+    return {
+        "workload": workload,
+        "users": users,
+        "turns": turns,
+        "llm_latency": llm_latency,
+        "token_delay": token_delay,
+        "fast_latency": fast_latency,
+        "wall_seconds": round(wall, 3),
+        "endpoints": recorder.report(wall),
+    }
+
+
+def compare(results: list, baseline: list, tolerance: float = 0.2) -> list:
+    """Return human-readable regressions of `results` against `baseline`.
+
+    An endpoint regresses when its p95 grows, or its requests/sec drops,
+    by more than `tolerance` (a fraction).
+    """
+    regressions = []
+    previous = {run["workload"]: run for run in baseline}
+    for run in results:
+        old = previous.get(run["workload"])
+        if not old:
+            continue
+        for endpoint, stats in run["endpoints"].items():
+            before = old["endpoints"].get(endpoint)
+            if not before:
+                continue
+            if before["p95_ms"] and stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{run['workload']} {endpoint}: p95 {before['p95_ms']}ms -> {stats['p95_ms']}ms"
+                )
+            if before["rps"] and stats["rps"] < before["rps"] * (1 - tolerance):
+                regressions.append(
+                    f"{run['workload']} {endpoint}: {before['rps']} -> {stats['rps']} req/s"
+                )
+    return regressions
+
+
+def format_report(results: list) -> str:
+    lines = []
+    header = f"{'endpoint':<52} {'n':>6} {'err':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    for run in results:
+        lines.append(
+            f"\n== {run['workload']}: {run['users']} users x {run['turns']} turns, "
+            f"LLM {run['llm_latency'] * 1000:.0f}ms, {run['wall_seconds']}s wall"
+        )
+        lines.append(header)
+        for endpoint, s in run["endpoints"].items():
+            lines.append(
+                f"{endpoint:<52} {s['requests']:>6} {s['errors']:>4} {s['rps']:>8} "
+                f"{s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8}"
+            )
+    return "\n".join(lines)
+
+
+def load_baseline(path: str) -> list:
+    with open(path) as fh:
+        return json.load(fh)["runs"]
+
+
+def save_baseline(path: str, results: list) -> None:
+    with open(path, "w") as fh:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "runs": results}, fh, indent=2)
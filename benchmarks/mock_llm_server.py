@@ -0,0 +1,95 @@
+"""Local OpenAI-compatible mock LLM server for load testing.
+
+Run it next to the app and point the HTTP provider at it:
+
+    uvicorn benchmarks.mock_llm_server:app --port 9000
+    LLM_PROVIDER=openai LLM_BASE_URL=http://localhost:9000/v1 uvicorn app.main:app
+
+Behaviour is controlled with `MOCK_LLM_LATENCY` (seconds before the first
+byte), `MOCK_LLM_TOKEN_DELAY` (seconds between streamed chunks) and
+`MOCK_LLM_ERROR_RATE` (fraction of requests answered with 503).
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def create_app(
+    latency: float = 0.05,
+    token_delay: float = 0.01,
+    error_rate: float = 0.0,
+    fail_first: int = 0
+) -> FastAPI:
+    """Build a mock server; `fail_first` makes the first N requests fail with 503."""
+    mock = FastAPI(title="Mock LLM")
+    state = {"requests": 0, "in_flight": 0, "max_in_flight": 0}
+    mock.state.stats = state
+
+    def _reply(body: dict) -> str:
+        user = next(
+            (m["content"] for m in reversed(body.get("messages", [])) if m["role"] == "user"),
+            ""
+        )
+        return f"(mock) Echo: {user[:200]}"
+
+    @mock.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        state["requests"] += 1
+        if state["requests"] <= fail_first or random.random() < error_rate:
+            return JSONResponse({"error": {"message": "overloaded"}}, status_code=503)
+
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        text = _reply(body)
+        created = int(time.time())
+
+        if not body.get("stream"):
+            try:
+                await asyncio.sleep(latency)
+            finally:
+                state["in_flight"] -= 1
+            return {
+                "id": f"mock-{state['requests']}",
+                "object": "chat.completion",
+                "created": created,
+                "model": body.get("model"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }],
+            }
+
+        async def events():
+            try:
+                await asyncio.sleep(latency)
+                for piece in re.findall(r"\S+\s*", text):
+                    chunk = {
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": body.get("model"),
+                        "choices": [{"index": 0, "delta": {"content": piece}}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(token_delay)
+                yield "data: [DONE]\n\n"
+            finally:
+                state["in_flight"] -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return mock
+
+
+app = create_app(
+    latency=float(os.getenv("MOCK_LLM_LATENCY", "0.05")),
+    token_delay=float(os.getenv("MOCK_LLM_TOKEN_DELAY", "0.01")),
+    error_rate=float(os.getenv("MOCK_LLM_ERROR_RATE", "0")),
+)
@@ -0,0 +1,88 @@
+"""Run the benchmark workloads against app.main:app.
+
+    python -m benchmarks.run                         # all workloads, print report
+    python -m benchmarks.run --workload long --users 20 --turns 30
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json  # exit 1 on regression
+
+A throwaway SQLite database is used unless `DATABASE_URL` is already set.
+Compare baselines recorded on the same machine and settings only.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workload", action="append", choices=("long", "rag", "concurrent"),
+                        help="workload to run (repeatable; default: all)")
+    parser.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=10, help="messages sent by each user")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake LLM time to first token (s)")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="fake LLM delay between tokens (s)")
+    parser.add_argument("--fast-latency", type=float, help="fake latency of the fast model tier (s; default: same as --llm-latency)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write results to a baseline file")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed p95 / throughput change before failing (fraction)")
+    return parser.parse_args(argv)
+
+
+async def _run(app, args) -> list:
+    from benchmarks.harness import WORKLOADS, run_workload
+
+    results = []
+    for workload in args.workload or WORKLOADS:
+        results.append(await run_workload(
+            app,
+            workload,
+            users=args.users,
+            turns=args.turns,
+            llm_latency=args.llm_latency,
+            token_delay=args.token_delay,
+            fast_latency=args.fast_latency,
+        ))
+    return results
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    # must happen before the app (and its engines) are imported
+    os.environ.setdefault(
+        "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    )
+    os.environ.setdefault("LLM_PROVIDER", "fake")
+    from app.db.base import Base
+    from app.db.session import engine
+    from app.main import app
+    from benchmarks.harness import compare, format_report, load_baseline, save_baseline
+
+    Base.metadata.create_all(bind=engine)
+    # per-request INFO logs would dominate the measurements; lowered after
+    # importing app.main, whose basicConfig would set INFO again
+    logging.getLogger().setLevel(logging.WARNING)
+    results = asyncio.run(_run(app, args))
+
+    print(json.dumps(results, indent=2) if args.json else format_report(results))
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+        print(f"\nbaseline written to {args.save_baseline}")
+
+    if args.compare:
+        regressions = compare(results, load_baseline(args.compare), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:\n  " + "\n  ".join(regressions))
+            return 1
+        print("\nno regressions against", args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
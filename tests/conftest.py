@@ -1,5 +1,6 @@
 import os
 import sys
+import tempfile
 import pytest
 from fastapi.testclient import TestClient
 
@@ -8,9 +9,16 @@ ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
 
+# Use a throwaway database so runs never touch (or depend on) ./bot_gpt.db
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+)
+
 from app.main import app
 
 
 @pytest.fixture
 def client():
-    return TestClient(app)
+    # context manager keeps one event loop alive so background jobs can run
+    with TestClient(app) as test_client:
+        yield test_client
@@ -0,0 +1,23 @@
+from functools import partial
+
+from app.main import app
+from benchmarks.harness import compare, percentile, run_workload
+
+
+def test_percentile_nearest_rank():
+    values = [i / 100 for i in range(1, 101)]
+    assert percentile(values, 50) == 0.5
+    assert percentile(values, 99) == 0.99
+    assert percentile([], 95) == 0.0
+
+
+def test_long_workload_reports_endpoints(client):
+    result = client.portal.call(
+        partial(run_workload, app, "long", users=2, turns=3, llm_latency=0, token_delay=0)
+    )
+    messages = result["endpoints"]["POST /conversations/{id}/messages"]
+    assert messages["requests"] == 6 and messages["errors"] == 0
+    assert messages["p50_ms"] <= messages["p95_ms"] <= messages["p99_ms"]
+
+    slower = {**result, "endpoints": {k: {**v, "p95_ms": v["p95_ms"] * 10 + 1} for k, v in result["endpoints"].items()}}
+    assert compare([slower], [result])
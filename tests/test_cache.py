@@ -0,0 +1,48 @@
+import time
+
+from app.db.cache import Cache, LRUTTLCache, SQLiteStore
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUTTLCache(max_entries=2, ttl=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+    assert lru.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    lru = LRUTTLCache(max_entries=10, ttl=0.01)
+    lru.set("a", 1)
+    time.sleep(0.02)
+    assert lru.get("a") is None
+    assert lru.stats()["expirations"] == 1
+
+
+def test_workers_share_hits_through_sqlite_store(tmp_path):
+    path = str(tmp_path / "cache.db")
+    worker_a = Cache(LRUTTLCache(ttl=5), SQLiteStore(path), ttl=60)
+    worker_b = Cache(LRUTTLCache(ttl=5), SQLiteStore(path), ttl=60)
+
+    worker_a.set("conversation:1", {"id": 1, "mode": "rag"})
+    assert worker_b.get("conversation:1") == {"id": 1, "mode": "rag"}
+    assert worker_b.stats()["shared"]["hits"] == 1
+
+    worker_a.delete("conversation:1")
+    worker_b.local.clear()
+    assert worker_b.get("conversation:1") is None
+
+
+def test_cache_stats_endpoint(client):
+    conv = client.post(
+        "/conversations",
+        json={"user_email": "test@example.com", "mode": "open"}
+    ).json()
+    assert client.get(f"/conversations/{conv['id']}").status_code == 200
+
+    stats = client.get("/cache/stats").json()
+    assert stats["local"]["hits"] >= 1
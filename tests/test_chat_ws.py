@@ -0,0 +1,88 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.services import chat_session, llm_service
+
+
+def test_websocket_chat_streams_and_persists(client, monkeypatch):
+    from app.db.session import SessionLocal
+    from app.models.message import Message
+
+    histories = []
+
+    def mock_stream(conversation, recent_messages, user_message, context_chunks=None):
+        histories.append([m.content for m in recent_messages])
+        return llm_service.fake_stream(f"echo {user_message}", delay=0)
+
+    monkeypatch.setattr(chat_session, "stream_llm", mock_stream)
+
+    conv = client.post(
+        "/conversations", json={"user_email": "ws@example.com", "mode": "open"}
+    ).json()
+
+    with client.websocket_connect(
+        f"/conversations/{conv['id']}/ws", headers={"X-User-Email": "ws@example.com"}
+    ) as ws:
+        for text in ("first", "second"):
+            ws.send_json({"content": text})
+            frames = []
+            while not frames or frames[-1]["type"] != "done":
+                frames.append(ws.receive_json())
+            assert "".join(f["content"] for f in frames[:-1]) == f"echo {text}"
+            assert frames[-1]["message"]["content"] == f"echo {text}"
+            assert frames[-1]["message"]["id"] is None  # stored in the background
+
+        ws.send_text("not json")
+        assert ws.receive_json()["status"] == 400
+
+    # history came from session memory, not the database
+    assert histories == [[], ["first", "echo first"]]
+
+    # writes are asynchronous: give the last one a moment to land
+    db = SessionLocal()
+    try:
+        for _ in range(100):
+            stored = db.query(Message).filter(Message.conversation_id == conv["id"]).order_by(Message.id).all()
+            if len(stored) == 4:
+                break
+            db.rollback()
+            time.sleep(0.02)
+        assert [m.content for m in stored] == ["first", "echo first", "second", "echo second"]
+    finally:
+        db.close()
+
+
+def test_websocket_rejects_other_users(client):
+    conv = client.post(
+        "/conversations", json={"user_email": "owner@example.com", "mode": "open"}
+    ).json()
+    client.post("/conversations", json={"user_email": "intruder@example.com", "mode": "open"})
+
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(f"/conversations/{conv['id']}/ws?user_email=intruder@example.com") as ws:
+            ws.receive_json()
+
+
+def test_summary_is_scheduled_once_evicted_messages_are_stored(monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(chat_session, "schedule_summary", scheduled.append)
+
+    conversation = SimpleNamespace(id=7, summarized_until_id=None)
+    session = chat_session.ChatSession(conversation, [], 0)
+    turns = [SimpleNamespace(id=None) for _ in range(chat_session.WINDOW_SIZE + 1)]
+    session._remember(turns)
+
+    session._maybe_summarize()  # not written yet
+    assert scheduled == []
+
+    for i, msg in enumerate(turns, start=1):
+        msg.id = i
+    session._maybe_summarize()
+    assert scheduled == [7]
+
+    conversation.summarized_until_id = chat_session.WINDOW_SIZE + 1  # already folded
+    session._maybe_summarize()
+    assert scheduled == [7]
@@ -5,3 +5,40 @@ def test_create_conversation(client):
     )
     assert response.status_code == 200
     assert "id" in response.json()
+
+
+def test_list_conversations_pages_with_cursor(client):
+    email = "pager@example.com"
+    created = [
+        client.post("/conversations", json={"user_email": email, "title": f"c{i}"}).json()["id"]
+        for i in range(5)
+    ]
+
+    seen, cursor = [], None
+    for _ in range(3):
+        params = {"user_email": email, "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/conversations", params=params)
+        assert response.status_code == 200
+        seen += [c["id"] for c in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+
+    assert seen == list(reversed(created))
+    assert cursor is None
+    assert client.get("/conversations", params={"user_email": email, "cursor": "bogus"}).status_code == 400
+
+
+def test_list_conversations_still_accepts_offset(client):
+    email = "offset@example.com"
+    created = [
+        client.post("/conversations", json={"user_email": email, "title": f"c{i}"}).json()["id"]
+        for i in range(3)
+    ]
+
+    response = client.get("/conversations", params={"user_email": email, "limit": 1, "offset": 1})
+    assert [c["id"] for c in response.json()] == [created[1]]
+
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get("/conversations", params={"user_email": email, "offset": 1, "cursor": cursor})
+    assert response.status_code == 400
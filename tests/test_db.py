@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+
+from app.db import session as db_session
+from app.db.base import Base
+from app.db.session import _to_async_url
+from app.db.upgrade import upgrade_schema
+from app.models.conversation import Conversation
+from app.models.document import Document
+from app.models.user import User
+from app.services.blob_service import load_text
+from app.services.conversation_service import list_conversations
+from app.services.rag_service import retrieve_relevant_chunks
+
+
+def test_async_url_uses_async_drivers():
+    assert _to_async_url("sqlite:///./bot_gpt.db") == "sqlite+aiosqlite:///./bot_gpt.db"
+    assert _to_async_url("postgresql://u:p@db/bot") == "postgresql+asyncpg://u:p@db/bot"
+    assert _to_async_url("postgresql+asyncpg://db/bot") == "postgresql+asyncpg://db/bot"
+
+
+def test_sqlite_profile_splits_reads_from_the_writer():
+    if not db_session._TUNED_SQLITE:
+        pytest.skip("tuned SQLite profile not active")
+
+    async def scenario():
+        async with db_session.AsyncReadSessionLocal() as db:
+            assert (await db.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+            with pytest.raises(OperationalError):
+                await db.execute(text("CREATE TABLE read_only_probe (id INTEGER)"))
+
+        async with db_session.AsyncSessionLocal() as db:
+            sync = db.sync_session
+            assert sync.get_bind(clause=select(User)) is db_session.async_read_engine.sync_engine
+            db.add(User(email="router@example.com"))
+            await db.flush()
+            # after the first write the transaction keeps reading its own writes
+            assert sync.get_bind(clause=select(User)) is db_session.async_engine.sync_engine
+            found = (await db.execute(select(User).where(User.email == "router@example.com"))).scalar_one()
+            await db.delete(found)
+            await db.commit()
+            assert sync.get_bind(clause=select(User)) is db_session.async_read_engine.sync_engine
+
+    asyncio.run(scenario())
+
+
+def test_upgrade_moves_legacy_document_content_into_blobs(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE documents (id INTEGER PRIMARY KEY, filename VARCHAR NOT NULL,"
+            " content TEXT NOT NULL, content_hash VARCHAR(64) UNIQUE, chunk_count INTEGER,"
+            " total_length INTEGER, status VARCHAR DEFAULT 'ready' NOT NULL, summary TEXT,"
+            " created_at DATETIME)"
+        ))
+        conn.execute(text(
+            "INSERT INTO documents (id, filename, content) VALUES (1, 'old.pdf', 'the legacy body')"
+        ))
+    Base.metadata.create_all(bind=engine)
+
+    upgrade_schema(engine)
+    upgrade_schema(engine)  # idempotent
+
+    assert "content" not in {c["name"] for c in inspect(engine).get_columns("documents")}
+    with Session(engine) as db:
+        assert load_text(db, 1) == "the legacy body"
+        # new documents can be stored again, and the legacy one is indexed on first retrieval
+        db.add(Document(filename="new.pdf"))
+        assert retrieve_relevant_chunks(db, [1], "legacy") == ["the legacy body"]
+        assert db.get(Document, 1).chunk_count == 1
+
+
+def test_upgrade_adds_columns_to_an_old_schema(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE conversations (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL,"
+            " mode VARCHAR, title VARCHAR, summary TEXT, created_at DATETIME)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE messages (id INTEGER PRIMARY KEY, conversation_id INTEGER NOT NULL,"
+            " role VARCHAR NOT NULL, content TEXT NOT NULL, token_count INTEGER, created_at DATETIME)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE documents (id INTEGER PRIMARY KEY, filename VARCHAR NOT NULL,"
+            " content TEXT NOT NULL, created_at DATETIME)"
+        ))
+        conn.execute(text("INSERT INTO conversations (id, user_id, mode) VALUES (1, 1, 'rag')"))
+        conn.execute(text(
+            "INSERT INTO messages (conversation_id, role, content) VALUES (1, 'user', 'hi'), (1, 'assistant', 'hello')"
+        ))
+        conn.execute(text("INSERT INTO documents (id, filename, content) VALUES (1, 'old.pdf', 'old body')"))
+    Base.metadata.create_all(bind=engine)
+
+    upgrade_schema(engine)
+    upgrade_schema(engine)
+
+    indexes = {i["name"] for i in inspect(engine).get_indexes("messages")}
+    assert "ix_messages_conversation_created" in indexes
+    with Session(engine) as db:
+        assert db.get(Conversation, 1).message_count == 2
+        document = db.get(Document, 1)
+        assert (document.status, document.chunk_count, document.summary) == ("ready", None, None)
+        db.add_all([Document(filename="a.pdf", content_hash="a" * 64), Document(filename="b.pdf")])
+        db.commit()
+        db.add(Document(filename="c.pdf", content_hash="a" * 64))
+        with pytest.raises(IntegrityError):
+            db.commit()
+
+
+def test_cursor_pages_through_legacy_created_at(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, email) VALUES (1, 'old@example.com')"))
+        # what the old CURRENT_TIMESTAMP server default stored
+        conn.execute(text(
+            "INSERT INTO conversations (id, user_id, mode, created_at, message_count) VALUES"
+            " (1, 1, 'open', '2024-01-01 10:00:00', 0),"
+            " (2, 1, 'open', '2024-01-01 10:00:00', 0),"
+            " (3, 1, 'open', '2024-01-01 10:00:01', 0)"
+        ))
+
+    upgrade_schema(engine)
+
+    seen, cursor = [], None
+    with Session(engine) as db:
+        for _ in range(4):
+            rows, cursor = list_conversations(db, "old@example.com", 1, cursor)
+            seen += [row.id for row in rows]
+            if cursor is None:
+                break
+    assert seen == [3, 2, 1]
+    assert cursor is None
@@ -0,0 +1,123 @@
+import asyncio
+from functools import partial
+
+from app.db.session import SessionLocal
+from app.models.conversation import Conversation
+from app.models.document_chunk import DocumentChunk
+from app.models.user import User
+from app.services import document_summary_service, message_service
+from app.services.document_service import store_document
+
+
+def _document(email: str, parts: int):
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == email).first() or User(email=email)
+        db.add(user)
+        db.flush()
+        convo = Conversation(user_id=user.id, mode="rag")
+        db.add(convo)
+        db.commit()
+        text = " ".join(f"section{i} " + "detail " * 199 for i in range(parts))
+        doc = store_document(db, convo.id, "report.pdf", text)
+        return convo.id, user.id, doc.id, doc.chunk_count
+    finally:
+        db.close()
+
+
+def test_document_summary_is_map_reduced_and_stored(client, monkeypatch):
+    calls = []
+    running = {"now": 0, "max": 0}
+
+    async def mock_llm(conversation, recent_messages, user_message, **kwargs):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(0.01)
+        running["now"] -= 1
+        kind = "map" if user_message.startswith(document_summary_service.CHUNK_PROMPT) else "reduce"
+        calls.append(kind)
+        return f"{kind} summary {len(calls)}"
+
+    monkeypatch.setattr(document_summary_service, "call_llm", mock_llm)
+    monkeypatch.setattr(document_summary_service, "DOC_SUMMARY_CONCURRENCY", 2)
+    # small groups force more than one reduce round
+    monkeypatch.setattr(document_summary_service, "DOC_SUMMARY_REDUCE_TOKENS", 8)
+
+    _, user_id, doc_id, chunk_count = _document("summary@example.com", 6)
+    assert chunk_count >= 6
+
+    first = client.portal.call(partial(document_summary_service.summarize_document, doc_id, user_id))
+    assert calls.count("map") == chunk_count
+    assert calls.count("reduce") > 1
+    assert running["max"] == 2
+    assert first[0] == "report.pdf" and first[1].startswith("reduce summary")
+
+    db = SessionLocal()
+    try:
+        stored = db.query(DocumentChunk.summary).filter(DocumentChunk.document_id == doc_id).all()
+        assert all(s for (s,) in stored)
+    finally:
+        db.close()
+
+    # later requests read the stored summary without calling the LLM
+    calls.clear()
+    assert client.portal.call(partial(document_summary_service.summarize_document, doc_id, user_id)) == first
+    assert calls == []
+
+
+def test_summary_request_uses_document_summary(client, monkeypatch):
+    async def mock_summary_llm(conversation, recent_messages, user_message, **kwargs):
+        return "the report covers six sections"
+
+    seen = []
+
+    async def mock_llm(conversation, recent_messages, user_message, context_chunks=None, **kwargs):
+        seen.append(context_chunks)
+        return "reply"
+
+    monkeypatch.setattr(document_summary_service, "call_llm", mock_summary_llm)
+    monkeypatch.setattr(message_service, "call_llm", mock_llm)
+
+    conversation_id, _, _, _ = _document("summary-turn@example.com", 3)
+    response = client.post(
+        f"/conversations/{conversation_id}/messages",
+        data={"content": "Please summarize the report"},
+        headers={"X-User-Email": "summary-turn@example.com"}
+    )
+
+    assert response.status_code == 200
+    assert seen == [["Summary of report.pdf:\nthe report covers six sections"]]
+
+
+def test_failed_summary_keeps_partial_work_and_falls_back_to_chunks(client, monkeypatch):
+    async def flaky_llm(conversation, recent_messages, user_message, **kwargs):
+        if "section1 " in user_message:
+            raise RuntimeError("provider error")
+        return "partial summary"
+
+    seen = []
+
+    async def mock_llm(conversation, recent_messages, user_message, context_chunks=None, **kwargs):
+        seen.append(context_chunks)
+        return "reply"
+
+    monkeypatch.setattr(document_summary_service, "call_llm", flaky_llm)
+    monkeypatch.setattr(message_service, "call_llm", mock_llm)
+
+    conversation_id, _, doc_id, chunk_count = _document("summary-flaky@example.com", 3)
+    response = client.post(
+        f"/conversations/{conversation_id}/messages",
+        data={"content": "Please summarize the report"},
+        headers={"X-User-Email": "summary-flaky@example.com"}
+    )
+
+    assert response.status_code == 200
+    # the turn is answered from the leading chunks instead
+    assert seen[0] and seen[0][0].startswith("section0")
+
+    db = SessionLocal()
+    try:
+        stored = [s for (s,) in db.query(DocumentChunk.summary).filter(DocumentChunk.document_id == doc_id)]
+        assert 0 < sum(1 for s in stored if s) < chunk_count
+    finally:
+        db.close()
@@ -0,0 +1,176 @@
+import time
+
+import pytest
+
+from app.db.session import SessionLocal
+from app.models.conversation_document import ConversationDocument
+from app.models.ingestion_job import IngestionJob
+from app.services import message_service, pdf_service
+from benchmarks.fixtures import make_pdf
+
+
+def test_pages_are_extracted_in_order_across_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_service, "PDF_PARALLEL_MIN_PAGES", 2)
+    monkeypatch.setattr(pdf_service, "PDF_PAGE_BATCH", 1)
+    path = tmp_path / "pages.pdf"
+    path.write_bytes(make_pdf("page one", "page two", "page three"))
+
+    pages = list(pdf_service.iter_pdf_pages(str(path), workers=2))
+    assert [p.strip() for p in pages] == ["page one", "page two", "page three"]
+
+
+def test_page_limit_is_enforced(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_service, "PDF_MAX_PAGES", 1)
+    path = tmp_path / "long.pdf"
+    path.write_bytes(make_pdf("first", "second"))
+
+    with pytest.raises(pdf_service.PDFLimitError):
+        list(pdf_service.iter_pdf_pages(str(path)))
+
+
+def test_upload_is_ingested_in_background(client, monkeypatch):
+    seen = {}
+
+    async def mock_llm(conversation, recent_messages, user_message, context_chunks=None, **kwargs):
+        seen["chunks"] = context_chunks
+        return "ok"
+
+    monkeypatch.setattr(message_service, "call_llm", mock_llm)
+    headers = {"X-User-Email": "docs@example.com"}
+    conv = client.post(
+        "/conversations", json={"user_email": "docs@example.com", "mode": "rag"}
+    ).json()
+
+    response = client.post(
+        f"/conversations/{conv['id']}/documents",
+        files={"file": ("notes.pdf", make_pdf("the launch code is pineapple"), "application/pdf")},
+        headers=headers
+    )
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] in ("queued", "extracting", "indexing", "ready")
+
+    deadline = time.time() + 60
+    while job["status"] not in ("ready", "failed") and time.time() < deadline:
+        time.sleep(0.1)
+        job = client.get(
+            f"/conversations/{conv['id']}/documents/jobs/{job['id']}", headers=headers
+        ).json()
+
+    assert job["status"] == "ready" and job["progress"] == 100
+    assert job["document_id"] is not None
+
+    client.post(
+        f"/conversations/{conv['id']}/messages",
+        data={"content": "what is the launch code?"},
+        headers=headers
+    )
+    assert any("pineapple" in chunk for chunk in seen["chunks"])
+
+
+def test_failed_ingestion_is_reported(client):
+    headers = {"X-User-Email": "broken@example.com"}
+    conv = client.post(
+        "/conversations", json={"user_email": "broken@example.com", "mode": "rag"}
+    ).json()
+
+    response = client.post(
+        f"/conversations/{conv['id']}/messages",
+        data={"content": "read this"},
+        files={"file": ("broken.pdf", b"not a pdf", "application/pdf")},
+        headers=headers
+    )
+    assert response.status_code == 400
+
+
+def test_reupload_links_existing_document(client):
+    pdf = make_pdf("shared employee handbook")
+    conversation_ids = []
+    for email in ("first@example.com", "second@example.com"):
+        headers = {"X-User-Email": email}
+        conv = client.post("/conversations", json={"user_email": email, "mode": "rag"}).json()
+        response = client.post(
+            f"/conversations/{conv['id']}/messages",
+            data={"content": "hi"},
+            files={"file": ("handbook.pdf", pdf, "application/pdf")},
+            headers=headers
+        )
+        assert response.status_code == 200
+        conversation_ids.append(conv["id"])
+
+    with SessionLocal() as db:
+        jobs = db.query(IngestionJob).filter(IngestionJob.conversation_id.in_(conversation_ids)).all()
+        assert len(jobs) == 2
+        assert jobs[0].document_id == jobs[1].document_id
+        links = db.query(ConversationDocument).filter_by(document_id=jobs[0].document_id).count()
+        assert links == 2
+
+
+def test_job_sharing_a_document_waits_until_it_is_indexed(client, tmp_path, monkeypatch):
+    import threading
+    from app.models.document import Document
+    from app.services import ingestion_service
+
+    monkeypatch.setattr(ingestion_service, "INGEST_SHARED_POLL", 0.01)
+    conv = client.post("/conversations", json={"user_email": "dedup@example.com", "mode": "rag"}).json()
+    path = tmp_path / "shared.pdf"
+    path.write_bytes(make_pdf("shared pages"))
+
+    with SessionLocal() as db:
+        # another job is still indexing the same bytes
+        document = Document(filename="shared.pdf", content_hash="d" * 64, status="indexing")
+        job = IngestionJob(conversation_id=conv["id"], filename="shared.pdf", content_hash="d" * 64)
+        db.add_all([document, job])
+        db.commit()
+        document_id, job_id = document.id, job.id
+
+    worker = threading.Thread(target=ingestion_service.run_ingestion_job, args=(job_id, str(path)))
+    worker.start()
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        with SessionLocal() as db:
+            if db.get(IngestionJob, job_id).status == "indexing":
+                break
+        time.sleep(0.02)
+    time.sleep(0.1)  # a few polls of the shared document
+    with SessionLocal() as db:
+        job = db.get(IngestionJob, job_id)
+        assert (job.status, job.document_id) == ("indexing", document_id)
+        db.get(Document, document_id).status = "ready"
+        db.commit()
+
+    worker.join(timeout=5)
+    with SessionLocal() as db:
+        job = db.get(IngestionJob, job_id)
+        assert (job.status, job.progress) == ("ready", 100)
+
+
+def test_long_pdf_is_ingested_with_the_shared_extraction_pool(client, tmp_path, monkeypatch):
+    from app.models.document_chunk import DocumentChunk
+    from app.services import ingestion_service
+
+    monkeypatch.setattr(pdf_service, "PDF_PAGE_BATCH", 8)
+    conv = client.post("/conversations", json={"user_email": "long@example.com", "mode": "rag"}).json()
+    pools = []
+    for name in ("long-a.pdf", "long-b.pdf"):
+        path = tmp_path / name
+        path.write_bytes(make_pdf(*(f"{name} page{i}" for i in range(pdf_service.PDF_PARALLEL_MIN_PAGES + 6))))
+        with SessionLocal() as db:
+            job = IngestionJob(conversation_id=conv["id"], filename=name, content_hash=None)
+            db.add(job)
+            db.commit()
+            job_id = job.id
+
+        document_id = ingestion_service.run_ingestion_job(job_id, str(path))
+        pools.append(pdf_service._POOL)
+
+        with SessionLocal() as db:
+            assert db.get(IngestionJob, job_id).status == "ready"
+            text = " ".join(c for (c,) in db.query(DocumentChunk.content).filter_by(document_id=document_id)
+                            .order_by(DocumentChunk.position))
+        pages = [int(word[4:]) for word in text.split() if word.startswith("page")]
+        assert sorted(set(pages)) == list(range(pdf_service.PDF_PARALLEL_MIN_PAGES + 6))
+        assert pages == sorted(pages)
+
+    # one pool serves every file
+    assert pools[0] is not None and pools[0] is pools[1]
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+from app.services import llm_service
+from app.services.token_service import count_tokens, truncate_to_tokens
+
+
+def test_truncate_to_tokens_fits_budget():
+    text = "word " * 500
+    assert count_tokens(truncate_to_tokens(text, 50)) <= 50
+    assert truncate_to_tokens("short", 50) == "short"
+
+
+def test_build_llm_messages_respects_budget(monkeypatch):
+    monkeypatch.setattr(llm_service, "CONTEXT_TOKEN_BUDGET", llm_service.REPLY_TOKENS + 300)
+    monkeypatch.setattr(llm_service, "MAX_CHUNK_TOKENS", 50)
+
+    convo = SimpleNamespace(id=1, summary="user likes short answers")
+    history = [
+        SimpleNamespace(role="user", content=f"old message {i} " + "filler " * 30, token_count=None)
+        for i in range(10)
+    ]
+    chunks = ["chunk " * 400]
+
+    messages = llm_service.build_llm_messages(convo, history, "latest question", chunks)
+
+    total = sum(count_tokens(m["content"]) + 4 for m in messages)
+    assert total <= 300
+    assert messages[0]["content"] == llm_service.SYSTEM_PROMPT
+    assert messages[-1] == {"role": "user", "content": "latest question"}
+    assert "summary" in messages[1]["content"]
+    # oversized chunk is truncated, and history is filled newest first
+    assert count_tokens(messages[2]["content"]) < 70
+    kept = [m["content"] for m in messages[3:-1]]
+    assert kept and kept[-1].startswith("old message 9")
+    assert len(kept) < 10
+
+
+def test_identical_prompts_share_one_provider_call(monkeypatch):
+    import asyncio
+
+    calls = []
+
+    async def fake_complete(messages, user_message, temperature, tier):
+        calls.append(temperature)
+        await asyncio.sleep(0.01)
+        return f"answer to {user_message}"
+
+    monkeypatch.setattr(llm_service, "_complete", fake_complete)
+    monkeypatch.setattr(llm_service, "_RESPONSE_CACHE", llm_service.LRUTTLCache(max_entries=10, ttl=60))
+    convo = SimpleNamespace(id=None, summary=None)
+
+    async def scenario():
+        replies = await asyncio.gather(*[
+            llm_service.call_llm(convo, [], "summarize the handbook", temperature=0.0)
+            for _ in range(5)
+        ])
+        cached = await llm_service.call_llm(convo, [], "summarize the handbook", temperature=0.0)
+        hot = await llm_service.call_llm(convo, [], "summarize the handbook", temperature=0.9)
+        return replies, cached, hot
+
+    replies, cached, hot = asyncio.run(scenario())
+
+    assert set(replies) == {"answer to summarize the handbook"}
+    assert cached == replies[0]
+    # one shared call for the deterministic prompts, one uncached at 0.9
+    assert calls == [0.0, 0.9]
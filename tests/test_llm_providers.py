@@ -0,0 +1,69 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services.llm_providers import LLMProvider, LLMProviderError, OpenAICompatibleProvider
+from benchmarks.mock_llm_server import create_app
+
+MESSAGES = [{"role": "user", "content": "hello there"}]
+
+
+def _provider(mock, **kwargs):
+    return OpenAICompatibleProvider(
+        base_url="http://mock/v1",
+        api_key="test",
+        backoff_base=0.001,
+        transport=httpx.ASGITransport(app=mock),
+        **kwargs
+    )
+
+
+def test_complete_retries_transient_errors():
+    mock = create_app(latency=0, fail_first=2)
+    provider = _provider(mock, max_retries=2)
+
+    reply = asyncio.run(provider.complete(MESSAGES, "m", 0.0, 16))
+
+    assert reply == "(mock) Echo: hello there"
+    assert mock.state.stats["requests"] == 3
+
+
+def test_complete_gives_up_after_max_retries():
+    provider = _provider(create_app(latency=0, fail_first=5), max_retries=1)
+    with pytest.raises(LLMProviderError):
+        asyncio.run(provider.complete(MESSAGES, "m", 0.0, 16))
+
+
+def test_concurrency_limit_and_deadline():
+    mock = create_app(latency=0.02)
+    provider = _provider(mock, max_concurrency=2)
+
+    async def burst():
+        return await asyncio.gather(*[provider.complete(MESSAGES, "m", 0.0, 16) for _ in range(6)])
+
+    assert len(asyncio.run(burst())) == 6
+    assert mock.state.stats["max_in_flight"] <= 2
+
+    slow = _provider(create_app(latency=1.0), deadline=0.05)
+    with pytest.raises(LLMProviderError):
+        asyncio.run(slow.complete(MESSAGES, "m", 0.0, 16))
+
+
+def test_stream_yields_deltas():
+    provider = _provider(create_app(latency=0, token_delay=0))
+
+    async def collect():
+        return [piece async for piece in provider.stream(MESSAGES, "m", 0.0, 16)]
+
+    pieces = asyncio.run(collect())
+    assert len(pieces) > 1
+    assert "".join(pieces) == "(mock) Echo: hello there"
+
+
+def test_provider_must_implement_complete():
+    class Incomplete(LLMProvider):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
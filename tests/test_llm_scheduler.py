@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from app.db.session import SessionLocal
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.services import message_service
+from app.services.llm_scheduler import BACKGROUND, INTERACTIVE, LLMScheduler, SchedulerOverloaded
+
+
+def test_scheduler_is_fair_across_users_and_prefers_interactive():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=100, max_queue_per_user=100)
+        order = []
+
+        async def call(user, priority, label):
+            async with scheduler.slot(user, priority):
+                order.append(label)
+                await asyncio.sleep(0)
+
+        await scheduler.acquire("holder", INTERACTIVE)
+        tasks = [asyncio.ensure_future(call("summary", BACKGROUND, "s0"))]
+        tasks += [asyncio.ensure_future(call("heavy", INTERACTIVE, f"h{i}")) for i in range(3)]
+        tasks.append(asyncio.ensure_future(call("light", INTERACTIVE, "l0")))
+        await asyncio.sleep(0)
+        assert scheduler.depth() == 5
+
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order, scheduler.active
+
+    order, active = asyncio.run(scenario())
+    # the light user is not stuck behind the heavy user's burst, and the
+    # background summary waits for all interactive work
+    assert order == ["h0", "l0", "h1", "h2", "s0"]
+    assert active == 0
+
+
+def test_scheduler_sheds_when_queue_is_full():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=2, max_queue_per_user=1)
+        await scheduler.acquire("a")
+        waiter = asyncio.ensure_future(scheduler.acquire("a"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(SchedulerOverloaded):
+            await scheduler.acquire("a")  # per-user limit
+        other = asyncio.ensure_future(scheduler.acquire("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerOverloaded):
+            await scheduler.acquire("c")  # total limit
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        scheduler.release()
+        await other
+        return scheduler.depth(), scheduler.active
+
+    assert asyncio.run(scenario()) == (0, 1)
+
+
+def test_message_is_rejected_with_429_when_overloaded(client, monkeypatch):
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=0)
+    monkeypatch.setattr(message_service, "llm_scheduler", scheduler)
+    monkeypatch.setattr("app.api.messages.llm_scheduler", scheduler)
+    scheduler.active = 1  # provider saturated
+
+    conv = client.post(
+        "/conversations", json={"user_email": "busy@example.com", "mode": "open"}
+    ).json()
+    response = client.post(
+        f"/conversations/{conv['id']}/messages",
+        data={"content": "hello?"},
+        headers={"X-User-Email": "busy@example.com"}
+    )
+
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+
+
+def test_stream_frees_the_slot_when_the_provider_is_done():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1)
+
+        async def provider():
+            for piece in ("a", "b", "c"):
+                yield piece
+
+        stream = scheduler.stream(provider(), "user")
+        first = await stream.__anext__()
+        await asyncio.sleep(0.01)  # the client is slow to read the rest
+        active = scheduler.active
+        rest = [piece async for piece in stream]
+        return first, rest, active
+
+    # the whole reply is buffered and the slot already freed
+    assert asyncio.run(scenario()) == ("a", ["b", "c"], 0)
+
+
+def test_shed_turn_does_not_leave_its_user_message(client, monkeypatch):
+    class SheddingScheduler(LLMScheduler):
+        async def acquire(self, user, priority=INTERACTIVE):
+            raise SchedulerOverloaded("queue filled up")
+
+    monkeypatch.setattr(message_service, "llm_scheduler", SheddingScheduler())
+
+    conv = client.post(
+        "/conversations", json={"user_email": "shed@example.com", "mode": "open"}
+    ).json()
+    response = client.post(
+        f"/conversations/{conv['id']}/messages",
+        data={"content": "hello?"},
+        headers={"X-User-Email": "shed@example.com"}
+    )
+    assert response.status_code == 429
+
+    db = SessionLocal()
+    try:
+        assert db.query(Message).filter(Message.conversation_id == conv["id"]).count() == 0
+        assert db.get(Conversation, conv["id"]).message_count == 0
+    finally:
+        db.close()
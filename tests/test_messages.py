@@ -32,3 +32,402 @@ def test_send_message_open_mode(client, monkeypatch):
 
     assert response.status_code == 200
     assert response.json()["content"] == "Hello from mock LLM"
+
+
+def test_send_message_stream(client, monkeypatch):
+    def mock_stream(*args, **kwargs):
+        return llm_service.fake_stream("Hello from stream", delay=0)
+
+    monkeypatch.setattr(message_service, "stream_llm", mock_stream)
+
+    conv = client.post(
+        "/conversations",
+        json={"user_email": "test@example.com", "mode": "open"}
+    ).json()
+
+    response = client.post(
+        f"/conversations/{conv['id']}/messages/stream",
+        data={"content": "Hi"},
+        headers={"X-User-Email": "test@example.com"}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    body = response.text
+    assert body.count("event: token") == 3
+    assert "event: done" in body
+    assert '"content": "Hello from stream"' in body
+
+
+def test_summary_folds_only_evicted_messages(client, monkeypatch):
+    from app.db.session import SessionLocal
+    from app.models.conversation import Conversation
+    from app.services.task_queue import background_queue
+
+    async def mock_llm(*args, **kwargs):
+        return "reply"
+
+    batches = []
+
+    async def mock_summarize(messages, previous_summary=None):
+        batches.append(len(messages))
+        return f"summary of {sum(batches)}"
+
+    monkeypatch.setattr(message_service, "call_llm", mock_llm)
+    monkeypatch.setattr(message_service, "summarize_messages", mock_summarize)
+
+    conv = client.post(
+        "/conversations",
+        json={"user_email": "test@example.com", "mode": "open"}
+    ).json()
+
+    for i in range(8):
+        client.post(
+            f"/conversations/{conv['id']}/messages",
+            data={"content": f"message {i}"},
+            headers={"X-User-Email": "test@example.com"}
+        )
+        client.portal.call(background_queue.join)
+
+    # a pass may have run before the last reply was stored; fold the rest
+    client.portal.call(message_service.summarize_evicted_messages, conv["id"])
+
+    # 16 messages with a window of 10: 6 evicted, each folded exactly once
+    assert sum(batches) == 6
+    assert max(batches) <= 2
+
+    db = SessionLocal()
+    try:
+        convo = db.query(Conversation).filter(Conversation.id == conv["id"]).first()
+        assert convo.summary == "summary of 6"
+        assert convo.summarized_until_id is not None
+    finally:
+        db.close()
+
+
+def test_turn_db_round_trips_stay_constant(client, monkeypatch):
+    from sqlalchemy import event
+    from app.db.session import async_engine, async_read_engine
+
+    async def mock_llm(*args, **kwargs):
+        return "reply"
+
+    monkeypatch.setattr(message_service, "call_llm", mock_llm)
+    monkeypatch.setattr(message_service, "schedule_summary", lambda conversation_id: None)
+
+    conv = client.post(
+        "/conversations",
+        json={"user_email": "test@example.com", "mode": "open"}
+    ).json()
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    commits = []
+
+    def record_commit(conn):
+        commits.append(1)
+
+    engines = {async_engine.sync_engine, async_read_engine.sync_engine}
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record)
+    event.listen(async_engine.sync_engine, "commit", record_commit)
+    try:
+        per_turn = []
+        for i in range(15):
+            statements.clear()
+            response = client.post(
+                f"/conversations/{conv['id']}/messages",
+                data={"content": f"message {i}"},
+                headers={"X-User-Email": "test@example.com"}
+            )
+            assert response.status_code == 200
+            per_turn.append([s.split()[0].upper() for s in statements])
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", record)
+        event.remove(async_engine.sync_engine, "commit", record_commit)
+
+    # user, conversation and history (written through on every turn) come
+    # from the cache: only the two inserts and their counter updates reach
+    # either engine, in two commits
+    for statements_of_turn in per_turn:
+        assert sorted(statements_of_turn) == ["INSERT", "INSERT", "UPDATE", "UPDATE"]
+    assert len(commits) == 2 * 15
+
+
+def test_unit_of_work_turn_commits_once(client, monkeypatch):
+    from sqlalchemy import event
+    from app.db.session import async_engine
+
+    async def mock_llm(conversation, recent_messages, user_message, **kwargs):
+        return f"reply to {user_message} after {len(recent_messages)}"
+
+    monkeypatch.setattr(message_service, "call_llm", mock_llm)
+    monkeypatch.setattr(message_service, "TURN_UNIT_OF_WORK", True)
+
+    conv = client.post(
+        "/conversations",
+        json={"user_email": "test@example.com", "mode": "open"}
+    ).json()
+
+    commits = []
+
+    def record_commit(conn):
+        commits.append(1)
+
+    event.listen(async_engine.sync_engine, "commit", record_commit)
+    try:
+        for i in range(3):
+            response = client.post(
+                f"/conversations/{conv['id']}/messages",
+                data={"content": f"message {i}"},
+                headers={"X-User-Email": "test@example.com"}
+            )
+            assert response.json()["content"] == f"reply to message {i} after {2 * i}"
+    finally:
+        event.remove(async_engine.sync_engine, "commit", record_commit)
+
+    assert len(commits) == 3
+
+
+def test_group_commit_batches_concurrent_writes(client, monkeypatch):
+    import asyncio
+    from app.db.session import AsyncSessionLocal
+    from app.models.conversation import Conversation
+    from app.services.group_commit import GroupCommitWriter
+
+    writer = GroupCommitWriter(window_ms=50)
+    monkeypatch.setattr(message_service, "GROUP_COMMIT", True)
+    monkeypatch.setattr(message_service, "group_writer", writer)
+
+    conv = client.post(
+        "/conversations",
+        json={"user_email": "test@example.com", "mode": "open"}
+    ).json()
+
+    async def write_many():
+        async def one(i):
+            async with AsyncSessionLocal() as db:
+                return await message_service.add_user_message_async(db, conv["id"], f"m{i}")
+
+        stored = await asyncio.gather(*(one(i) for i in range(20)))
+        async with AsyncSessionLocal() as db:
+            count = (await db.get(Conversation, conv["id"])).message_count
+        await writer.stop()
+        return stored, count
+
+    stored, count = client.portal.call(write_many)
+    assert all(msg.id for msg in stored)
+    assert count == 20
+    assert writer.messages == 20 and writer.batches < 20
+
+
+def test_group_commit_isolates_bad_rows_and_drains_on_stop(client):
+    import asyncio
+    from sqlalchemy.exc import IntegrityError
+    from app.db.session import AsyncSessionLocal
+    from app.models.conversation import Conversation
+    from app.services.group_commit import GroupCommitWriter
+
+    writer = GroupCommitWriter(window_ms=50)
+    conv = client.post(
+        "/conversations",
+        json={"user_email": "test@example.com", "mode": "open"}
+    ).json()
+
+    async def scenario():
+        good = [message_service.new_message(conv["id"], "user", f"m{i}") for i in range(3)]
+        bad = message_service.new_message(conv["id"], "user", "broken")
+        bad.content = None  # violates NOT NULL
+        results = await asyncio.gather(
+            *(writer.write([msg]) for msg in good[:2]), writer.write([bad]), return_exceptions=True
+        )
+
+        # stop flushes a write that is still queued
+        last = asyncio.ensure_future(writer.write([good[2]]))
+        await asyncio.sleep(0)
+        await writer.stop()
+        results.append(await last)
+
+        async with AsyncSessionLocal() as db:
+            count = (await db.get(Conversation, conv["id"])).message_count
+        return results, count
+
+    results, count = client.portal.call(scenario)
+    assert isinstance(results[2], IntegrityError)
+    assert [r[0].content for r in results[:2] + results[3:]] == ["m0", "m1", "m2"]
+    assert all(r[0].id for r in results[:2] + results[3:])
+    assert count == 3
+
+
+def test_group_commit_fails_pending_writes_when_cancelled(client):
+    import asyncio
+    import pytest
+    from app.services.group_commit import GroupCommitWriter
+
+    writer = GroupCommitWriter(window_ms=10_000)
+
+    async def scenario():
+        pending = asyncio.ensure_future(writer.write([message_service.new_message(1, "user", "late")]))
+        await asyncio.sleep(0.01)
+        writer._task.cancel()
+        with pytest.raises(RuntimeError):
+            await pending
+
+    client.portal.call(scenario)
+
+
+def test_window_reload_uses_stored_count(client, monkeypatch):
+    from app.db import cache
+    from app.db.session import AsyncSessionLocal
+
+    async def mock_llm(*args, **kwargs):
+        return "reply"
+
+    monkeypatch.setattr(message_service, "call_llm", mock_llm)
+    monkeypatch.setattr(message_service, "schedule_summary", lambda conversation_id: None)
+
+    conv = client.post(
+        "/conversations",
+        json={"user_email": "test@example.com", "mode": "open"}
+    ).json()
+    for i in range(7):
+        client.post(
+            f"/conversations/{conv['id']}/messages",
+            data={"content": f"message {i}"},
+            headers={"X-User-Email": "test@example.com"}
+        )
+
+    cache.invalidate_window(conv["id"])
+
+    async def reload():
+        async with AsyncSessionLocal() as db:
+            return await message_service.load_window(db, conv["id"])
+
+    messages, count = client.portal.call(reload)
+    assert count == 14
+    assert len(messages) == message_service.WINDOW_SIZE
+    assert messages[-1].role == "assistant"
+    assert messages[-2].content == "message 6"
+
+
+def test_write_drops_window_that_missed_a_write(client):
+    from app.db import cache
+    from app.db.session import AsyncSessionLocal
+
+    conv = client.post(
+        "/conversations",
+        json={"user_email": "test@example.com", "mode": "open"}
+    ).json()
+
+    async def write(content):
+        async with AsyncSessionLocal() as db:
+            await message_service.add_user_message_async(db, conv["id"], content)
+
+    client.portal.call(write, "first")
+    assert [m["content"] for m in cache.get_window(conv["id"])["messages"]] == ["first"]
+    assert cache.get_window(conv["id"])["count"] == 1
+
+    # a window filled from rows read before another worker's commit
+    cache.set_window(conv["id"], {"messages": [], "count": 0})
+    client.portal.call(write, "second")
+    assert cache.get_window(conv["id"]) is None
+
+
+def test_llm_call_overlaps_user_message_write(client, monkeypatch):
+    import asyncio
+    from app.db.session import AsyncSessionLocal
+
+    written = []
+    original_persist = message_service.persist_messages
+
+    async def slow_persist(db, conversation_id, messages):
+        if messages[0].role == "user":
+            await asyncio.sleep(0.2)
+        stored = await original_persist(db, conversation_id, messages)
+        written.extend(m.role for m in stored)
+        return stored
+
+    seen = []
+
+    async def mock_llm(conversation, recent_messages, user_message, **kwargs):
+        # the user message write is still in flight when the LLM starts
+        seen.append((list(written), [m.content for m in recent_messages]))
+        return f"reply to {user_message}"
+
+    monkeypatch.setattr(message_service, "persist_messages", slow_persist)
+    monkeypatch.setattr(message_service, "call_llm", mock_llm)
+
+    conv = client.post(
+        "/conversations",
+        json={"user_email": "test@example.com", "mode": "open"}
+    ).json()
+    for i in range(2):
+        response = client.post(
+            f"/conversations/{conv['id']}/messages",
+            data={"content": f"message {i}"},
+            headers={"X-User-Email": "test@example.com"}
+        )
+        assert response.json()["content"] == f"reply to message {i}"
+
+    assert seen[0] == ([], [])
+    assert seen[1] == (["user", "assistant"], ["message 0", "reply to message 0"])
+
+    async def reload():
+        async with AsyncSessionLocal() as db:
+            return await message_service.load_window(db, conv["id"])
+
+    messages, count = client.portal.call(reload)
+    assert count == 4
+    assert [m.content for m in messages] == [
+        "message 0", "reply to message 0", "message 1", "reply to message 1"
+    ]
+
+
+def test_failed_summary_pass_keeps_previous_summary(client, monkeypatch):
+    from app.db.session import SessionLocal
+    from app.models.conversation import Conversation
+    from app.models.message import Message
+    from app.services import llm_service
+    from app.services.llm_providers import LLMProvider
+    from app.services.model_router import FAST, PRIMARY, ModelRouter, Tier
+
+    class FailingProvider(LLMProvider):
+        async def complete(self, messages, model, temperature, max_tokens):
+            raise RuntimeError("provider down")
+
+    monkeypatch.setattr(llm_service, "model_router", ModelRouter([
+        Tier(PRIMARY, "big-model", 512, provider=FailingProvider()),
+        Tier(FAST, "small-model", 256, provider=FailingProvider()),
+    ], enabled=True))
+
+    conv = client.post(
+        "/conversations",
+        json={"user_email": "test@example.com", "mode": "open"}
+    ).json()
+    db = SessionLocal()
+    try:
+        messages = [
+            Message(conversation_id=conv["id"], role="user", content=f"message {i}")
+            for i in range(16)
+        ]
+        db.add_all(messages)
+        db.flush()
+        convo = db.get(Conversation, conv["id"])
+        convo.summary, convo.summarized_until_id = "good summary", messages[2].id
+        db.commit()
+        watermark = convo.summarized_until_id
+    finally:
+        db.close()
+
+    client.portal.call(message_service.summarize_evicted_messages, conv["id"])
+
+    db = SessionLocal()
+    try:
+        convo = db.get(Conversation, conv["id"])
+        assert (convo.summary, convo.summarized_until_id) == ("good summary", watermark)
+    finally:
+        db.close()
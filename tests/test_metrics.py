@@ -0,0 +1,87 @@
+from app.services import message_service, metrics
+
+
+def test_metrics_endpoint_reports_spans_and_routes(client, monkeypatch):
+    async def mock_llm(*args, **kwargs):
+        return "metered"
+
+    monkeypatch.setattr(message_service, "call_llm", mock_llm)
+    conv = client.post(
+        "/conversations", json={"user_email": "metrics@example.com", "mode": "open"}
+    ).json()
+    client.post(
+        f"/conversations/{conv['id']}/messages",
+        data={"content": "hello"},
+        headers={"X-User-Email": "metrics@example.com"}
+    )
+
+    body = client.get("/metrics").text
+    assert 'botgpt_span_duration_seconds_count{span="llm"}' in body
+    assert 'botgpt_span_duration_seconds_count{span="db"}' in body
+    assert 'route="/conversations/{conversation_id}/messages"' in body
+    assert 'botgpt_queue_depth{queue="background"}' in body
+
+
+def test_server_timing_header_lists_spans(client, monkeypatch):
+    async def mock_llm(*args, **kwargs):
+        return "timed"
+
+    monkeypatch.setattr(message_service, "call_llm", mock_llm)
+    monkeypatch.setattr(metrics, "SERVER_TIMING", True)
+    conv = client.post(
+        "/conversations", json={"user_email": "timing@example.com", "mode": "open"}
+    ).json()
+    response = client.post(
+        f"/conversations/{conv['id']}/messages",
+        data={"content": "hello"},
+        headers={"X-User-Email": "timing@example.com"}
+    )
+
+    header = response.headers["Server-Timing"]
+    assert "db;dur=" in header and "llm;dur=" in header and "total;dur=" in header
+
+
+def test_background_jobs_do_not_record_into_finished_requests(client, monkeypatch):
+    from app.services.task_queue import background_queue
+
+    requests = []
+
+    class RecordedSpans(metrics._SpanList):
+        def __init__(self):
+            super().__init__()
+            requests.append(self)
+
+    async def mock_llm(*args, **kwargs):
+        return "reply"
+
+    async def mock_summarize(messages, previous_summary=None):
+        return "summary"
+
+    monkeypatch.setattr(metrics, "_SpanList", RecordedSpans)
+    monkeypatch.setattr(message_service, "call_llm", mock_llm)
+    monkeypatch.setattr(message_service, "summarize_messages", mock_summarize)
+    conv = client.post(
+        "/conversations", json={"user_email": "spans@example.com", "mode": "open"}
+    ).json()
+    # enough turns for a request to start the background workers
+    for i in range(7):
+        client.post(
+            f"/conversations/{conv['id']}/messages",
+            data={"content": f"message {i}"},
+            headers={"X-User-Email": "spans@example.com"}
+        )
+    client.portal.call(background_queue.join)
+    sizes = [len(spans) for spans in requests]
+
+    async def job():
+        with metrics.span("summarize"):
+            pass
+
+    async def run_jobs():
+        for _ in range(5):
+            background_queue.submit(job)
+        await background_queue.join()
+
+    client.portal.call(run_jobs)
+    assert background_queue.depth() == 0
+    assert [len(spans) for spans in requests] == sizes
@@ -0,0 +1,79 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services import llm_service, model_router as router_module
+from app.services.llm_providers import FakeProvider, LLMProvider
+from app.services.model_router import FAST, PRIMARY, ModelRouter, Tier
+
+
+class FailingProvider(LLMProvider):
+    async def complete(self, messages, model, temperature, max_tokens):
+        raise RuntimeError("primary down")
+
+
+def _router(primary=None, fast=None):
+    return ModelRouter([
+        Tier(PRIMARY, "big-model", 512, provider=primary),
+        Tier(FAST, "small-model", 256, provider=fast),
+    ], enabled=True)
+
+
+def test_router_picks_tier_from_task_size_and_mode():
+    router = _router()
+    assert router.choose("summary", prompt_tokens=5000).name == FAST
+    assert router.choose("chat", prompt_tokens=30, mode="open").name == FAST
+    assert router.choose("chat", prompt_tokens=30, mode="rag").name == PRIMARY
+    assert router.choose("chat", prompt_tokens=5000, mode="open").name == PRIMARY
+
+
+def test_slow_primary_fails_over_to_fast_tier(monkeypatch):
+    monkeypatch.setattr(router_module, "ROUTER_MIN_SAMPLES", 3)
+    monkeypatch.setattr(router_module, "ROUTER_PRIMARY_P95", 0.02)
+    router = _router(primary=FakeProvider(latency=0.05, reply="big"), fast=FakeProvider(latency=0, reply="small"))
+    monkeypatch.setattr(llm_service, "model_router", router)
+
+    convo = SimpleNamespace(id=None, summary=None, mode="open")
+    long_question = "explain " * 200
+
+    async def scenario():
+        return [await llm_service.call_llm(convo, [], long_question, cache=False) for _ in range(5)]
+
+    replies = asyncio.run(scenario())
+    assert replies == ["big", "big", "big", "small", "small"]
+    assert router.tiers[PRIMARY].p95() >= 0.05
+
+
+def test_failed_call_is_retried_on_the_other_tier(monkeypatch):
+    router = _router(primary=FailingProvider(), fast=FakeProvider(latency=0, reply="from fast"))
+    monkeypatch.setattr(llm_service, "model_router", router)
+    convo = SimpleNamespace(id=None, summary=None, mode="rag")
+
+    reply = asyncio.run(llm_service.call_llm(convo, [], "what does the handbook say?", cache=False))
+    assert reply == "from fast"
+    assert router.tiers[PRIMARY].error_rate() == 1.0
+
+
+def test_primary_gets_traffic_back_after_it_recovers(monkeypatch):
+    import time
+
+    monkeypatch.setattr(router_module, "ROUTER_MIN_SAMPLES", 3)
+    monkeypatch.setattr(router_module, "ROUTER_PRIMARY_P95", 0.02)
+    monkeypatch.setattr(router_module, "ROUTER_SAMPLE_TTL", 0.2)
+    monkeypatch.setattr(router_module, "ROUTER_PROBE_EVERY", 4)
+    primary = FakeProvider(latency=0.05, reply="big")
+    router = _router(primary=primary, fast=FakeProvider(latency=0, reply="small"))
+    monkeypatch.setattr(llm_service, "model_router", router)
+
+    convo = SimpleNamespace(id=None, summary=None, mode="rag")
+
+    async def ask(n):
+        return [await llm_service.call_llm(convo, [], "question", cache=False) for _ in range(n)]
+
+    assert asyncio.run(ask(3)) == ["big"] * 3
+    primary.latency = 0  # recovered
+    # while degraded, every fourth diverted request probes the primary
+    assert asyncio.run(ask(4)) == ["small", "small", "small", "big"]
+
+    time.sleep(0.25)  # the slow samples age out
+    assert asyncio.run(ask(5)) == ["big"] * 5
+    assert not router.degraded(PRIMARY)
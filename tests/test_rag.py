@@ -0,0 +1,93 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.models.conversation import Conversation
+from app.models.user import User
+from app.models.document_blob import DocumentBlob
+from app.services.blob_service import load_text
+from app.services.document_service import store_document
+from app.services.embedding_service import HashingEmbedder, clear_index_cache, search_chunks
+from app.services.rag_service import chunk_text, iter_chunks, retrieve_relevant_chunks
+
+
+def _session():
+    clear_index_cache()
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_chunk_text_overlaps():
+    words = " ".join(str(i) for i in range(10))
+    chunks = chunk_text(words, size=4, overlap=1)
+    assert chunks == ["0 1 2 3", "3 4 5 6", "6 7 8 9"]
+
+
+def test_iter_chunks_matches_chunk_text_across_pages():
+    pages = [" ".join(str(i) for i in range(start, start + 7)) for start in range(0, 35, 7)]
+    for size, overlap in [(4, 1), (5, 0), (7, 3), (50, 10)]:
+        assert list(iter_chunks(pages, size, overlap)) == chunk_text("\n".join(pages), size, overlap)
+
+
+def test_retrieve_ranks_matching_chunk_first():
+    db = _session()
+    user = User(email="rag@example.com")
+    db.add(user)
+    db.flush()
+    convo = Conversation(user_id=user.id, mode="rag")
+    db.add(convo)
+    db.commit()
+
+    filler = " ".join(["lorem ipsum dolor"] * 100)
+    text = f"{filler} the kubernetes cluster runs on spot instances {filler}"
+    doc = store_document(db, convo.id, "infra.pdf", text)
+    assert doc.chunk_count > 1
+
+    chunks = retrieve_relevant_chunks(db, [doc.id], "which kubernetes instances do we use?", top_k=1)
+    assert len(chunks) == 1
+    assert "kubernetes" in chunks[0]
+
+
+def test_hashing_embedder_rows_are_unit_length():
+    matrix = HashingEmbedder(dim=64).embed(["hello world", "another text", ""])
+    assert matrix.dtype.name == "float32"
+    assert matrix.shape == (3, 64)
+    norms = (matrix ** 2).sum(axis=1)
+    assert abs(norms[0] - 1) < 1e-5 and abs(norms[1] - 1) < 1e-5 and norms[2] == 0
+
+
+def test_semantic_search_returns_best_chunk():
+    db = _session()
+    user = User(email="vec@example.com")
+    db.add(user)
+    db.flush()
+    convo = Conversation(user_id=user.id, mode="rag")
+    db.add(convo)
+    db.commit()
+
+    filler = " ".join(["quarterly revenue grew"] * 100)
+    text = f"{filler} vacation policy allows twenty paid days {filler}"
+    doc = store_document(db, convo.id, "handbook.pdf", text)
+
+    hits = search_chunks(db, [doc.id], "paid vacation policy", top_k=1)
+    assert len(hits) == 1
+    chunks = retrieve_relevant_chunks(db, [doc.id], "paid vacation policy", top_k=1, mode="semantic")
+    assert "vacation policy" in chunks[0]
+
+
+def test_document_body_is_stored_compressed():
+    db = _session()
+    user = User(email="blob@example.com")
+    db.add(user)
+    db.flush()
+    convo = Conversation(user_id=user.id, mode="rag")
+    db.add(convo)
+    db.commit()
+
+    text = " ".join(["the same handbook paragraph"] * 500)
+    doc = store_document(db, convo.id, "handbook.pdf", text)
+
+    blob = db.get(DocumentBlob, doc.id)
+    assert blob.size == len(text) and len(blob.data) < len(text) // 10
+    assert load_text(db, doc.id) == text